@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for assembling an uploaded chunk from the nginx preupload temp file.
+
+Compares the former path (read the whole chunk into memory and write it out) against
+server.utils.write_file_at_offset, which copies kernel-side. Every variant runs in its
+own process, so the reported peak RSS belongs to that variant only.
+
+Usage: python benchmarks/bench_chunk_assembly.py [chunk size in MB] [repetitions]
+"""
+import os, sys, time, tempfile, resource
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def read_and_write(dest_file, src_file, offset):
+    with open(dest_file, "ab") as output_file, open(src_file, "rb") as input_file:
+        output_file.write(input_file.read())
+
+
+def zero_copy(dest_file, src_file, offset):
+    from server.utils import write_file_at_offset
+    write_file_at_offset(dest_file, src_file, offset)
+
+
+def run(variant, src_file, tmp_dir, repetitions, queue):
+    chunk_size = os.path.getsize(src_file)
+    start = time.perf_counter()
+    for i in range(repetitions):
+        dest_file = os.path.join(tmp_dir, '{}.out'.format(variant.__name__))
+        variant(dest_file, src_file, 0)
+        os.remove(dest_file)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((variant.__name__, chunk_size * repetitions / elapsed / 1024 / 1024, peak_rss))
+
+
+def main():
+    chunk_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_file = os.path.join(tmp_dir, 'chunk')
+        with open(src_file, 'wb') as f:
+            for i in range(chunk_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        ctx = get_context('spawn')
+        print('chunk size: {} MB, repetitions: {}'.format(chunk_mb, repetitions))
+        print('{:<16}{:>16}{:>18}'.format('variant', 'throughput MB/s', 'peak RSS MB'))
+        for variant in (read_and_write, zero_copy):
+            queue = ctx.Queue()
+            process = ctx.Process(target=run, args=(variant, src_file, tmp_dir, repetitions, queue))
+            process.start()
+            name, throughput, peak_rss = queue.get()
+            process.join()
+            print('{:<16}{:>16.1f}{:>18.1f}'.format(name, throughput, peak_rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for small random range reads, as issued by genome browsers like IGV on BAM files.
+
+Compares opening, seeking and reading the file for every request (the former download path)
+against cached file descriptors read in bounded pieces (server.utils.OpenFileCache and iter_file_range).
+
+Usage: python benchmarks/bench_range_reads.py [file size in MB] [amount of reads] [read size in bytes]
+"""
+import os, sys, time, random, tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.utils import OpenFileCache, iter_file_range
+
+
+def open_per_request(path, ranges):
+    for start, end in ranges:
+        with open(path, "rb") as file_object:
+            file_object.seek(start)
+            file_object.read(end - start + 1)
+
+
+def cached_descriptor(path, ranges):
+    cache = OpenFileCache()
+    for start, end in ranges:
+        entry = cache.acquire(path)
+        try:
+            for chunk in iter_file_range(entry.fd, start, end):
+                pass
+        finally:
+            cache.release(entry)
+
+
+def main():
+    file_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    reads = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    read_size = int(sys.argv[3]) if len(sys.argv) > 3 else 16 * 1024
+
+    with tempfile.NamedTemporaryFile() as f:
+        for i in range(file_mb):
+            f.write(os.urandom(1024 * 1024))
+        f.flush()
+        size = file_mb * 1024 * 1024
+
+        random.seed(0)
+        ranges = []
+        for i in range(reads):
+            start = random.randrange(0, size - read_size)
+            ranges.append((start, start + read_size - 1))
+
+        print('file size: {} MB, reads: {}, read size: {} bytes'.format(file_mb, reads, read_size))
+        print('{:<20}{:>12}{:>16}'.format('variant', 'seconds', 'reads/s'))
+        for variant in (open_per_request, cached_descriptor):
+            start = time.perf_counter()
+            variant(f.name, ranges)
+            elapsed = time.perf_counter() - start
+            print('{:<20}{:>12.3f}{:>16.0f}'.format(variant.__name__, elapsed, reads / elapsed))
+
+
+if __name__ == '__main__':
+    main()
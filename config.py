@@ -18,7 +18,13 @@ class Config(object):
     BRAINGINE_ROOT = '/storage/scic/Data/External/braingine'
     ILLUMINA_ROOT = '/storage/scic/illuminanextseq/raw_data'
     ILLUMINA_FASTQ_FOLDER = 'fastq'
+    # seconds between scans of ILLUMINA_ROOT updating the run index (run by celery beat)
+    ILLUMINA_SCAN_INTERVAL = 300
+    # runs with files modified within this amount of seconds are read again on every scan, they may still be written
+    ILLUMINA_SETTLE_TIME = 6 * 3600
     DATA_FOLDER = 'projects'
+    # folder within BRAINGINE_ROOT where the contents of files are stored once per checksum
+    BLOBS_FOLDER = 'blobs'
     # This is the path to the directory in the storage server where files will be uploaded to
     DATA_STORAGE = '/storage/scic/Data/External/braingine/projects'
     SEND_FILE_FROM = DATA_STORAGE
@@ -34,15 +40,86 @@ class Config(object):
     PIPELINES_STORAGE = '/storage/scic/Data/External/braingine/pipelines'
     # plots location
     PLOTS_STORAGE = '/storage/scic/Data/External/braingine/plots'
+    # min. seconds between checks of the pipeline and plot folders for changed definition files
+    CATALOG_CHECK_INTERVAL = 1.0
+
+    # amount of threads probing files on network shares during bulk imports and registration of analysis outputs
+    IMPORT_WORKERS = 16
+    # size of the blocks hashed separately to build file checksums, see utils.combine_block_digests
+    # changing it changes the checksums of all files
+    CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024 # 8MB
+
+    # let nginx send file contents after the API checked access to them, instead of streaming them from the workers
+    # requires an internal location in nginx mapping X_ACCEL_REDIRECT_LOCATION to BRAINGINE_ROOT (see nginx.conf)
+    USE_X_ACCEL_REDIRECT = False
+    X_ACCEL_REDIRECT_LOCATION = '/protected/'
+    # size of the pieces in which file ranges are streamed to clients
+    DOWNLOAD_BUFFER_SIZE = 64 * 1024 # 64KB
 
     # These are the extension that we are accepting to be uploaded
     ALLOWED_EXTENSIONS = set(['txt','bam','bed','fasta','fa', 'fastq', 'fq', 'bz2', 'bz', 'gz'])
     BIOINFO_MAGIC_FILE = './resources/magic/bioinformatics'
     FILE_FORMATS = './resources/magic/file_formats_matching.json'
+    # amount of bytes read to detect the type of analysis outputs without declared format
+    OUTPUT_SNIFF_BYTES = 64 * 1024 # 64KB
+    # share of analysis outputs with declared format whose type gets detected anyway to verify the declaration (0 to 1)
+    OUTPUT_FORMAT_VERIFY_RATE = 0.0
+    # max. amount of compiled magic handles kept per process and detection mode
+    MAGIC_POOL_SIZE = 4
+    # where pipelines and plots run: 'ssh' on the compute hosts, 'local' on the host of the celery worker
+    # (the concurrency of the celery worker limits the amount of commands run at the same time there)
+    EXECUTOR = 'ssh'
+    # seconds after which running commands get stopped, None for no limit
+    EXECUTOR_TIMEOUT = None
+    # hosts the 'ssh' executor spreads commands over, e.g. [{'hostname': '10.0.0.2', 'slots': 8}, ...] with optional
+    # 'username' and 'password', None to run everything on COMPUTING_SERVER_IP
+    COMPUTING_HOSTS = None
+    # amount of commands run at the same time by hosts without 'slots'
+    COMPUTING_HOST_SLOTS = 8
+    # redis instance counting the commands in flight per host over all workers, their slots are freed after
+    # COMPUTING_HOST_LEASE_TIME seconds if a worker dies
+    COMPUTING_HOSTS_REDIS_URL = 'redis://localhost:6379/0'
+    COMPUTING_HOST_LEASE_TIME = 300
+    # seconds the load average of a host is used to pick among hosts with as many free slots, 0 to not sample it
+    COMPUTING_HOST_LOAD_INTERVAL = 0
+    # seconds a host failing to connect is left out of rotation
+    COMPUTING_HOST_RETRY_INTERVAL = 60
+    # max. amount of SSH connections to a compute host kept open per worker process
+    SSH_POOL_SIZE = 4
+    # seconds between keepalive packets on idle SSH connections
+    SSH_KEEPALIVE_INTERVAL = 30
+    # idle SSH connections older than this amount of seconds are closed instead of being reused
+    SSH_MAX_IDLE_TIME = 600
+    SSH_CONNECT_TIMEOUT = 10
+    # pipeline output is appended to log.out/error.out when this amount of bytes is buffered or after LOG_FLUSH_INTERVAL seconds
+    LOG_BATCH_SIZE = 64 * 1024 # 64KB
+    LOG_FLUSH_INTERVAL = 1.0
+    # max. amount of bytes of a log returned per request or event
+    LOG_TAIL_MAX_BYTES = 1024 * 1024 # 1MB
+    # seconds between checks for new output in log streams, and after which a stream gets closed
+    LOG_POLL_INTERVAL = 1.0
+    LOG_STREAM_TIMEOUT = 60
+    # max. amount of task ids resolved per request to /taskstatus/
+    TASK_STATUS_MAX_IDS = 500
+    # redis instance delivering events to the clients of a user, the last EVENTS_HISTORY_SIZE events of a user are kept for EVENTS_HISTORY_TTL seconds
+    EVENTS_REDIS_URL = 'redis://localhost:6379/0'
+    EVENTS_HISTORY_SIZE = 100
+    EVENTS_HISTORY_TTL = 24 * 3600
+    # seconds after which event streams get closed and long-polling requests return
+    EVENTS_STREAM_TIMEOUT = 60
+    EVENTS_LONGPOLL_TIMEOUT = 25
+    EVENTS_HEARTBEAT_INTERVAL = 15
     # celery configuration
     CELERY_RESULT_BACKEND = 'redis://'
     CELERY_BROKER_URL = 'redis://localhost:6379/0'
     CELERY_ACCEPT_CONTENT = ['pickle', 'json', 'msgpack', 'yaml']
+    # periodic tasks, run with "python manage.py celerybeat"
+    CELERYBEAT_SCHEDULE = {
+        'scan-illumina-runs': {
+            'task': 'server.tasks.scan_illumina_runs',
+            'schedule': ILLUMINA_SCAN_INTERVAL,
+        },
+    }
     # LDAP config
     LDAP_SERVER = 'ldap://mpibr.local:3268'
     LDAP_USERNAME = 'ldap_read@MPIBR'
@@ -50,6 +127,10 @@ class Config(object):
     LDAP_BASE_DN = 'OU=MPIBR,DC=mpibr,DC=local'
 
     ITEMS_PER_PAGE = 25
+    # max. amount of names returned by /autocomplete/
+    AUTOCOMPLETE_MAX_RESULTS = 50
+    # max. amount of file ids added to or removed from a collection or databox per request
+    MEMBERSHIP_MAX_IDS = 10000
 
     @staticmethod
     def init_app(app):
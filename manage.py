@@ -51,6 +51,13 @@ def celeryworker(hostname):
     with app.app_context():
         return celery_main(celery_args)
 
+@manager.command
+def celerybeat():
+    """Run the celery scheduler of periodic tasks, only one instance must be running."""
+    celery_args = ['celery', '-A', 'server.tasks', 'beat', '--loglevel=info']
+    with app.app_context():
+        return celery_main(celery_args)
+
 @manager.command
 def deploy():
     """Run deployment tasks."""
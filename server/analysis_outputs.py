@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+    server.analysis_outputs
+    ~~~~~~~~~~~~~~
+    registration of the output files written by an analysis pipeline
+"""
+import os, time, random, mimetypes
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from . import db
+from .models.file import ExperimentFile
+from .models.analysis import AssociationAnalysesOutputFiles
+from .file_formats import get_format_detector
+
+
+def scan_output_files(analysis_folder, analysis_outputs):
+    """
+    Find the files of an analysis folder matching the outputs of its pipeline
+
+    A file matches an output if the output's value equals the file name, the file name without extension or the
+    name of the folder containing the file. Symbolic links to folders are not followed.
+
+    :param str analysis_folder: folder the pipeline wrote its outputs to
+    :param dict analysis_outputs: output values by pipeline fieldname
+    :return: list of tuples with file path, file name and pipeline fieldname
+    """
+    # invert the outputs to look up fieldnames by output value
+    fieldnames = {value: fieldname for fieldname, value in analysis_outputs.items()}
+    output_files = []
+    folders = [analysis_folder]
+    while folders:
+        folder = folders.pop()
+        basename = os.path.basename(os.path.normpath(folder))
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry.path)
+                continue
+            if not entry.is_file():
+                continue
+            for key in (entry.name, os.path.splitext(entry.name)[0], basename):
+                if key in fieldnames:
+                    output_files.append((entry.path, entry.name, fieldnames[key]))
+                    break
+    return output_files
+
+
+def _is_declared(file_format):
+    """
+    Check if a pipeline output declares a single file format, outputs with several or any format get sniffed
+    """
+    return bool(file_format) and file_format not in ('*', 'any') and not any(separator in file_format for separator in ',|')
+
+
+def _probe_output_file(detector, file_path, declared_format, verify, sniff_bytes):
+    """
+    Get size and type of an output file. Runs in a thread (without app context), both are slow on network shares.
+
+    The type of outputs with a declared format is trusted, only the header of other files is read.
+
+    :return: tuple with file size, full file format, mime type, short file format and whether a sampled
+        verification found a different format than the declared one, or None if the file can't be read (e.g. it
+        got removed after the scan)
+    """
+    filename = os.path.basename(file_path)
+    try:
+        file_size = os.stat(file_path).st_size
+        if declared_format is not None and not verify:
+            mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            return file_size, None, mime_type, declared_format, False
+        file_format_full, mime_type = detector.detect_header(file_path, sniff_bytes)
+    except OSError:
+        return None
+    file_format = detector.short_format(file_format_full, filename)
+    mismatch = declared_format is not None and file_format != declared_format
+    return file_size, file_format_full, mime_type, file_format, mismatch
+
+
+def register_analysis_outputs(analysis, analysis_folder, analysis_outputs, output_formats=None):
+    """
+    Create the files for the outputs of an analysis and link them to it.
+
+    The folder is scanned once, files are probed in a thread pool and all rows are written with one INSERT per
+    table. The caller has to commit the session.
+    Files of outputs with a declared format are not sniffed, except for a random OUTPUT_FORMAT_VERIFY_RATE share of
+    them whose sniffed format replaces a wrong declaration.
+
+    :param Analysis analysis: the finished analysis
+    :param str analysis_folder: folder the pipeline wrote its outputs to
+    :param dict analysis_outputs: output values by pipeline fieldname
+    :param dict output_formats: file formats declared by the pipeline by fieldname
+    :return: tuple with the amount of registered files and the seconds spent per phase
+    """
+    timings = OrderedDict()
+
+    started = time.time()
+    output_files = scan_output_files(analysis_folder, analysis_outputs)
+    timings['scan'] = time.time() - started
+
+    started = time.time()
+    detector = get_format_detector()
+    declared_formats = {fieldname: file_format.strip().lower() for fieldname, file_format in (output_formats or {}).items() \
+                            if file_format and _is_declared(file_format.strip().lower())}
+    verify_rate = current_app.config.get('OUTPUT_FORMAT_VERIFY_RATE')
+    sniff_bytes = current_app.config.get('OUTPUT_SNIFF_BYTES')
+    probe_args = [(file_path, declared_formats.get(fieldname), random.random() < verify_rate) for file_path, filename, fieldname in output_files]
+    max_workers = current_app.config.get('IMPORT_WORKERS')
+    if any(declared_format is None or verify for file_path, declared_format, verify in probe_args):
+        # every sniffing thread needs a magic handle, more threads than pooled handles would compile throwaway ones
+        max_workers = min(max_workers, current_app.config.get('MAGIC_POOL_SIZE'))
+    rows = []
+    registered_files = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        probes = pool.map(lambda args: _probe_output_file(detector, args[0], args[1], args[2], sniff_bytes), probe_args)
+        for (file_path, filename, fieldname), probe in zip(output_files, probes):
+            if probe is None:
+                # the other outputs get registered anyway
+                current_app.logger.warning("Output {} of analysis {} can't be read, it is not registered".format(file_path, analysis.id))
+                continue
+            file_size, file_format_full, mime_type, file_format, mismatch = probe
+            registered_files.append((file_path, filename, fieldname))
+            if mismatch:
+                current_app.logger.warning("Output {} of analysis {} declared as {} but detected as {}".format(file_path, analysis.id, declared_formats[fieldname], file_format))
+            rows.append(dict(user_id=analysis.user_id, size_in_bytes=file_size, name=filename, display_name=filename, path=file_path, parent=None,
+                            mime_type=mime_type, file_format_full=file_format_full, file_format=file_format, format_state='SUCCESS', is_upload=False))
+    timings['probe'] = time.time() - started
+
+    started = time.time()
+    if rows:
+        files_table = ExperimentFile.__table__
+        file_ids = [row[0] for row in db.session.execute(files_table.insert().values(rows).returning(files_table.c.id))]
+        association_rows = [dict(analysis_id=analysis.id, file_id=file_id, pipeline_fieldname=fieldname) \
+                                for file_id, (file_path, filename, fieldname) in zip(file_ids, registered_files)]
+        db.session.execute(AssociationAnalysesOutputFiles.__table__.insert().values(association_rows))
+    timings['insert'] = time.time() - started
+
+    return len(rows), timings
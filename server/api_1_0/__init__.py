@@ -5,13 +5,21 @@ from flask.ext.restful import Api
 api_blueprint = Blueprint('api', __name__)
 api = Api(api_blueprint)
 
-from . import collections, analyses, pipelines, visualizations, plots, tasks, storage_files, users, files, auth, illumina_files, databox
+from . import collections, analyses, pipelines, visualizations, plots, tasks, storage_files, users, files, auth, illumina_files, databox, uploads, blobs, events, search
 
 # API Endpoints
 
 # general files resource
 api.add_resource(files.FileListController, '/files/')
 api.add_resource(files.FileController, '/files/<int:file_id>')
+# chunked upload sessions
+api.add_resource(uploads.UploadSessionListController, '/upload_sessions/')
+api.add_resource(uploads.UploadSessionController, '/upload_sessions/<int:upload_id>')
+# stored file contents, to skip uploading already existing files
+api.add_resource(blobs.BlobController, '/blobs/<checksum>')
+api.add_resource(blobs.BlobFileListController, '/blobs/<checksum>/files/')
+# names of files or collections starting with the typed text
+api.add_resource(search.AutocompleteController, '/autocomplete/')
 # collection
 api.add_resource(collections.CollectionListController, '/collections/')
 api.add_resource(collections.CollectionController, '/collections/<int:collection_id>')
@@ -23,6 +31,9 @@ api.add_resource(analyses.AnalysisListController, '/analyses/')
 api.add_resource(analyses.AnalysisController, '/analyses/<int:analysis_id>')
 api.add_resource(analyses.AnalysisInputFileListController, '/analyses/<int:analysis_id>/input_files/')
 api.add_resource(analyses.AnalysisOutputFileListController, '/analyses/<int:analysis_id>/output_files/')
+# output of the analysis pipeline, read incrementally
+api.add_resource(analyses.AnalysisLogController, '/analyses/<int:analysis_id>/log')
+api.add_resource(analyses.AnalysisLogStreamController, '/analyses/<int:analysis_id>/log/stream')
 # pipeline
 api.add_resource(pipelines.PipelineListController, '/pipelines/')
 api.add_resource(pipelines.PipelineController, '/pipelines/<pipeline_uid>')
@@ -33,7 +44,10 @@ api.add_resource(visualizations.VisualizationController, '/visualizations/<int:v
 api.add_resource(plots.PlotListController, '/plots/')
 api.add_resource(plots.PlotController, '/plots/<plot_uid>')
 # task status
+api.add_resource(tasks.TaskStatusListController, '/taskstatus/')
 api.add_resource(tasks.TaskStatusController, '/taskstatus/<task_id>')
+# notifications about analyses and visualizations of the current user
+api.add_resource(events.EventListController, '/events/')
 # storage files from preuploads folder
 api.add_resource(storage_files.StorageFileListController, '/storage_files/')
 # illumina folders and files
@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import urllib.request, urllib.parse, urllib.error, os, werkzeug, magic, json
-from flask import abort, make_response, current_app, request, g
+import urllib.request, urllib.parse, urllib.error, os, werkzeug, magic, json, time
+from flask import abort, make_response, current_app, request, g, Response, stream_with_context
 from flask.ext.restful import Resource, reqparse
 from .auth import auth
 # Import db instance
@@ -13,11 +13,15 @@ from ..models.collection import Collection
 from ..models.file import ExperimentFile, ExperimentFileSchema
 from ..models.analysis import Analysis, AnalysisSchema, AnalysisParameter, AssociationAnalysesInputFiles, AssociationAnalysesOutputFiles
 from ..models.pipeline import Pipeline, PipelineSchema, PipelineInput, PipelineOutput
-from ..utils import sha256checksum, create_folder
+from ..utils import create_folder, read_file_tail
+from ..catalog import get_pipeline_catalog, PreparedDefinition
+from .api_utils import create_pagination_header, create_filter, create_sorting
 # http://stackoverflow.com/a/30399108
 from . import api, tasks
 # celery task
 from ..tasks import run_analysis
+from celery.utils import uuid
+from ..events import publish_event
 # webargs for request parsing instead of flask restful's reqparse
 from webargs import fields
 from webargs.flaskparser import use_args
@@ -30,34 +34,41 @@ experiment_file_schema = ExperimentFileSchema()
 class AnalysisListController(Resource):
     decorators = [auth.login_required]
 
-    def get(self):
-        experiment_analyses = Analysis.query.filter_by(user_id=g.user.id).all()
-        result = analysis_schema.dump(experiment_analyses, many=True).data
-        return result, 200
-
-    def get_pipeline_checksum(self, pipeline_uid):
-        return sha256checksum(self.get_pipeline_definition_file(pipeline_uid))
-
-    def get_pipeline_definition_file(self, pipeline_uid):
+    @use_args({
+        'page': fields.Int(location='query', missing=1),
+        'per_page': fields.Int(location='query', missing=None),
+        'where': fields.Str(location='query', missing=None),
+        'sort_by': fields.Str(location='query', missing=None),
+        'order': fields.Str(location='query', missing=None),
+    })
+    def get(self, args):
+        page = args['page']
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        analyses_query = Analysis.query_with_relationships().filter_by(user_id=g.user.id)
+        if args['where']:
+            analyses_query = create_filter(analyses_query, Analysis, args['where'])
+        analyses_query = create_sorting(analyses_query, Analysis, args['sort_by'], args['order'], default_sort_by='created_at')
+        pagination = analyses_query.paginate(page, per_page, False)
+        # pagination headers
+        link_header = create_pagination_header(self, pagination, page, per_page=per_page, where=args['where'], sort_by=args['sort_by'], order=args['order'])
+
+        result = analysis_schema.dump(pagination.items, many=True).data
+        return result, 200, link_header
+
+    def prepare_pipeline(self, catalog_entry):
         """
-        Build filename for given pipeline
+        Get the DB entry for the version of a pipeline definition in the catalog, creating it if needed
         """
-        pipeine_definition_file_path = os.path.join(current_app.config.get('PIPELINES_STORAGE'), pipeline_uid, '{}.json'.format(pipeline_uid))
-        return pipeine_definition_file_path
+        pipeline_definition = pipeline_schema.load(catalog_entry.definition).data
+        pipeline = Pipeline.query.filter_by(uid=pipeline_definition['uid'], checksum=catalog_entry.checksum).first()
+        if pipeline is None:
+            pipeline = self.store_pipeline(pipeline_definition, catalog_entry.checksum)
 
-    def load_pipeline_definition(self, pipeline_uid):
-        """
-        Serializes fields from a JSON pipeline definition file into a dictionary
-        """
-        with open(self.get_pipeline_definition_file(pipeline_uid)) as pipeline_definition_file:
-            pipeline_definition = json.load(pipeline_definition_file)
-            pipeline_definition_dict = pipeline_schema.load(pipeline_definition).data
-        return pipeline_definition_dict
-
-    def store_pipeline(self, pipeline_uid):
-        # serialize pipeline definition file
-        pipeline_definition = self.load_pipeline_definition(pipeline_uid)
-        print(pipeline_definition)
+        input_files = [pi.name for pi in pipeline.inputs if pi.type == "file"]
+        outputs = {po.name.strip(os.sep): po.value for po in pipeline.outputs}
+        return PreparedDefinition(id=pipeline.id, uid=pipeline.uid, filename=pipeline.filename, executor=pipeline.executor, command=pipeline.command, input_files=input_files, outputs=outputs)
+
+    def store_pipeline(self, pipeline_definition, pipeline_checksum):
         # get needed pipeline fields
         pipeline_uid = pipeline_definition['uid']
         pipeline_filename = pipeline_definition['filename']
@@ -68,8 +79,6 @@ class AnalysisListController(Resource):
         pipeline_inputs = pipeline_definition['inputs']
         pipeline_outputs = pipeline_definition['outputs']
 
-        pipeline_checksum = self.get_pipeline_checksum(pipeline_uid)
-
         # create pipeline object
         pipeline = Pipeline(uid=pipeline_uid, filename=pipeline_filename, name=pipeline_name, description=pipeline_description, executor=pipeline_executor, command=pipeline_command, checksum=pipeline_checksum)
 
@@ -85,43 +94,14 @@ class AnalysisListController(Resource):
 
         return pipeline
 
-    def update_pipeline(self, pipeline_object):
-        """
-        Updates a pipeline object retrieved from DB with new attribute values
-        """
-        pipeline_id = pipeline_object.uid
-        # load pipeline definition json
-        pipeline_definition_dict = self.load_pipeline_definition(pipeline_id)
-
-        pipeline_checksum = self.get_pipeline_checksum(pipeline_id)
-
-        # remove and add attributes needed to update DB entry
-        del pipeline_definition_dict['inputs']
-        del pipeline_definition_dict['outputs']
-        pipeline_definition_dict.update(dict(checksum=pipeline_checksum))
-
-        # iterate and update each attribute
-        for key, value in pipeline_definition_dict.items():
-            if value is not None:
-                # check if pipeline object has the current attribute and update it
-                # we want to avoid definition files injecting new non-existent object attributes
-                current_attr = getattr(pipeline_object, key, None)
-                if current_attr is not None:
-                    setattr(pipeline_object, key, value)
-
-        db.session.commit()
-
     @use_args(analysis_schema)
     def post(self, args):
-        from string import Template
-
         user = g.user
         pipeline_uid = args['pipeline_uid']
-        # get pipeline from DB
-        pipeline = Pipeline.query.filter_by(uid=pipeline_uid).first()
-        # if pipeline not available in DB or checksum of definition file changed, create new DB entry
-        if pipeline is None or (pipeline.checksum != self.get_pipeline_checksum(pipeline_uid)):
-            pipeline = self.store_pipeline(pipeline_uid)
+        # get pipeline prepared for the current version of its definition file, which gets stored in DB if it's new
+        pipeline = get_pipeline_catalog().get_prepared(pipeline_uid, self.prepare_pipeline)
+        if pipeline is None:
+            abort(404, "Could not find pipeline file {}.json".format(pipeline_uid))
 
         # =====
         # GET PIPELINE PARAMETERS
@@ -130,13 +110,8 @@ class AnalysisListController(Resource):
         # merge parameter dictionaries (key-value pairs) into one single dictionary, in order to work on Template.substitute
         input_parameters = {d['name']: d['value'] for d in args['parameters']}
 
-        pipeline_input_files = {}
-        for pi in pipeline.inputs:
-            if pi.type == "file":
-                pipeline_input_files[pi.name] = ""
-        pipeline_output_files = {}
-        for po in pipeline.outputs:
-            pipeline_output_files[po.name.strip(os.sep)] = po.value
+        pipeline_input_files = {name: "" for name in pipeline.input_files}
+        pipeline_output_files = dict(pipeline.outputs)
 
         # =====
         # CREATE DB ENTRIES FOR NEW ANALYSIS
@@ -144,6 +119,8 @@ class AnalysisListController(Resource):
 
         # create analysis entity
         experiment_analysis = Analysis(user_id=user.id, pipeline_id=pipeline.id, pipeline_uid=pipeline_uid)
+        # the task id is stored before sending the task, so task states can always be linked to the analysis
+        experiment_analysis.task_id = uuid()
         # add analysis to DB
         db.session.add(experiment_analysis)
         # flush to let DB create id primary key for experiment_analysis
@@ -193,8 +170,7 @@ class AnalysisListController(Resource):
         analysis_folder = os.path.join(experiment_folder, current_app.config.get('ANALYSES_FOLDER'), str(experiment_analysis.id))
 
         # write params into command template
-        pipeline_command = Template(pipeline.command)
-        pipeline_command_parameters = pipeline_command.substitute(input_parameters, **pipeline_output_files)
+        pipeline_command_parameters = pipeline.command.substitute(input_parameters, **pipeline_output_files)
 
         pipeline_file_path = os.path.join(current_app.config.get('PIPELINES_STORAGE'), pipeline.uid, pipeline.filename)
         final_pipeline_command = '{} {} {}'.format(pipeline.executor, pipeline_file_path, pipeline_command_parameters)
@@ -203,7 +179,8 @@ class AnalysisListController(Resource):
         remote_command = 'cd {}; {}'.format(analysis_folder, final_pipeline_command)
 
         # send task to celery and store it in a variable for returning task id in location header
-        task = run_analysis.delay(remote_command, pipeline_id=pipeline.id, analysis_id=experiment_analysis.id, analysis_outputs=pipeline_output_files)
+        task = run_analysis.apply_async(args=[remote_command], kwargs=dict(pipeline_id=pipeline.id, analysis_id=experiment_analysis.id, analysis_outputs=pipeline_output_files), task_id=experiment_analysis.task_id)
+        publish_event(user.id, 'analysis', {'analysis_id': experiment_analysis.id, 'task_id': task.id, 'state': experiment_analysis.state})
 
         # =====
         # RETURN CREATED ANALYSIS INSTANCE AND TASK STATUS URL
@@ -306,3 +283,81 @@ class AnalysisOutputFileListController(Resource):
         result = experiment_file_schema.dump(files, many=True).data
 
         return result, 200
+
+
+def get_analysis_log_file(analysis_id, stream):
+    """
+    Get the path of a log file written while the pipeline of an analysis of the current user runs
+    """
+    experiment_analysis = Analysis.query.get(analysis_id)
+    if experiment_analysis is None or experiment_analysis.user_id != g.user.id:
+        abort(404, "Analysis {} doesn't exist".format(analysis_id))
+    log_filename = 'error.out' if stream == 'stderr' else 'log.out'
+    analysis_folder = os.path.join(current_app.config.get('DATA_STORAGE'), g.user.username, current_app.config.get('ANALYSES_FOLDER'), str(analysis_id))
+    return experiment_analysis, os.path.join(analysis_folder, log_filename)
+
+
+class AnalysisLogController(Resource):
+    decorators = [auth.login_required]
+
+    @use_args({
+        # byte offset to continue reading from, as returned by the previous request
+        'offset': fields.Int(location='query', missing=0, validate=lambda offset: offset >= 0),
+        'stream': fields.Str(location='query', missing='stdout', validate=lambda stream: stream in ('stdout', 'stderr')),
+    })
+    def get(self, args, analysis_id):
+        experiment_analysis, log_file = get_analysis_log_file(analysis_id, args['stream'])
+        data, next_offset = read_file_tail(log_file, args['offset'], current_app.config.get('LOG_TAIL_MAX_BYTES'))
+        result = {
+            'offset': args['offset'],
+            'next_offset': next_offset,
+            'content': data.decode('utf-8', 'replace'),
+            'state': experiment_analysis.state,
+        }
+        return result, 200
+
+
+class AnalysisLogStreamController(Resource):
+    """
+    Server-Sent Events stream of the output of a running analysis. The id of each event is the byte offset to
+    continue from, so reconnecting clients resume where they stopped through the Last-Event-ID header.
+    """
+    decorators = [auth.login_required]
+
+    @use_args({
+        'offset': fields.Int(location='query', missing=None, validate=lambda offset: offset >= 0),
+        'last_event_id': fields.Int(location='headers', load_from='Last-Event-ID', missing=None),
+        'stream': fields.Str(location='query', missing='stdout', validate=lambda stream: stream in ('stdout', 'stderr')),
+    })
+    def get(self, args, analysis_id):
+        experiment_analysis, log_file = get_analysis_log_file(analysis_id, args['stream'])
+        offset = args['last_event_id'] if args['last_event_id'] is not None else (args['offset'] or 0)
+        max_bytes = current_app.config.get('LOG_TAIL_MAX_BYTES')
+        poll_interval = current_app.config.get('LOG_POLL_INTERVAL')
+        # streams get closed after a while to free the worker, clients reconnect with Last-Event-ID
+        closes_at = time.time() + current_app.config.get('LOG_STREAM_TIMEOUT')
+
+        def is_running():
+            state = db.session.query(Analysis.state).filter_by(id=analysis_id).scalar()
+            # don't keep a transaction open between polls
+            db.session.commit()
+            return state == 'PENDING'
+
+        def generate(offset):
+            yield "retry: {}\n\n".format(int(poll_interval * 1000))
+            while True:
+                data, next_offset = read_file_tail(log_file, offset, max_bytes)
+                if data:
+                    lines = data.decode('utf-8', 'replace').rstrip('\n').split('\n')
+                    yield "id: {}\nevent: log\n{}\n\n".format(next_offset, "\n".join("data: {}".format(line) for line in lines))
+                    offset = next_offset
+                    continue
+                if not is_running():
+                    yield "id: {}\nevent: end\ndata: \n\n".format(offset)
+                    return
+                if time.time() > closes_at:
+                    return
+                time.sleep(poll_interval)
+
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(stream_with_context(generate(offset)), mimetype='text/event-stream', headers=headers)
@@ -1,9 +1,19 @@
-import os, magic
-from flask import current_app
+import os, re, uuid, json, base64, binascii, itertools
+from dateutil import parser as date_parser
+from urllib.parse import quote
+from flask import abort, current_app, request, send_from_directory, Response
 from ..models.file import ExperimentFile
+from ..models.upload import UploadSession, UploadBlock
+from ..utils import escape_like, parse_range_header, iter_file_range, OpenFileCache, merge_byte_range, byte_ranges_cover, byte_range_received, file_blocks, block_byte_range, hash_file_blocks, combine_block_digests
 from .. import db
+from sqlalchemy import tuple_, literal, and_, or_
+from ..tasks import compute_file_checksum, detect_file_format
+from ..blob_store import deduplicate_file
 from . import api
 
+# file descriptors of recently downloaded files, shared by all requests of a worker process
+open_file_cache = OpenFileCache()
+
 
 def init_user(self, username, fullname, email, primary_group_id):
     """
@@ -61,6 +71,136 @@ def create_pagination_header(self, paginated_resource, page, **args):
     return {'Link': ",".join(link_header)}
 
 
+def encode_cursor(values):
+    """
+    Encode the sort key of the last item of a page into an opaque cursor for the next page
+    """
+    data = json.dumps(values, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort_column, id_column):
+    """
+    Decode a cursor created by encode_cursor into the sort value and id of the last item of the previous page.
+    Both are checked against the types of their columns, so forged or stale cursors are rejected before reaching the
+    database. The sort value is None if the last item had none.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(values, list) or len(values) != 2 or values[1] is None:
+            raise ValueError("Not a sort value and id")
+        last_value, last_id = values
+        if last_value is not None:
+            last_value = _coerce_value(sort_column, last_value)
+        return last_value, _coerce_value(id_column, last_id)
+    except (ValueError, UnicodeError, binascii.Error):
+        abort(400, "Invalid cursor")
+
+
+def get_cursor_column(resource_model, sort_by, allowed_columns):
+    """
+    Get the column a cursor paginated listing is sorted by. Only columns backed by an index on (column, id) are
+    allowed, other orders would need a scan of all rows per page.
+    """
+    if sort_by not in allowed_columns:
+        abort(400, "Cursor pagination can only be sorted by {}".format(', '.join(allowed_columns)))
+    return getattr(resource_model, sort_by)
+
+
+def paginate_by_cursor(resource_query, sort_column, id_column, cursor, per_page, descending=True):
+    """
+    Get a page of a query by its keyset: the rows following the sort value and id encoded in the cursor, in order of
+    (sort_column, id_column). Unlike OFFSET pages, the index on both columns is used to jump straight to the page,
+    whatever its position. Rows without sort value come last in ascending and first in descending order, like in
+    the index.
+
+    :param sqlalchemy.orm.query.Query resource_query: a SQLALchemy query object of a resource
+    :param str cursor: cursor returned with the previous page, empty for the first page
+    :return: tuple with the items of the page and the cursor of the next page (None for the last page)
+    """
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort_column, id_column)
+        if last_value is None:
+            # the rest of the rows without sort value, then (descending) the ones having one
+            following_ids = id_column < last_id if descending else id_column > last_id
+            condition = and_(sort_column.is_(None), following_ids)
+            if descending:
+                condition = or_(condition, sort_column.isnot(None))
+        else:
+            sort_key = tuple_(sort_column, id_column)
+            last_key = tuple_(literal(last_value, sort_column.type), literal(last_id, id_column.type))
+            condition = sort_key < last_key if descending else or_(sort_key > last_key, sort_column.is_(None))
+        resource_query = resource_query.filter(condition)
+    if descending:
+        resource_query = resource_query.order_by(None).order_by(sort_column.desc(), id_column.desc())
+    else:
+        resource_query = resource_query.order_by(None).order_by(sort_column.asc(), id_column.asc())
+    # one more row tells if there is a next page
+    items = resource_query.limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    try:
+        next_cursor = encode_cursor([getattr(items[-1], sort_column.key), getattr(items[-1], id_column.key)])
+    except AttributeError:
+        abort(400, "Projections of cursor paginated listings have to include id and {}".format(sort_column.key))
+    return items, next_cursor
+
+
+def count_query(resource_query, mode):
+    """
+    Count the rows of a query: 'exact' counts them all, 'estimate' takes the row estimate of the query planner which
+    takes no scan, None or 'none' skips counting.
+
+    :return: the amount of rows, or None if not counted
+    """
+    if mode is None or mode == 'none':
+        return None
+    resource_query = resource_query.order_by(None)
+    if mode == 'exact':
+        return resource_query.count()
+    if mode == 'estimate':
+        statement = resource_query.statement.compile(dialect=db.engine.dialect)
+        # run through the DBAPI, the compiled statement has its parameters in the driver's format
+        plan = db.session.connection().execute('EXPLAIN (FORMAT JSON) ' + str(statement), statement.params).scalar()
+        return int(plan[0]['Plan']['Plan Rows'])
+    abort(400, "Count has to be one of exact, estimate or none")
+
+
+def create_cursor_header(self, next_cursor, total=None, **args):
+    """
+    Creates a Link item in the HTTP response header with the first and next page of a cursor paginated listing, and
+    an X-Total-Count item if the listing got counted
+
+    :param str next_cursor: cursor of the next page, None on the last page
+    :param int total: amount of items of the listing
+    """
+    link_header = []
+    page_first_url = api.url_for(self, cursor='', **args, _external=True)
+    link_header.append("<{}>; rel=\"first\"".format(page_first_url))
+    if next_cursor is not None:
+        page_next_url = api.url_for(self, cursor=next_cursor, **args, _external=True)
+        link_header.append("<{}>; rel=\"next\"".format(page_next_url))
+    headers = {'Link': ",".join(link_header)}
+    if total is not None:
+        headers['X-Total-Count'] = str(total)
+    return headers
+
+
+def not_modified_response(etag):
+    """
+    Create a 304 Not Modified response if the client already holds the representation with the given entity tag
+
+    :param str etag: entity tag of the current representation
+    :return: the response, or None if the representation has to be sent
+    """
+    if etag not in request.if_none_match:
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
 def create_projection(resource_query, projection_args):
     """
     Creates a projection out of a query. Projections are conditional queries where the client dictates which fields should be returned by the API.
@@ -84,22 +224,367 @@ def create_projection(resource_query, projection_args):
     return resource_query
 
 
-def store_file_upload(filename, user):
-    file_path = os.path.join(current_app.config.get('BRAINGINE_ROOT'), current_app.config.get('DATA_FOLDER'), user.username, current_app.config.get('UPLOADS_FOLDER'), filename)
-    # initialize file handle for magic file type detection
-    fh_magic = magic.Magic(magic_file=current_app.config.get('BIOINFO_MAGIC_FILE'), uncompress=True)
-    # get bioinformatic file type using magic
-    file_format_full = fh_magic.from_file(file_path)
-    # get mimetype of file using magic
-    mimetype = magic.from_file(file_path, mime=True)
-    # get file size
+def _coerce_value(column, value):
+    """
+    Check a JSON value against the type of a column, so wrong values are rejected instead of failing in the database.
+    Dates and times are given as ISO 8601 strings.
+
+    :return: the value to compare the column with
+    :raises ValueError: if the value doesn't fit the column
+    """
+    column_type = column.type
+    if isinstance(column_type, db.Boolean):
+        valid = isinstance(value, bool)
+    elif isinstance(column_type, db.Integer):
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    elif isinstance(column_type, db.Numeric):
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif isinstance(column_type, (db.DateTime, db.Date)):
+        valid = isinstance(value, str) and re.match(r'\d{4}-\d{2}-\d{2}', value) is not None
+        if valid:
+            try:
+                value = date_parser.parse(value)
+            except (ValueError, OverflowError):
+                valid = False
+    elif isinstance(column_type, db.String):
+        valid = isinstance(value, str)
+    else:
+        valid = False
+    if not valid:
+        raise ValueError("Invalid value {} for {}".format(json.dumps(value), column.key))
+    return value
+
+
+def _filter_value(column, value):
+    """
+    Check a value of a where argument against the type of its column, see _coerce_value
+    """
+    try:
+        return _coerce_value(column, value)
+    except ValueError as e:
+        abort(400, str(e))
+
+
+def _filter_condition(column, operator, value):
+    """
+    Compile a single operator of a where argument into a SQLAlchemy expression
+    """
+    if operator == '$in':
+        if not isinstance(value, list) or not value:
+            abort(400, "$in of {} needs a non-empty list of values".format(column.key))
+        return column.in_([_filter_value(column, item) for item in value])
+    if operator in ('$gt', '$lt'):
+        value = _filter_value(column, value)
+        return column > value if operator == '$gt' else column < value
+    if operator in ('$prefix', '$contains'):
+        if not isinstance(value, str) or not isinstance(column.type, db.String):
+            abort(400, "{} needs a text value and a text column, {} is not".format(operator, column.key))
+        if operator == '$prefix':
+            return column.like(escape_like(value) + '%', escape='\\')
+        # case insensitive like the q search of list endpoints
+        return column.ilike('%' + escape_like(value) + '%', escape='\\')
+    abort(400, "Unknown operator {}, use $in, $gt, $lt, $prefix or $contains".format(operator))
+
+
+def create_filter(resource_query, resource_model, where):
+    """
+    Filters a query by the conditions of a where argument.
+
+    The argument is a JSON object mapping columns of the model's filter_columns to a value they have to equal, or
+    to an object of operators they have to match, e.g.
+    {"is_upload": true, "file_format": {"$in": ["bam", "sam"]}, "updated_at": {"$gt": "2016-07-01"}, "name": {"$prefix": "sample_"}}
+
+    :param sqlalchemy.orm.query.Query resource_query: a SQLALchemy query object of a resource
+    :param resource_model: the model being queried
+    :param str where: the JSON encoded conditions
+    """
+    try:
+        conditions = json.loads(where)
+    except ValueError:
+        abort(400, "where has to be a JSON object")
+    if not isinstance(conditions, dict):
+        abort(400, "where has to be a JSON object")
+    for name, condition in conditions.items():
+        if name not in resource_model.filter_columns:
+            abort(400, "Filtering by {} is not supported, use one of {}".format(name, ', '.join(resource_model.filter_columns)))
+        column = getattr(resource_model, name)
+        if isinstance(condition, dict):
+            for operator, value in condition.items():
+                resource_query = resource_query.filter(_filter_condition(column, operator, value))
+        elif condition is None:
+            resource_query = resource_query.filter(column.is_(None))
+        elif isinstance(condition, list):
+            abort(400, "Condition of {} has to be a value or an object of operators".format(name))
+        else:
+            resource_query = resource_query.filter(column == _filter_value(column, condition))
+    return resource_query
+
+
+def create_sorting(resource_query, resource_model, sort_by, order, default_sort_by='updated_at'):
+    """
+    Orders a query by a column of the model's sort_columns, with the id as tie-breaker so pages don't overlap
+
+    :param str sort_by: name of the column, default_sort_by if None
+    :param str order: 'asc' or 'desc' (the default)
+    """
+    sort_by = sort_by or default_sort_by
+    if sort_by not in resource_model.sort_columns:
+        abort(400, "Sorting by {} is not supported, use one of {}".format(sort_by, ', '.join(resource_model.sort_columns)))
+    if order not in (None, 'asc', 'desc'):
+        abort(400, "order has to be asc or desc")
+    sort_column = getattr(resource_model, sort_by)
+    resource_query = resource_query.order_by(None)
+    if order == 'asc':
+        return resource_query.order_by(sort_column.asc(), resource_model.id.asc())
+    return resource_query.order_by(sort_column.desc(), resource_model.id.desc())
+
+
+def send_file(file_path, mimetype, attachment=False, range_header=None):
+    """
+    Make a response with the contents of a file.
+
+    With USE_X_ACCEL_REDIRECT, files within BRAINGINE_ROOT are handed over to nginx, which also takes care of range
+    requests. Otherwise, or for files outside of it, the contents are sent from the application.
+
+    :param str file_path: path of the file to send
+    :param str mimetype: content type of the file
+    :param bool attachment: force download
+    :param str range_header: value of the Range header of the request, if any
+    """
+    file_path = os.path.abspath(file_path)
+    if current_app.config.get('USE_X_ACCEL_REDIRECT'):
+        root = os.path.abspath(current_app.config.get('BRAINGINE_ROOT'))
+        if file_path.startswith(root + os.sep):
+            internal_uri = current_app.config.get('X_ACCEL_REDIRECT_LOCATION').rstrip('/') + '/' + quote(os.path.relpath(file_path, root))
+            response = Response(content_type=mimetype or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = internal_uri
+            if attachment:
+                response.headers['Content-Disposition'] = 'attachment; filename="{}"'.format(os.path.basename(file_path))
+            return response
+
+    if range_header:
+        return send_file_ranges(file_path, mimetype, range_header)
+    response = send_from_directory(os.path.dirname(file_path), os.path.basename(file_path), mimetype=mimetype, as_attachment=attachment)
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def send_file_ranges(file_path, mimetype, range_header):
+    """
+    Make a streamed response for a Range request (RFC 7233), with a multipart/byteranges body if several ranges are requested
+
+    :param str file_path: path of the file to send
+    :param str mimetype: content type of the file
+    :param str range_header: value of the Range header of the request
+    """
+    try:
+        entry = open_file_cache.acquire(file_path)
+    except OSError:
+        abort(404, "File {} doesn't exist".format(os.path.basename(file_path)))
+    mimetype = mimetype or 'application/octet-stream'
+    buffer_size = current_app.config.get('DOWNLOAD_BUFFER_SIZE')
+    size = entry.size
+
+    try:
+        ranges = parse_range_header(range_header, size)
+    except ValueError:
+        # malformed ranges get ignored, send the whole file instead
+        ranges = None
+    if ranges == []:
+        open_file_cache.release(entry)
+        return Response(status=416, headers={'Content-Range': 'bytes */{}'.format(size), 'Accept-Ranges': 'bytes'})
+
+    if ranges is None or len(ranges) == 1:
+        start, end = ranges[0] if ranges else (0, size - 1)
+        parts = [(b'', start, end)]
+        headers = {'Accept-Ranges': 'bytes', 'Content-Length': str(end - start + 1)}
+        if ranges:
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        content_type = mimetype
+        closing = b''
+    else:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for index, (start, end) in enumerate(ranges):
+            part_header = '{}--{}\r\nContent-Type: {}\r\nContent-Range: bytes {}-{}/{}\r\n\r\n'.format('\r\n' if index else '', boundary, mimetype, start, end, size)
+            parts.append((part_header.encode('latin-1'), start, end))
+        closing = '\r\n--{}--\r\n'.format(boundary).encode('latin-1')
+        content_length = sum(len(part_header) + end - start + 1 for part_header, start, end in parts) + len(closing)
+        headers = {'Accept-Ranges': 'bytes', 'Content-Length': str(content_length)}
+        content_type = 'multipart/byteranges; boundary={}'.format(boundary)
+
+    def generate():
+        for part_header, start, end in parts:
+            if part_header:
+                yield part_header
+            for chunk in iter_file_range(entry.fd, start, end, buffer_size):
+                yield chunk
+        if closing:
+            yield closing
+
+    status = 206 if ranges else 200
+    response = Response(generate(), status=status, headers=headers, content_type=content_type, direct_passthrough=True)
+    # released once the server closes the response, even if the body never gets iterated (HEAD requests, clients gone early)
+    response.call_on_close(lambda: open_file_cache.release(entry))
+    return response
+
+
+def get_upload_path(filename, user):
+    """
+    Build the path where a file uploaded by the given user is stored
+    """
+    return os.path.join(current_app.config.get('BRAINGINE_ROOT'), current_app.config.get('DATA_FOLDER'), user.username, current_app.config.get('UPLOADS_FOLDER'), filename)
+
+
+def reserve_upload_path(filename, user):
+    """
+    Create an empty file under a name not taken yet in the uploads folder of the user, so existing files never get
+    overwritten. The name gets a number appended before its extensions if needed, e.g. reads_1.fastq.gz
+
+    :return: tuple of the reserved filename and its path
+    """
+    root, dot, extensions = filename.partition('.')
+    for number in itertools.count():
+        name = filename if number == 0 else '{}_{}{}{}'.format(root, number, dot, extensions)
+        path = get_upload_path(name, user)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            continue
+        os.close(fd)
+        return name, path
+
+
+def create_upload_session(filename, size_in_bytes, user):
+    """
+    Start a new chunked upload session and create an empty part file of the final size, so chunks can be written at any offset
+
+    Every session writes to its own part file, which is moved into place once the upload is complete, so retried or
+    concurrent chunks can never truncate a file already uploaded (and maybe shared with other files, see blob_store).
+
+    :param str filename: secure name of the file being uploaded
+    :param int size_in_bytes: total size of the file being uploaded
+    :param User user: the user uploading the file
+    """
+    upload_session = UploadSession(user_id=user.id, filename=filename, path='', size_in_bytes=size_in_bytes)
+    db.session.add(upload_session)
+    db.session.flush()
+    upload_session.path = '{}.{}.part'.format(get_upload_path(filename, user), upload_session.id)
+    fd = os.open(upload_session.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        os.ftruncate(fd, size_in_bytes)
+    finally:
+        os.close(fd)
+    db.session.commit()
+
+    return upload_session
+
+
+def get_upload_session(upload_id, filename, size_in_bytes, user):
+    """
+    Get the upload session a file chunk belongs to.
+
+    Clients which did not create an upload session beforehand get one implicitly, identified by the filename and total size.
+    Those should send their chunks in order, since parallel first chunks could start separate sessions.
+
+    :param int upload_id: id of the upload session sent by the client, or None
+    """
+    if upload_id is not None:
+        upload_session = UploadSession.query.filter_by(id=upload_id, user_id=user.id).first()
+        if not upload_session:
+            abort(404, "Upload session {} doesn't exist".format(upload_id))
+        return upload_session
+
+    upload_session = UploadSession.query.filter_by(user_id=user.id, filename=filename, size_in_bytes=size_in_bytes, state='PENDING').first()
+    if upload_session is None:
+        upload_session = create_upload_session(filename, size_in_bytes, user)
+    return upload_session
+
+
+def _received_blocks(ranges, start_bytes, end_bytes, block_size, size):
+    """
+    Return the indexes of the blocks overlapping a chunk which lie completely within the given received byte ranges
+    """
+    received_blocks = []
+    for index in file_blocks(start_bytes, end_bytes, block_size):
+        block_start, block_end = block_byte_range(index, block_size, size)
+        if byte_range_received(ranges, block_start, block_end):
+            received_blocks.append(index)
+    return received_blocks
+
+
+def record_upload_chunk(upload_id, start_bytes, end_bytes, user):
+    """
+    Record a written byte range in its upload session and create the file model once the whole file has been received
+
+    The blocks completed by the chunk get hashed while their data is still cached, so the file checksum can be built
+    without reading the file again. Blocks lying completely within the chunk are hashed before locking, the ones at
+    its boundaries once the other received ranges are known.
+
+    The session row stays locked while its range set gets updated, so concurrent chunks of the same upload are recorded
+    one after another and only one of them finalizes the upload.
+
+    :return: the updated upload session
+    """
+    block_size = current_app.config.get('CHECKSUM_BLOCK_SIZE')
+    upload_session = UploadSession.query.get(upload_id)
+    size = upload_session.size_in_bytes
+    chunk_blocks = _received_blocks([[start_bytes, end_bytes]], start_bytes, end_bytes, block_size, size)
+    block_digests = hash_file_blocks(upload_session.path, chunk_blocks, block_size, size)
+
+    upload_session = UploadSession.query.filter_by(id=upload_id).with_for_update().populate_existing().one()
+    if upload_session.state != 'PENDING':
+        db.session.commit()
+        return upload_session
+    upload_session.received_ranges = merge_byte_range(upload_session.received_ranges, start_bytes, end_bytes)
+
+    # hash boundary blocks completed together with previously received chunks
+    overlapping_blocks = list(file_blocks(start_bytes, end_bytes, block_size))
+    hashed_blocks = set(index for (index,) in upload_session.blocks.with_entities(UploadBlock.block_index).filter(UploadBlock.block_index.in_(overlapping_blocks)))
+    boundary_blocks = [index for index in _received_blocks(upload_session.received_ranges, start_bytes, end_bytes, block_size, size) if index not in block_digests and index not in hashed_blocks]
+    block_digests.update(hash_file_blocks(upload_session.path, boundary_blocks, block_size, size))
+    for index, digest in block_digests.items():
+        if index not in hashed_blocks:
+            db.session.add(UploadBlock(upload_id=upload_id, block_index=index, digest=digest))
+
+    if byte_ranges_cover(upload_session.received_ranges, size):
+        db.session.flush()
+        checksum = combine_block_digests([block.digest for block in upload_session.blocks.order_by(UploadBlock.block_index)])
+        upload_session.state = 'SUCCESS'
+        # move the part file into place under a free name
+        filename, file_path = reserve_upload_path(upload_session.filename, user)
+        os.replace(upload_session.path, file_path)
+        upload_session.filename = filename
+        upload_session.path = file_path
+        experimentFile = store_file_upload(filename, user, checksum=checksum)
+        upload_session.file_id = experimentFile.id
+        # block digests are not needed anymore
+        upload_session.blocks.delete()
+
+    db.session.commit()
+    return upload_session
+
+
+def store_file_upload(filename, user, checksum=None):
+    """
+    Create the file model for an uploaded file. Files not hashed while uploading get their checksum computed
+    and get deduplicated in the background.
+    """
+    file_path = get_upload_path(filename, user)
+    # get file size, the file type gets detected in the background
     file_stats = os.stat(file_path)
     file_size = file_stats.st_size
 
-    experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path, mime_type=mimetype, file_format_full=file_format_full, is_upload=True)
+    experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path, mime_type=None, file_format_full=None, is_upload=True, checksum=checksum)
     db.session.add(experimentFile)
+    # store contents only once if the same file was uploaded before
+    deduplicate_file(experimentFile)
     db.session.commit()
 
+    detect_file_format.delay(experimentFile.id)
+    if checksum is None:
+        compute_file_checksum.delay(experimentFile.id)
+
     return experimentFile
 
 
@@ -114,21 +599,18 @@ def store_illumina_file(filename, folder_uid, user):
     except OSError:
         file_path_internal = file_path
 
-    # initialize file handle for magic file type detection
-    fh_magic = magic.Magic(magic_file=current_app.config.get('BIOINFO_MAGIC_FILE'), uncompress=True)
-    # get bioinformatic file type using magic
-    file_format_full = fh_magic.from_file(file_path)
-    # get mimetype of file using magic
-    mimetype = magic.from_file(file_path, mime=True)
-    # get file size
+    # get file size, the file type gets detected in the background
     file_stats = os.stat(file_path)
     file_size = file_stats.st_size
 
-
-    experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path_internal, mime_type=mimetype, file_format_full=file_format_full, is_upload=True)
+    experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path_internal, mime_type=None, file_format_full=None, is_upload=True)
     db.session.add(experimentFile)
     db.session.commit()
 
+    # detect type and hash the file in the background, it can be huge and located on a slow share
+    detect_file_format.delay(experimentFile.id)
+    compute_file_checksum.delay(experimentFile.id)
+
     return experimentFile
 
 
@@ -143,19 +625,16 @@ def store_storage_file(file_path, user):
     except OSError:
         file_path_internal = file_path
 
-    # initialize file handle for magic file type detection
-    fh_magic = magic.Magic(magic_file=current_app.config.get('BIOINFO_MAGIC_FILE'), uncompress=True)
-    # get bioinformatic file type using magic
-    file_format_full = fh_magic.from_file(file_path)
-    # get mimetype of file using magic
-    mimetype = magic.from_file(file_path, mime=True)
-    # get file size
+    # get file size, the file type gets detected in the background
     file_stats = os.stat(file_path)
     file_size = file_stats.st_size
 
-
-    experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path_internal, mime_type=mimetype, file_format_full=file_format_full, is_upload=True)
+    experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path_internal, mime_type=None, file_format_full=None, is_upload=True)
     db.session.add(experimentFile)
     db.session.commit()
 
+    # detect type and hash the file in the background, it can be huge and located on a slow share
+    detect_file_format.delay(experimentFile.id)
+    compute_file_checksum.delay(experimentFile.id)
+
     return experimentFile
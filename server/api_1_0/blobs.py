@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import werkzeug
+from flask import abort, g
+from flask.ext.restful import Resource
+
+from .. import db
+from ..models.blob import Blob, BlobSchema
+from ..models.file import ExperimentFile, ExperimentFileSchema
+from ..blob_store import deduplicate_file, link_file
+from ..utils import silent_remove
+from ..tasks import detect_file_format
+from .auth import auth
+from webargs import fields
+from webargs.flaskparser import use_args
+from .api_utils import reserve_upload_path
+
+blob_schema = BlobSchema()
+experiment_file_schema = ExperimentFileSchema()
+
+
+def get_own_blob(checksum, user):
+    """
+    Get the blob of a checksum if one of the files of the user holds its contents, so a checksum alone doesn't give
+    access to the files of other users
+    """
+    return Blob.query.join(ExperimentFile, ExperimentFile.blob_id == Blob.id) \
+                .filter(Blob.checksum == checksum, ExperimentFile.user_id == user.id) \
+                .first()
+
+
+class BlobController(Resource):
+    decorators = [auth.login_required]
+
+    def get(self, checksum):
+        """
+        Let clients check if the contents of a file are already stored among their files before uploading it
+        """
+        blob = get_own_blob(checksum, g.user)
+        if not blob:
+            abort(404, "No contents stored for checksum {}".format(checksum))
+        result = blob_schema.dump(blob).data
+        return result, 200
+
+
+class BlobFileListController(Resource):
+    decorators = [auth.login_required]
+
+    @use_args({
+        'filename': fields.Str(required=True),
+    })
+    def post(self, args, checksum):
+        """
+        Create an uploaded file out of already stored contents, so the client can skip transferring them
+        """
+        user = g.user
+        blob = get_own_blob(checksum, user)
+        if not blob:
+            abort(404, "No contents stored for checksum {}".format(checksum))
+        # take file type from a file of the user with the same contents
+        same_file = ExperimentFile.query.filter_by(blob_id=blob.id, user_id=user.id).first()
+
+        # Make the filename safe, remove unsupported chars, existing uploads with the same name are kept
+        filename, file_path = reserve_upload_path(werkzeug.secure_filename(args['filename']), user)
+        # fill the reserved file with the contents, so the empty file never gets stored as the contents of the checksum
+        try:
+            link_file(blob.path, file_path)
+        except OSError:
+            silent_remove(file_path)
+            abort(404, "No contents stored for checksum {}".format(checksum))
+
+        experimentFile = ExperimentFile(user_id=user.id, size_in_bytes=blob.size_in_bytes, name=filename, path=file_path, mime_type=same_file.mime_type if same_file else None, file_format_full=same_file.file_format_full if same_file else None, is_upload=True, checksum=checksum)
+        db.session.add(experimentFile)
+        # links the file to the stored contents
+        if deduplicate_file(experimentFile) is None:
+            db.session.rollback()
+            silent_remove(file_path)
+            abort(404, "No contents stored for checksum {}".format(checksum))
+        db.session.commit()
+
+        if experimentFile.format_state == 'PENDING':
+            detect_file_format.delay(experimentFile.id)
+
+        result = experiment_file_schema.dump(experimentFile, many=False).data
+        return result, 201
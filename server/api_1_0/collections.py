@@ -11,12 +11,12 @@ from .. import db
 # IMPORTANT!: this has to be done after the DB gets instantiated and in this case imported too
 from ..models.collection import Collection, CollectionSchema
 from ..models.file import ExperimentFile, ExperimentFileSchema
+from ..search import search_query
+from ..memberships import add_files, remove_files
 from ..utils import sha1_string, sha256checksum, write_file, write_file_in_chunks, create_folder, update_object
-from .api_utils import create_pagination_header, create_projection
+from .api_utils import create_pagination_header, create_filter, create_sorting, create_cursor_header, get_cursor_column, paginate_by_cursor, count_query, create_projection, send_file
 # http://stackoverflow.com/a/30399108
 from . import api
-# allow use of or syntax for sql queries
-from sqlalchemy import or_, text
 # webargs for request parsing instead of flask restful's reqparse
 from webargs import fields
 from webargs.flaskparser import use_args
@@ -41,39 +41,45 @@ class CollectionListController(Resource):
         'page': fields.Int(location='query', missing=1),
         'per_page': fields.Int(location='query', missing=None),
         'sort_by': fields.Str(location='query', missing=None),
-        'order': fields.Str(location='query', missing=None)
+        'order': fields.Str(location='query', missing=None),
+        # opt-in keyset pagination, empty for the first page
+        'cursor': fields.Str(location='query', missing=None),
+        'count': fields.Str(location='query', missing=None)
     })
     def get(self, args):
+        collections_query = Collection.query
+        if args['where']:
+            collections_query = create_filter(collections_query, Collection, args['where'])
         if args['q']:
-            # querystring from url should be decoded here
-            # see https://unspecified.wordpress.com/2008/05/24/uri-encoding/
-            #search_query = urllib.unquote(parsed_args['q']).decode("utf-8")
-            search_query = urllib.parse.unquote(args['q'])
-            # search for collections containing the search query in their "name" or "collectioner" attributes
-            # use "ilike" for searching case unsensitive
-            collections_query = Collection.query.filter(or_(Collection.name.ilike('%'+ search_query + '%'),\
-            Collection.exp_type.ilike('%'+ search_query + '%')))
-        elif args['where']:
-            filters = json.loads(args['where'])
-            collections_query = Collection.query.filter_by(**filters)
-        else:
-            collections_query = Collection.query
+            if args['cursor'] is not None:
+                abort(400, "Search results are ordered by relevance and can't be paginated by cursor")
+            # search for collections with words of their name or description starting with the words of the query,
+            # or with a name containing the query, most relevant first
+            collections_query = search_query(collections_query, Collection.search_vector, [Collection.name], Collection.id, args['q'])
 
         if args['projection']:
             projection = json.loads(args['projection'])
             collections_query = create_projection(collections_query, projection)
         if args['merge']:
             collections_query = collections_query.distinct()
-        if args['sort_by'] and args['order']:
-            sort = "{} {}".format(args['sort_by'], args['order'])
-            collections_query = collections_query.order_by(sort)
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        if args['cursor'] is not None:
+            sort_column = get_cursor_column(Collection, args['sort_by'] or 'updated_at', ('updated_at', 'created_at'))
+            collections, next_cursor = paginate_by_cursor(collections_query, sort_column, Collection.id, args['cursor'], per_page, descending=args['order'] != 'asc')
+            total = count_query(collections_query, args['count'])
+            headers = create_cursor_header(self, next_cursor, total, per_page=per_page, where=args['where'], projection=args['projection'],
+                                           merge=args['merge'] or None, sort_by=args['sort_by'], order=args['order'], count=args['count'])
+            result = collection_schema.dump(collections, many=True).data
+            return result, 200, headers
+        # search results keep their ranking unless another order is requested
+        if not args['q'] or args['sort_by']:
+            collections_query = create_sorting(collections_query, Collection, args['sort_by'], args['order'])
 
         # create pagination
         page = args['page']
-        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
         pagination = collections_query.paginate(page, per_page, False)
         # pagination headers
-        link_header = create_pagination_header(self, pagination, page)
+        link_header = create_pagination_header(self, pagination, page, per_page=per_page, q=args['q'], where=args['where'], sort_by=args['sort_by'], order=args['order'])
 
         # reponse body
         collections = pagination.items
@@ -85,13 +91,11 @@ class CollectionListController(Resource):
     def post(self, args):
 
         collection = Collection(user_id=g.user.id, name=args['name'], description=args['description'])
-        if len(args['files']) > 0:
-            for fileId in args['files']:
-                currentFile = ExperimentFile.query.get(fileId)
-                collection.files.append(currentFile)
 
         try:
             db.session.add(collection)
+            db.session.flush()
+            add_files('collections_to_files', collection.id, g.user.id, args['files'])
             db.session.commit()
         except SQLAlchemyError:
             abort(404, "Error creating collection \"{}\"".format(args['name']))
@@ -127,13 +131,9 @@ class CollectionController(Resource):
         del args['files']
         update_object(collection, args)
 
-        if len(collection_files) > 0:
-            for fileId in collection_files:
-                currentFile = ExperimentFile.query.get(fileId)
-                collection.files.append(currentFile)
-
         try:
             db.session.add(collection)
+            add_files('collections_to_files', collection.id, g.user.id, collection_files)
             db.session.commit()
         except SQLAlchemyError:
             abort(404, "Error updating collection \"{}\"".format(args['name']))
@@ -148,12 +148,26 @@ class CollectionFileListController(Resource):
         'fileIds': fields.List(fields.Int(), missing=[]),
     })
     def post(self, args, collection_id):
-        if len(args['fileIds']) > 0:
-            collection = Collection.query.get(collection_id)
-            for fileId in args['fileIds']:
-                currentFile = ExperimentFile.query.get(fileId)
-                collection.files.append = currentFile
-            return 201, collection.files
+        return self.update_members(add_files, collection_id, args['fileIds'], 'added')
+
+    @use_args({
+        'fileIds': fields.List(fields.Int(), missing=[]),
+    })
+    def delete(self, args, collection_id):
+        return self.update_members(remove_files, collection_id, args['fileIds'], 'removed')
+
+    def update_members(self, update, collection_id, file_ids, action):
+        if len(file_ids) > current_app.config.get('MEMBERSHIP_MAX_IDS'):
+            abort(400, "At most {} files can be {} at once".format(current_app.config.get('MEMBERSHIP_MAX_IDS'), action))
+        collection = Collection.query.get(collection_id)
+        if not collection:
+            abort(404, "Collection {} doesn't exist".format(collection_id))
+        if collection.user_id != g.user.id:
+            abort(403, "Collection {} belongs to another user".format(collection_id))
+        # one statement for all files, files of other users are skipped
+        count = update('collections_to_files', collection.id, g.user.id, file_ids)
+        db.session.commit()
+        return {action: count}, 200
 
     @use_args({
         # access querystring arguments to filter files by is_upload
@@ -163,32 +177,39 @@ class CollectionFileListController(Resource):
         'merge': fields.Bool(location='query', missing=False),
         'sort_by': fields.Str(location='query', missing=None),
         'order': fields.Str(location='query', missing=None),
-        'where': fields.Str(location='query', missing=None)
+        'where': fields.Str(location='query', missing=None),
+        # opt-in keyset pagination, empty for the first page
+        'cursor': fields.Str(location='query', missing=None),
+        'count': fields.Str(location='query', missing=None)
     })
     def get(self, args, collection_id):
         # pagination
         page = args['page']
-        # filtering
-        filters = {}
-        if args['where']:
-            filters.update(json.loads(args['where']))
-
         collection = Collection.query.get(collection_id)
 
-        collection_files_query = collection.files.filter_by(**filters)
+        collection_files_query = collection.files
+        # filtering
+        if args['where']:
+            collection_files_query = create_filter(collection_files_query, ExperimentFile, args['where'])
 
         if args['projection']:
             projection = json.loads(args['projection'])
             collection_files_query = create_projection(collection_files_query, projection)
         if args['merge']:
             collection_files_query = collection_files_query.distinct()
-        if args['sort_by'] and args['order']:
-            sort = "{} {}".format(args['sort_by'], args['order'])
-            collection_files_query = collection_files_query.order_by(text(sort))
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        if args['cursor'] is not None:
+            sort_column = get_cursor_column(ExperimentFile, args['sort_by'] or 'updated_at', ('updated_at', 'created_at', 'name'))
+            collection_files, next_cursor = paginate_by_cursor(collection_files_query, sort_column, ExperimentFile.id, args['cursor'], per_page, descending=args['order'] != 'asc')
+            total = count_query(collection_files_query, args['count'])
+            headers = create_cursor_header(self, next_cursor, total, collection_id=collection_id, per_page=per_page, where=args['where'], projection=args['projection'],
+                                           merge=args['merge'] or None, sort_by=args['sort_by'], order=args['order'], count=args['count'])
+            result = collection_file_schema.dump(collection_files, many=True).data
+            return result, 200, headers
+        collection_files_query = create_sorting(collection_files_query, ExperimentFile, args['sort_by'], args['order'])
 
         # create pagination
         page = args['page']
-        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
         pagination = collection_files_query.paginate(page, per_page, False)
         # pagination headers
         link_header = create_pagination_header(self, pagination, page, collection_id=collection_id)
@@ -204,16 +225,15 @@ class CollectionFileController(Resource):
 
     # Flask Restful representations (i.e. @api.representation('text/tsv')) don't work for content negotiation here, since they apply to the api level, and not to a single resource level. That's why it isn't possible to create resource specific content negotiation.
 
-    def download_file(self, collection_file, attachment=False):
+    def download_file(self, collection_file, attachment=False, bytes_range=None):
         """Makes a Flask response with the corresponding content-type encoded body"""
-        from flask import send_from_directory
-        data_path = os.path.abspath(current_app.config.get('BRAINGINE_ROOT'))
-        return send_from_directory(data_path, collection_file.path, mimetype=collection_file.mime_type, as_attachment=attachment)
+        return send_file(collection_file.path, collection_file.mime_type, attachment, bytes_range)
 
 
     @use_args({
         'accept': fields.Str(load_from='Accept', location='headers'), # default is */* for accepting everything
-        'download': fields.Boolean(location='querystring', missing=False) # force download or not
+        'download': fields.Boolean(location='querystring', missing=False), # force download or not
+        'range': fields.Str(load_from='Range', location='headers', missing=None)
     })
     def get(self, args, collection_id, file_id):
         collection_file = ExperimentFile.query.filter_by(collection_id=collection_id, id=file_id).first()
@@ -225,7 +245,7 @@ class CollectionFileController(Resource):
             return result, 200
         # otherwise send file contents
         elif (args['accept'] == collection_file.mime_type or args['accept'] == '*/*'):
-            return self.download_file(collection_file, args['download'])
+            return self.download_file(collection_file, args['download'], args['range'])
         # not acceptable content-type requested
         else:
             abort(406, "The resource identified by the request is only capable of generating response entities which have content characteristics not acceptable according to the accept headers sent in the request.")
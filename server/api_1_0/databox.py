@@ -5,7 +5,6 @@ from flask import abort, current_app, g
 from flask.ext.restful import Resource
 
 from .. import db
-from sqlalchemy import text
 from ..models.file import ExperimentFile, ExperimentFileSchema
 from ..models.user import User
 from ..models.databox import DataBox, DataBoxSchema
@@ -14,7 +13,8 @@ from . import api
 from webargs import fields
 from webargs.flaskparser import use_args
 from ..utils import sha1_string
-from .api_utils import create_pagination_header, create_projection, store_file_upload
+from ..memberships import add_files, remove_files
+from .api_utils import create_pagination_header, create_filter, create_sorting, create_cursor_header, get_cursor_column, paginate_by_cursor, count_query, create_projection, store_file_upload
 
 experiment_file_schema = ExperimentFileSchema()
 databox_schema = DataBoxSchema()
@@ -37,19 +37,24 @@ class DataBoxFileListController(Resource):
         'fileIds[]': fields.List(fields.Int(), missing=[]),
     })
     def post(self, args):
-        if len(args['fileIds[]']) > 0:
-            user = g.user
-            databox = DataBox.query.filter_by(user_id=user.id).first()
-            files = ExperimentFile.query.filter(ExperimentFile.id in args['fileIds[]']).all()
-            print(files)
-            # for fileId in args['fileIds']:
-            #     currentFile = ExperimentFile.query.get(fileId)
-            #     databox.files.append(currentFile)
-            # for currentFile in files:
-            #     databox.files.append(currentFile)
-            # # databox.files.extend(files)
-            # db.session.commit()
-            return 201, databox.files
+        return self.update_members(add_files, args['fileIds[]'], 'added')
+
+    @use_args({
+        'fileIds[]': fields.List(fields.Int(), missing=[]),
+    })
+    def delete(self, args):
+        return self.update_members(remove_files, args['fileIds[]'], 'removed')
+
+    def update_members(self, update, file_ids, action):
+        if len(file_ids) > current_app.config.get('MEMBERSHIP_MAX_IDS'):
+            abort(400, "At most {} files can be {} at once".format(current_app.config.get('MEMBERSHIP_MAX_IDS'), action))
+        databox = DataBox.query.filter_by(user_id=g.user.id).first()
+        if not databox:
+            abort(404, "User {} has no databox".format(g.user.id))
+        # one statement for all files, files of other users are skipped
+        count = update('databoxes_to_files', databox.id, g.user.id, file_ids)
+        db.session.commit()
+        return {action: count}, 200
 
 
     @use_args({
@@ -60,7 +65,10 @@ class DataBoxFileListController(Resource):
         'merge': fields.Bool(location='query', missing=False),
         'sort_by': fields.Str(location='query', missing=None),
         'order': fields.Str(location='query', missing=None),
-        'where': fields.Str(location='query', missing=None)
+        'where': fields.Str(location='query', missing=None),
+        # opt-in keyset pagination, empty for the first page
+        'cursor': fields.Str(location='query', missing=None),
+        'count': fields.Str(location='query', missing=None)
     })
     def get(self, args):
         # pagination
@@ -69,26 +77,30 @@ class DataBoxFileListController(Resource):
         # filtering
         filters = {}
         filters['user_id'] = user.id
-        if args['where']:
-            filters.update(json.loads(args['where']))
 
         databox = DataBox.query.filter_by(user_id=user.id).first()
         databox_files_query = databox.files.filter_by(**filters)
+        if args['where']:
+            databox_files_query = create_filter(databox_files_query, ExperimentFile, args['where'])
 
         if args['projection']:
             projection = json.loads(args['projection'])
             databox_files_query = create_projection(databox_files_query, projection)
         if args['merge']:
             databox_files_query = databox_files_query.distinct()
-        if args['sort_by'] and args['order']:
-            sort = "{} {}".format(args['sort_by'], args['order'])
-        else:
-            sort = "updated_at desc"
-        databox_files_query = databox_files_query.order_by(text(sort))
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        if args['cursor'] is not None:
+            sort_column = get_cursor_column(ExperimentFile, args['sort_by'] or 'updated_at', ('updated_at', 'created_at', 'name'))
+            databox_files, next_cursor = paginate_by_cursor(databox_files_query, sort_column, ExperimentFile.id, args['cursor'], per_page, descending=args['order'] != 'asc')
+            total = count_query(databox_files_query, args['count'])
+            headers = create_cursor_header(self, next_cursor, total, per_page=per_page, where=args['where'], projection=args['projection'],
+                                           merge=args['merge'] or None, sort_by=args['sort_by'], order=args['order'], count=args['count'])
+            result = experiment_file_schema.dump(databox_files, many=True).data
+            return result, 200, headers
+        databox_files_query = create_sorting(databox_files_query, ExperimentFile, args['sort_by'], args['order'])
 
         # create pagination
         page = args['page']
-        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
         pagination = databox_files_query.paginate(page, per_page, False)
         # pagination headers
         link_header = create_pagination_header(self, pagination, page)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json, time
+from flask import current_app, request, g, Response, stream_with_context
+from flask.ext.restful import Resource
+from webargs import fields
+from webargs.flaskparser import use_args
+
+from .auth import auth
+from .. import db
+from ..events import get_events, listen
+
+
+class EventListController(Resource):
+    """
+    Notifications about the analyses and visualizations of the current user.
+
+    Clients accepting text/event-stream get Server-Sent Events, whose ids let EventSource resume through the
+    Last-Event-ID header. Other clients long-poll: the request returns as soon as there are events after
+    last_event_id, or an empty list after the timeout.
+    """
+    decorators = [auth.login_required]
+
+    @use_args({
+        'last_event_id': fields.Int(location='query', missing=None),
+        'last_event_id_header': fields.Int(location='headers', load_from='Last-Event-ID', missing=None),
+        'timeout': fields.Int(location='query', missing=None, validate=lambda timeout: timeout >= 0),
+    })
+    def get(self, args):
+        user_id = g.user.id
+        last_event_id = args['last_event_id_header'] if args['last_event_id_header'] is not None else (args['last_event_id'] or 0)
+        # don't keep a DB transaction open while waiting for events
+        db.session.commit()
+
+        if 'text/event-stream' in [mimetype for mimetype, quality in request.accept_mimetypes]:
+            return self.stream_events(user_id, last_event_id)
+
+        timeout = min(args['timeout'] if args['timeout'] is not None else current_app.config.get('EVENTS_LONGPOLL_TIMEOUT'),
+                      current_app.config.get('EVENTS_LONGPOLL_TIMEOUT'))
+        events = get_events(user_id, last_event_id)
+        if not events:
+            for event in listen(user_id, last_event_id, timeout):
+                if event is not None:
+                    events.append(event)
+                    break
+        if events:
+            last_event_id = events[-1]['id']
+        return {'events': events, 'last_event_id': last_event_id}, 200
+
+    def stream_events(self, user_id, last_event_id):
+        heartbeat_interval = current_app.config.get('EVENTS_HEARTBEAT_INTERVAL')
+        # streams get closed after a while to free the worker, EventSource reconnects with Last-Event-ID
+        events = listen(user_id, last_event_id, current_app.config.get('EVENTS_STREAM_TIMEOUT'))
+
+        def generate():
+            yield "retry: 1000\n\n"
+            heartbeat_at = time.time() + heartbeat_interval
+            for event in events:
+                if event is None:
+                    # comments keep proxies from closing idle streams
+                    if time.time() >= heartbeat_at:
+                        heartbeat_at = time.time() + heartbeat_interval
+                        yield ": heartbeat\n\n"
+                    continue
+                yield "id: {}\nevent: {}\ndata: {}\n\n".format(event['id'], event['type'], json.dumps(event['data']))
+
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
@@ -5,15 +5,16 @@ from flask import abort, current_app, g
 from flask.ext.restful import Resource
 
 from .. import db
-from sqlalchemy import text
 from ..models.file import ExperimentFile, ExperimentFileSchema
 from ..models.user import User
 from .auth import auth
 from . import api
 from webargs import fields
 from webargs.flaskparser import use_args
-from ..utils import sha1_string
-from .api_utils import create_pagination_header, create_projection, store_file_upload
+from ..search import search_query
+from ..utils import sha1_string, silent_remove, parse_content_range, write_file_at_offset
+from .api_utils import create_pagination_header, create_filter, create_sorting, create_cursor_header, get_cursor_column, paginate_by_cursor, count_query, create_projection, send_file, store_file_upload, get_upload_path, get_upload_session, record_upload_chunk
+from .uploads import UploadSessionController
 
 experiment_file_schema = ExperimentFileSchema()
 
@@ -30,7 +31,12 @@ class FileListController(Resource):
         'merge': fields.Bool(location='query', missing=False),
         'sort_by': fields.Str(location='query', missing=None),
         'order': fields.Str(location='query', missing=None),
-        'where': fields.Str(location='query', missing=None)
+        'where': fields.Str(location='query', missing=None),
+        # search string matched against name, display name and file format
+        'q': fields.Str(location='query', missing=None),
+        # opt-in keyset pagination, empty for the first page
+        'cursor': fields.Str(location='query', missing=None),
+        'count': fields.Str(location='query', missing=None)
     })
     def get(self, args):
         # pagination
@@ -41,28 +47,40 @@ class FileListController(Resource):
         filters['user_id'] = user.id
         if args['is_upload']:
             filters['is_upload'] = args['is_upload']
-        if args['where']:
-            filters.update(json.loads(args['where']))
 
         experiment_files_query = ExperimentFile.query.filter_by(**filters)
+        if args['where']:
+            experiment_files_query = create_filter(experiment_files_query, ExperimentFile, args['where'])
+        if args['q']:
+            if args['cursor'] is not None:
+                abort(400, "Search results are ordered by relevance and can't be paginated by cursor")
+            experiment_files_query = search_query(experiment_files_query, ExperimentFile.search_vector, [ExperimentFile.name, ExperimentFile.display_name], ExperimentFile.id, args['q'])
 
         if args['projection']:
             projection = json.loads(args['projection'])
             experiment_files_query = create_projection(experiment_files_query, projection)
         if args['merge']:
             experiment_files_query = experiment_files_query.distinct()
-        if args['sort_by'] and args['order']:
-            sort = "{} {}".format(args['sort_by'], args['order'])
-        else:
-            sort = "updated_at desc"
-        experiment_files_query = experiment_files_query.order_by(text(sort))
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        if args['cursor'] is not None:
+            sort_column = get_cursor_column(ExperimentFile, args['sort_by'] or 'updated_at', ('updated_at', 'created_at', 'name'))
+            experiment_files, next_cursor = paginate_by_cursor(experiment_files_query, sort_column, ExperimentFile.id, args['cursor'], per_page, descending=args['order'] != 'asc')
+            total = count_query(experiment_files_query, args['count'])
+            headers = create_cursor_header(self, next_cursor, total, per_page=per_page, is_upload=args['is_upload'], projection=args['projection'],
+                                           merge=args['merge'] or None, sort_by=args['sort_by'], order=args['order'], where=args['where'], count=args['count'])
+            result = experiment_file_schema.dump(experiment_files, many=True).data
+            return result, 200, headers
+
+        # search results keep their ranking unless another order is requested
+        if not args['q'] or args['sort_by']:
+            experiment_files_query = create_sorting(experiment_files_query, ExperimentFile, args['sort_by'], args['order'])
 
         # create pagination
         page = args['page']
-        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
         pagination = experiment_files_query.paginate(page, per_page, False)
         # pagination headers
-        link_header = create_pagination_header(self, pagination, page)
+        link_header = create_pagination_header(self, pagination, page, per_page=per_page, is_upload=args['is_upload'], q=args['q'], where=args['where'],
+                                               sort_by=args['sort_by'], order=args['order'])
 
         # reponse body
         experiment_files = pagination.items
@@ -73,6 +91,7 @@ class FileListController(Resource):
     @use_args({
         'temp_filename': fields.Str(load_from='X-Temp-File-Name', location='headers'),
         'filename': fields.Str(load_from='X-File-Name', location='headers'),
+        'upload_id': fields.Int(load_from='X-Upload-Id', location='headers', missing=None),
         'content-range': fields.Str(load_from='Content-Range', location='headers', missing=None),
         'content-length': fields.Int(load_from='Content-Length', location='headers', missing=0),
     })
@@ -81,42 +100,59 @@ class FileListController(Resource):
 
         # Make the filename safe, remove unsupported chars
         filename = werkzeug.secure_filename(args['filename'])
-        # get user folder
-        user_folder = user.username
 
         input_file_path = os.path.join(current_app.config.get('DATA_STORAGE_PREUPLOADS'), args['temp_filename'])
 
-        output_file_path = os.path.join(current_app.config.get('BRAINGINE_ROOT'), current_app.config.get('DATA_FOLDER'), user_folder, current_app.config.get('UPLOADS_FOLDER'), filename)
+        output_file_path = get_upload_path(filename, user)
 
         # handle chunked file upload
         if args['content-range']:
 
             # extract byte numbers from Content-Range header string
-            content_range = args['content-range']
-            range_str = content_range.split(' ')[1]
-            start_bytes = int(range_str.split('-')[0])
-            end_bytes = int(range_str.split('-')[1].split('/')[0])
-            total_bytes = int(range_str.split('/')[1])
-
-
-            # append chunk to the file on server, or create new
-            with open(output_file_path, "ab") as output_file, open(input_file_path, "rb") as input_file:
-                output_file.write(input_file.read())
+            try:
+                start_bytes, end_bytes, total_bytes = parse_content_range(args['content-range'])
+            except ValueError as e:
+                abort(400, "Invalid Content-Range header: {}".format(e))
+            range_str = args['content-range'].split(' ')[1]
+
+            upload_session = get_upload_session(args['upload_id'], filename, total_bytes, user)
+            if upload_session.size_in_bytes != total_bytes:
+                abort(416, "Content-Range does not match the size of upload {}".format(upload_session.id))
+            upload_location = {'Location': api.url_for(UploadSessionController, upload_id=upload_session.id), 'X-Upload-Id': str(upload_session.id)}
+
+            if os.path.getsize(input_file_path) != end_bytes - start_bytes + 1:
+                silent_remove(input_file_path)
+                abort(400, "Chunk size does not match Content-Range {}".format(range_str))
+
+            part_path = upload_session.path
+            if upload_session.state == 'PENDING':
+                if start_bytes == 0 and end_bytes == total_bytes - 1:
+                    # chunk contains the whole file, just move it into place
+                    shutil.move(input_file_path, upload_session.path)
+                else:
+                    # write chunk at its offset in the file on server, chunks can arrive in any order
+                    write_file_at_offset(upload_session.path, input_file_path, start_bytes)
             # remove temp file after copying contents
             try:
                 os.remove(input_file_path)
+            except FileNotFoundError:
+                pass
             except OSError:
                 print('Not able to remove file under {}'.format(input_file_path))
 
-            # check if these are the last bytes
-            # if so, create file model
-            if end_bytes >= (total_bytes - 1):
-                experimentFile = store_file_upload(filename, user)
+            # record received range, the file model gets created once the whole file has been received
+            upload_session = record_upload_chunk(upload_session.id, start_bytes, end_bytes, user)
+            if upload_session.path != part_path:
+                # the part file was moved into place, something is only left there if this chunk got written after
+                # another one completed the upload
+                silent_remove(part_path)
+            if upload_session.state == 'SUCCESS':
+                experimentFile = ExperimentFile.query.get(upload_session.file_id)
                 result = experiment_file_schema.dump(experimentFile, many=False).data
-                return result, 200
+                return result, 200, upload_location
             # otherwise, return range as string
             else:
-                return range_str, 201
+                return range_str, 201, upload_location
 
         # handle small/non-chunked file upload
         else:
@@ -132,17 +168,7 @@ class FileController(Resource):
 
     def download_file(self, experiment_file, attachment=False, bytes_range=None):
         """Makes a Flask response with the corresponding content-type encoded body"""
-        from flask import send_from_directory
-        file_folder_path = os.path.dirname(os.path.abspath(experiment_file.path))
-        # read only specific bytes-range
-        if bytes_range:
-            start, end = map(int, bytes_range.split('=')[1].split('-'))
-            buffer_size = end - start
-            with open(os.path.join(file_folder_path,experiment_file.name),"r") as file_object:
-                file_object.seek(start) # set file pointer to start of range
-                file_data = file_object.read(buffer_size)
-            return file_data, 206
-        return send_from_directory(file_folder_path, experiment_file.name, mimetype=experiment_file.mime_type, as_attachment=attachment)
+        return send_file(experiment_file.path, experiment_file.mime_type, attachment, bytes_range)
 
     @use_args({
         'alt': fields.Str(location='querystring', missing=''), # return file contents with 'alt=media'
@@ -1,24 +1,64 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import current_app, g
+from flask import abort, current_app, g
 from flask.ext.restful import Resource
-import os, glob
+import os
 from .auth import auth
-from .api_utils import store_illumina_file
+from . import api, tasks
+from .. import db
+# celery task
+from ..tasks import import_files
 from ..models.collection import Collection
+from ..models.illumina_run import IlluminaRun, IlluminaRunFile
+from ..utils import sha1_string
+from .api_utils import create_pagination_header, not_modified_response
 from webargs import fields
 from webargs.flaskparser import use_args
 
+
+def get_run_files(folder_uid):
+    """
+    Get the names of the fastq files of a run from the index, or from its folder if the run has not been indexed yet
+    """
+    run = IlluminaRun.query.filter_by(folder_uid=folder_uid).first()
+    if run is not None:
+        return [name for (name,) in run.files.with_entities(IlluminaRunFile.name).order_by(IlluminaRunFile.name)]
+    files_folder = os.path.join(current_app.config.get('ILLUMINA_ROOT'), folder_uid, current_app.config.get('ILLUMINA_FASTQ_FOLDER'))
+    try:
+        return sorted(f for f in os.listdir(files_folder) if os.path.isfile(os.path.join(files_folder, f)) and not f.startswith(".") and f.endswith('.fastq.gz'))
+    except FileNotFoundError:
+        abort(404, "Illumina run {} not found".format(folder_uid))
+
+
 class IlluminaFolderListController(Resource):
     decorators = [auth.login_required]
 
-    def get(self):
-        raw_data_folder = current_app.config.get('ILLUMINA_ROOT')
-        # get list of illumina run folders
-        illumina_folders = [f for f in os.listdir(raw_data_folder) if os.path.isdir(os.path.join(raw_data_folder, f))]
+    @use_args({
+        'page': fields.Int(location='query', missing=1),
+        'per_page': fields.Int(location='query', missing=None),
+        'order': fields.Str(location='query', missing='desc', validate=lambda order: order in ('asc', 'desc')),
+    })
+    def get(self, args):
+        page = args['page']
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        # the index only changes when runs get added, removed or read again by the periodic scan
+        last_update, run_count = db.session.query(db.func.max(IlluminaRun.updated_at), db.func.count(IlluminaRun.id)).one()
+        etag = sha1_string("{}:{}:{}:{}:{}".format(last_update, run_count, page, per_page, args['order']))
+        response = not_modified_response(etag)
+        if response is not None:
+            return response
 
-        return illumina_folders, 200
+        # list illumina run folders by date of the run, folders without date last
+        if args['order'] == 'asc':
+            order_by = (IlluminaRun.run_date.asc().nullslast(), IlluminaRun.folder_uid.asc())
+        else:
+            order_by = (IlluminaRun.run_date.desc().nullslast(), IlluminaRun.folder_uid.desc())
+        pagination = IlluminaRun.query.with_entities(IlluminaRun.folder_uid).order_by(*order_by).paginate(page, per_page, False)
+        headers = create_pagination_header(self, pagination, page, per_page=per_page, order=args['order'])
+        headers['ETag'] = '"{}"'.format(etag)
+        illumina_folders = [folder_uid for (folder_uid,) in pagination.items]
+        return illumina_folders, 200, headers
 
 
 class IlluminaFolderFileListController(Resource):
@@ -26,18 +66,25 @@ class IlluminaFolderFileListController(Resource):
 
     def get(self, folder_uid):
         files_folder = os.path.join(current_app.config.get('ILLUMINA_ROOT'), folder_uid, current_app.config.get('ILLUMINA_FASTQ_FOLDER'))
+        run = IlluminaRun.query.filter_by(folder_uid=folder_uid).first()
+        headers = {}
+        if run is not None:
+            etag = sha1_string("{}:{}".format(run.folder_uid, run.updated_at))
+            response = not_modified_response(etag)
+            if response is not None:
+                return response
+            headers['ETag'] = '"{}"'.format(etag)
         # get fastq files from specific illumina run folder
-        illumina_files = glob.glob(os.path.join(files_folder, '*.fastq.gz'))
+        illumina_files = [os.path.join(files_folder, f) for f in get_run_files(folder_uid)]
 
-        return illumina_files, 200
+        return illumina_files, 200, headers
 
     def post(self, folder_uid):
         user = g.user
         files_folder = os.path.join(current_app.config.get('ILLUMINA_ROOT'), folder_uid, current_app.config.get('ILLUMINA_FASTQ_FOLDER'))
         # get fastq files from specific illumina run folder
-        illumina_files = [f for f in os.listdir(files_folder) if os.path.isfile(os.path.join(files_folder, f)) and not f.startswith(".") and f.endswith('.fastq.gz')]
-
-        for fastq_file in illumina_files:
-            new_file = store_illumina_file(fastq_file, folder_uid, user)
+        illumina_files = get_run_files(folder_uid)
 
-        return {}, 200
+        # import run files in the background and return the task status url
+        task = import_files.delay(user.id, [os.path.join(files_folder, f) for f in illumina_files])
+        return {}, 202, {'Location': api.url_for(tasks.TaskStatusController, task_id=task.id)}
@@ -1,41 +1,31 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import current_app
+from flask import abort
 from flask.ext.restful import Resource
 
-from server.models.pipeline import PipelineSchema
-import os, json, glob
+from ..catalog import get_pipeline_catalog
+from .api_utils import not_modified_response
 
 
-pipeline_schema = PipelineSchema()
-
 class PipelineListController(Resource):
     def get(self):
-        pipelines_folder = current_app.config.get('PIPELINES_STORAGE')
-        # get json files (pipeline definition files) from pipelines folders
-        pipeline_files = glob.glob(os.path.join(pipelines_folder, '**/*.json'), recursive=True)
-
-        pipeline_definition_list = list()
-        for pipeline_file in pipeline_files:
-            with open(pipeline_file) as pipeline_definition_file:
-                pipeline_definition = json.load(pipeline_definition_file)
-                pipeline_definition_list.append(pipeline_definition)
-
-        result = pipeline_schema.dump(pipeline_definition_list, many=True).data
-        return result, 200
+        # pipeline definitions are parsed once and kept up to date by the catalog
+        result, etag = get_pipeline_catalog().get_list()
+        response = not_modified_response(etag)
+        if response is not None:
+            return response
+        return result, 200, {'ETag': '"{}"'.format(etag)}
 
 
 class PipelineController(Resource):
     def get(self, pipeline_uid):
-
-        pipeine_definition_file_path = os.path.join(current_app.config.get('PIPELINES_STORAGE'), pipeline_uid, '{}.json'.format(pipeline_uid))
-
-        try:
-            with open(pipeine_definition_file_path) as pipeline_definition_file:
-                pipeline_definition = json.load(pipeline_definition_file)
-        except OSError:
+        pipeline_definition = get_pipeline_catalog().get(pipeline_uid)
+        if pipeline_definition is None:
             abort(404, "Could not find pipeline file {}.json".format(pipeline_uid))
 
-        result = pipeline_schema.dump(pipeline_definition).data
-        return result, 200
+        result, etag = pipeline_definition
+        response = not_modified_response(etag)
+        if response is not None:
+            return response
+        return result, 200, {'ETag': '"{}"'.format(etag)}
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from flask import current_app, g
+from flask.ext.restful import Resource
+
+from ..models.file import ExperimentFile
+from ..models.collection import Collection
+from ..search import autocomplete
+from .auth import auth
+from webargs import fields
+from webargs.flaskparser import use_args
+
+
+class AutocompleteController(Resource):
+    decorators = [auth.login_required]
+
+    @use_args({
+        # beginning of the name typed so far
+        'q': fields.Str(location='query', required=True),
+        # what to complete, names of the user's files or of collections
+        'kind': fields.Str(location='query', missing='files', validate=lambda kind: kind in ('files', 'collections')),
+        'limit': fields.Int(location='query', missing=10, validate=lambda limit: limit > 0),
+    })
+    def get(self, args):
+        limit = min(args['limit'], current_app.config.get('AUTOCOMPLETE_MAX_RESULTS'))
+        if args['kind'] == 'collections':
+            names = autocomplete(Collection.query, Collection.name, args['q'], limit)
+        else:
+            names = autocomplete(ExperimentFile.query.filter_by(user_id=g.user.id), ExperimentFile.name, args['q'], limit)
+        return names, 200
@@ -8,6 +8,9 @@ from webargs import fields
 from webargs.flaskparser import use_args
 from .auth import auth
 from .api_utils import store_storage_file
+from . import api, tasks
+# celery task
+from ..tasks import import_files
 
 
 class StorageFileListController(Resource):
@@ -30,8 +33,9 @@ class StorageFileListController(Resource):
         if os.path.exists(path):
             if os.path.isdir(path):
                 storage_files = [os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)) and not f.startswith(".")]
-                for filepath in storage_files:
-                    new_file = store_storage_file(filepath, user)
+                # import folder contents in the background and return the task status url
+                task = import_files.delay(user.id, storage_files)
+                return {}, 202, {'Location': api.url_for(tasks.TaskStatusController, task_id=task.id)}
             elif os.path.isfile(path):
                 store_storage_file(path, user)
         else:
@@ -1,15 +1,144 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from flask import current_app
+import threading, time
+from flask import abort, current_app, g
 from flask.ext.restful import Resource
 # get celery app instance (this is not the celery module/extension)
 from server.tasks import celery
+from celery import states as celery_states
+from webargs import fields
+from webargs.flaskparser import use_args
 
+from .auth import auth
+from ..models.analysis import Analysis
+from ..models.visualization import Visualization
 from . import api
 
+
+def _task_status(task_id, state, info):
+    result = {'task_id': task_id, 'state': state}
+    # long running tasks like bulk imports report their progress
+    if state == 'PROGRESS':
+        result['progress'] = info
+    return result
+
+
+class TaskStatusCache(object):
+    """
+    Task states shared by the requests of a process for a few seconds, so that many clients polling the same tasks
+    cause a single lookup in the result backend. States of finished tasks don't change and are kept longer.
+    """
+
+    def __init__(self, ttl=2, ready_ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.ready_ttl = ready_ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def get_many(self, task_ids):
+        now = time.time()
+        with self._lock:
+            cached = {}
+            for task_id in task_ids:
+                item = self._items.get(task_id)
+                if item is not None and item[0] > now:
+                    cached[task_id] = item[1]
+        return cached
+
+    def set_many(self, statuses):
+        now = time.time()
+        with self._lock:
+            if len(self._items) + len(statuses) > self.max_size:
+                self._items = {task_id: item for task_id, item in self._items.items() if item[0] > now}
+                if len(self._items) + len(statuses) > self.max_size:
+                    self._items = {}
+            for task_id, status in statuses.items():
+                ttl = self.ready_ttl if status['state'] in celery_states.READY_STATES else self.ttl
+                self._items[task_id] = (now + ttl, status)
+
+
+task_status_cache = TaskStatusCache()
+
+
+def get_task_statuses(task_ids):
+    """
+    Get the states of many tasks with one request to the result backend (a single MGET for redis)
+
+    :return: dict of task statuses by task id
+    """
+    statuses = task_status_cache.get_many(task_ids)
+    missing_ids = [task_id for task_id in task_ids if task_id not in statuses]
+    if not missing_ids:
+        return statuses
+
+    backend = celery.backend
+    looked_up = {}
+    if hasattr(backend, 'mget') and hasattr(backend, 'get_key_for_task'):
+        values = backend.mget([backend.get_key_for_task(task_id) for task_id in missing_ids])
+        for task_id, value in zip(missing_ids, values):
+            if value is None:
+                # unknown tasks are pending, like in AsyncResult
+                looked_up[task_id] = _task_status(task_id, celery_states.PENDING, None)
+            else:
+                meta = backend.decode(value)
+                looked_up[task_id] = _task_status(task_id, meta['status'], meta['result'])
+    else:
+        for task_id in missing_ids:
+            task = celery.AsyncResult(task_id)
+            looked_up[task_id] = _task_status(task_id, task.state, task.info)
+
+    task_status_cache.set_many(looked_up)
+    statuses.update(looked_up)
+    return statuses
+
+
 class TaskStatusController(Resource):
 
     def get(self, task_id):
         task  = celery.AsyncResult(task_id)
-        return {'task_id': task_id, 'state': task.state}, 200
+        result = _task_status(task_id, task.state, task.info)
+        return result, 200
+
+
+class TaskStatusListController(Resource):
+    decorators = [auth.login_required]
+
+    @use_args({
+        # comma separated task ids
+        'ids': fields.DelimitedList(fields.Str(), location='query', missing=[]),
+    })
+    def get(self, args):
+        return self.get_statuses(args['ids'])
+
+    @use_args({
+        'ids': fields.List(fields.Str(), location='json', required=True),
+    })
+    def post(self, args):
+        return self.get_statuses(args['ids'])
+
+    def get_statuses(self, task_ids):
+        task_ids = list(dict.fromkeys(task_ids))
+        if len(task_ids) > current_app.config.get('TASK_STATUS_MAX_IDS'):
+            abort(400, "At most {} task ids can be requested at once".format(current_app.config.get('TASK_STATUS_MAX_IDS')))
+        if not task_ids:
+            return [], 200
+
+        statuses = get_task_statuses(task_ids)
+
+        # link tasks to the analyses and visualizations of the user they run for
+        analysis_ids = dict(Analysis.query.with_entities(Analysis.task_id, Analysis.id) \
+                                            .filter(Analysis.user_id == g.user.id, Analysis.task_id.in_(task_ids)))
+        visualization_ids = dict(Visualization.query.with_entities(Visualization.task_id, Visualization.id) \
+                                            .filter(Visualization.user_id == g.user.id, Visualization.task_id.in_(task_ids)))
+
+        result = []
+        for task_id in task_ids:
+            status = dict(statuses[task_id])
+            if task_id in analysis_ids:
+                status['analysis_id'] = analysis_ids[task_id]
+            if task_id in visualization_ids:
+                status['visualization_id'] = visualization_ids[task_id]
+            result.append(status)
+        return result, 200
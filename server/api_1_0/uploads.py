@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import werkzeug
+from flask import abort, g
+from flask.ext.restful import Resource
+
+from .. import db
+from ..models.upload import UploadSession, UploadSessionSchema
+from ..utils import silent_remove
+from .auth import auth
+from . import api
+from webargs.flaskparser import use_args
+from .api_utils import create_upload_session
+
+upload_session_schema = UploadSessionSchema()
+
+
+class UploadSessionListController(Resource):
+    decorators = [auth.login_required]
+
+    @use_args(upload_session_schema)
+    def post(self, args):
+        """
+        Start a chunked upload. Chunks are then sent to the files resource with the session id in the X-Upload-Id header.
+        """
+        user = g.user
+        # Make the filename safe, remove unsupported chars
+        filename = werkzeug.secure_filename(args['filename'])
+        if args['size_in_bytes'] < 0:
+            abort(400, "Invalid file size {}".format(args['size_in_bytes']))
+
+        upload_session = create_upload_session(filename, args['size_in_bytes'], user)
+
+        result = upload_session_schema.dump(upload_session).data
+        return result, 201, {'Location': api.url_for(UploadSessionController, upload_id=upload_session.id)}
+
+
+class UploadSessionController(Resource):
+    decorators = [auth.login_required]
+
+    def get(self, upload_id):
+        """
+        Return the state and the received byte ranges of an upload, so clients can resume it sending only the missing chunks
+        """
+        upload_session = UploadSession.query.filter_by(id=upload_id, user_id=g.user.id).first()
+        if not upload_session:
+            abort(404, "Upload session {} doesn't exist".format(upload_id))
+        result = upload_session_schema.dump(upload_session).data
+        return result, 200
+
+    def delete(self, upload_id):
+        upload_session = UploadSession.query.filter_by(id=upload_id, user_id=g.user.id).first()
+        if not upload_session:
+            abort(404, "Upload session {} doesn't exist".format(upload_id))
+        # remove partially uploaded file
+        if upload_session.state == 'PENDING':
+            silent_remove(upload_session.path)
+        db.session.delete(upload_session)
+        db.session.commit()
+        return {}, 204
@@ -13,11 +13,15 @@ from ..models.collection import Collection
 from ..models.file import ExperimentFile
 from ..models.visualization import Visualization, VisualizationSchema, VisualizationParameter, AssociationVisualizationsInputFiles
 from ..models.plot import Plot, PlotSchema, PlotInput
-from ..utils import sha256checksum, create_folder
+from ..utils import create_folder
+from ..catalog import get_plot_catalog, PreparedDefinition
+from .api_utils import create_pagination_header, create_filter, create_sorting
 # http://stackoverflow.com/a/30399108
 from . import api, tasks
 # celery task
 from ..tasks import create_visualization
+from celery.utils import uuid
+from ..events import publish_event
 # webargs for request parsing instead of flask restful's reqparse
 from webargs import fields
 from webargs.flaskparser import use_args
@@ -28,28 +32,19 @@ visualization_schema = VisualizationSchema()
 class VisualizationListController(Resource):
     decorators = [auth.login_required]
 
-    def _get_plot_checksum(self, plot_uid):
-        return sha256checksum(self._get_plot_definition_file(plot_uid))
-
-    def _get_plot_definition_file(self, plot_uid):
-        """
-        Build filename for given plot
-        """
-        plot_definition_file_path = os.path.join(current_app.config.get('PLOTS_STORAGE'), plot_uid, '{}.json'.format(plot_uid))
-        return plot_definition_file_path
-
-    def _load_plot_definition(self, plot_uid):
+    def _prepare_plot(self, catalog_entry):
         """
-        Serializes fields from a JSON plot definition file into a dictionary
+        Get the DB entry for the version of a plot definition in the catalog, creating it if needed
         """
-        with open(self._get_plot_definition_file(plot_uid)) as plot_definition_file:
-            plot_definition = json.load(plot_definition_file)
-        return plot_definition
+        plot_definition = catalog_entry.definition
+        plot = Plot.query.filter_by(uid=plot_definition['uid'], checksum=catalog_entry.checksum).first()
+        if plot is None:
+            plot = self._store_plot(plot_definition, catalog_entry.checksum)
 
-    def _store_plot(self, plot_uid):
-        # serialize plot definition file
-        plot_definition = self._load_plot_definition(plot_uid)
+        input_files = [pi.name for pi in plot.inputs if pi.type == "file"]
+        return PreparedDefinition(id=plot.id, uid=plot.uid, filename=plot.filename, executor=plot.executor, command=plot.command, input_files=input_files)
 
+    def _store_plot(self, plot_definition, plot_checksum):
         # get needed plot fields
         plot_uid = plot_definition['uid']
         plot_filename = plot_definition['filename']
@@ -60,8 +55,6 @@ class VisualizationListController(Resource):
         plot_inputs = plot_definition['inputs']
         plot_output_file_name = plot_definition['output_file_name']
 
-        plot_checksum = self._get_plot_checksum(plot_uid)
-
         # create plot object
         plot = Plot(uid=plot_uid, filename=plot_filename, name=plot_name, description=plot_description, executor=plot_executor, command=plot_command, checksum=plot_checksum, output_filename=plot_output_file_name)
 
@@ -75,23 +68,36 @@ class VisualizationListController(Resource):
 
         return plot
 
-    def get(self):
-        experiment_visualizations = Visualization.query.filter_by(user_id=g.user.id).all()
-        result = visualization_schema.dump(experiment_visualizations, many=True).data
-        return result, 200
+    @use_args({
+        'page': fields.Int(location='query', missing=1),
+        'per_page': fields.Int(location='query', missing=None),
+        'where': fields.Str(location='query', missing=None),
+        'sort_by': fields.Str(location='query', missing=None),
+        'order': fields.Str(location='query', missing=None),
+    })
+    def get(self, args):
+        page = args['page']
+        per_page = args['per_page'] or current_app.config.get('ITEMS_PER_PAGE')
+        visualizations_query = Visualization.query_with_relationships().filter_by(user_id=g.user.id)
+        if args['where']:
+            visualizations_query = create_filter(visualizations_query, Visualization, args['where'])
+        visualizations_query = create_sorting(visualizations_query, Visualization, args['sort_by'], args['order'], default_sort_by='created_at')
+        pagination = visualizations_query.paginate(page, per_page, False)
+        # pagination headers
+        link_header = create_pagination_header(self, pagination, page, per_page=per_page, where=args['where'], sort_by=args['sort_by'], order=args['order'])
+
+        result = visualization_schema.dump(pagination.items, many=True).data
+        return result, 200, link_header
 
     @use_args(visualization_schema)
     def post(self, args):
-        from string import Template
-
         plot_uid = args['plot_uid']
         user = g.user
 
-        # get plot from DB
-        plot = Plot.query.filter_by(uid=plot_uid).first()
-        # if plot not available in DB or checksum of definition file changed, create new DB entry
-        if plot is None or (plot.checksum != self._get_plot_checksum(plot_uid)):
-            plot = self._store_plot(plot_uid)
+        # get plot prepared for the current version of its definition file, which gets stored in DB if it's new
+        plot = get_plot_catalog().get_prepared(plot_uid, self._prepare_plot)
+        if plot is None:
+            abort(404, "Could not find plot file {}.json".format(plot_uid))
 
         # =====
         # GET PLOT PARAMETERS
@@ -100,10 +106,7 @@ class VisualizationListController(Resource):
         # merge parameter dictionaries (key-value pairs) into one single dictionary, in order to work on Template.substitute
         input_parameters = {d['name']: d['value'] for d in args['parameters']}
 
-        plot_input_files = {}
-        for pi in plot.inputs:
-            if pi.type == "file":
-                plot_input_files[pi.name] = ""
+        plot_input_files = {name: "" for name in plot.input_files}
 
         # =====
         # CREATE DB ENTRIES FOR NEW VISUALIZATION
@@ -111,6 +114,8 @@ class VisualizationListController(Resource):
 
         # create visualization entity
         experiment_visualization = Visualization(user_id=user.id, plot_id=plot.id, plot_uid=plot_uid)
+        # the task id is stored before sending the task, so task states can always be linked to the visualization
+        experiment_visualization.task_id = uuid()
         # add analysis to DB
         db.session.add(experiment_visualization)
         # flush to let DB create id
@@ -160,8 +165,7 @@ class VisualizationListController(Resource):
         visualization_folder = os.path.join(experiment_folder, current_app.config.get('VISUALIZATIONS_FOLDER'), str(experiment_visualization.id))
 
         # write params into command template
-        plot_command = Template(plot.command)
-        plot_command_with_parameters = plot_command.substitute(input_parameters)
+        plot_command_with_parameters = plot.command.substitute(input_parameters)
 
         plot_file_path = os.path.join(current_app.config.get('PLOTS_STORAGE'), plot.filename)
         final_plot_command = '{} {}'.format(plot.executor, plot_command_with_parameters)
@@ -170,7 +174,8 @@ class VisualizationListController(Resource):
         remote_command = 'cd {}; {}'.format(visualization_folder, final_plot_command)
 
         # send task to celery and store it in a variable for returning task id in location header
-        task = create_visualization.delay(remote_command, plot_id=plot.id, visualization_id=experiment_visualization.id)
+        task = create_visualization.apply_async(args=[remote_command], kwargs=dict(plot_id=plot.id, visualization_id=experiment_visualization.id), task_id=experiment_visualization.task_id)
+        publish_event(user.id, 'visualization', {'visualization_id': experiment_visualization.id, 'task_id': task.id, 'state': experiment_visualization.state})
 
         result = visualization_schema.dump(experiment_visualization).data
 
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+    server.blob_store
+    ~~~~~~~~~~~~~~
+    content-addressed storage shared by all files with the same checksum
+"""
+import os, errno
+from flask import current_app
+from sqlalchemy import text
+from . import db
+from .models.blob import Blob
+from .utils import create_folder
+
+
+def get_blob_path(checksum):
+    """
+    Build the path of the blob for the given checksum, spread over two levels of subfolders
+    """
+    return os.path.join(current_app.config.get('BRAINGINE_ROOT'), current_app.config.get('BLOBS_FOLDER'), checksum[:2], checksum[2:4], checksum)
+
+
+def link_file(src_path, dest_path):
+    """
+    Replace a file by a hard link to another file, or by a symbolic link if hard linking is not possible (e.g. different file systems)
+    """
+    tmp_path = '{}.{}.link'.format(dest_path, os.getpid())
+    try:
+        os.link(src_path, tmp_path)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        os.symlink(src_path, tmp_path)
+    os.replace(tmp_path, dest_path)
+
+
+def _is_internal(path):
+    """
+    Check if a path lies within the braingine folder, files outside of it (e.g. imported from other shares) must not be touched
+    """
+    root = os.path.abspath(current_app.config.get('BRAINGINE_ROOT'))
+    return os.path.abspath(path).startswith(root + os.sep)
+
+
+def deduplicate_file(experiment_file):
+    """
+    Attach a hashed file to the blob holding the same contents.
+
+    If a blob with the same checksum already exists, the file gets replaced by a link to it. Otherwise the contents of
+    a file owned by braingine (i.e. not a symbolic link to another share) become a new blob.
+    The caller has to commit the session.
+
+    :param ExperimentFile experiment_file: a file with checksum
+    :return: the blob the file references now, or None if it couldn't be deduplicated
+    """
+    if experiment_file.checksum is None or experiment_file.blob_id is not None or not _is_internal(experiment_file.path):
+        return None
+
+    # serialize deduplication of files with the same contents, releasing blobs is serialized by the blob row lock
+    db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:checksum))"), {'checksum': experiment_file.checksum})
+    blob = Blob.query.filter_by(checksum=experiment_file.checksum).with_for_update().first()
+
+    if blob is not None and os.path.exists(blob.path):
+        link_file(blob.path, experiment_file.path)
+        blob.ref_count = Blob.ref_count + 1
+    elif os.path.isfile(experiment_file.path) and not os.path.islink(experiment_file.path):
+        blob_path = get_blob_path(experiment_file.checksum)
+        create_folder(os.path.dirname(blob_path))
+        try:
+            # remains of a blob whose row got lost are replaced
+            tmp_path = '{}.{}.link'.format(blob_path, os.getpid())
+            os.link(experiment_file.path, tmp_path)
+            os.replace(tmp_path, blob_path)
+        except OSError as e:
+            current_app.logger.warning("Could not store blob for file {}: {}".format(experiment_file.path, e))
+            return None
+        if blob is None:
+            blob = Blob(checksum=experiment_file.checksum, path=blob_path, size_in_bytes=os.path.getsize(blob_path), ref_count=1)
+            db.session.add(blob)
+        else:
+            blob.path = blob_path
+            blob.ref_count = Blob.ref_count + 1
+    else:
+        return None
+
+    experiment_file.blob = blob
+    return blob
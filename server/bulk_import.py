@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+    server.bulk_import
+    ~~~~~~~~~~~~~~
+    registration of many files from other shares (storage folders, Illumina runs) at once
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from . import db
+from .models.file import ExperimentFile
+from .file_formats import get_format_detector
+
+
+def _probe_file(source_path, internal_path):
+    """
+    Link a file into the braingine folder and get its size. Runs in a thread, since both are slow on network shares.
+
+    :return: tuple with the path to register and the size of the file, or None if the file can't be read
+    """
+    try:
+        file_stats = os.stat(source_path)
+    except OSError:
+        return None
+    try:
+        os.symlink(source_path, internal_path)
+    except FileExistsError:
+        # a link to the same file left from an earlier import can be reused
+        if not (os.path.islink(internal_path) and os.readlink(internal_path) == source_path):
+            internal_path = source_path
+    except OSError:
+        internal_path = source_path
+    return internal_path, file_stats.st_size
+
+
+def import_files(user, source_paths, progress=None):
+    """
+    Register files located outside of braingine for a user.
+
+    The file system is probed in a thread pool and all rows are written with a single INSERT in one transaction.
+    Files already registered for the user are skipped, files which can't be read (e.g. removed in the meantime) are
+    left out without failing the others. File types and checksums are not computed here.
+
+    :param User user: owner of the imported files
+    :param list source_paths: absolute paths of the files to import
+    :param callable progress: called with the amount of probed files, the total amount of files and the paths of
+        the files which couldn't be read so far
+    :return: tuple with the ids of the created files and the paths of the files which couldn't be read
+    """
+    uploads_folder = os.path.join(current_app.config.get('BRAINGINE_ROOT'), current_app.config.get('DATA_FOLDER'), user.username, current_app.config.get('UPLOADS_FOLDER'))
+    candidates = [(source_path, os.path.join(uploads_folder, os.path.basename(source_path))) for source_path in source_paths]
+
+    # skip files already registered, under the link in the braingine folder or under their own path
+    known_paths = [path for candidate in candidates for path in candidate]
+    registered_paths = set(path for (path,) in ExperimentFile.query \
+                                                    .with_entities(ExperimentFile.path) \
+                                                    .filter(ExperimentFile.user_id == user.id, ExperimentFile.path.in_(known_paths)))
+    candidates = [(source_path, internal_path) for source_path, internal_path in candidates \
+                    if source_path not in registered_paths and internal_path not in registered_paths]
+    if not candidates:
+        return [], []
+
+    rows = []
+    failed_paths = []
+    detector = get_format_detector()
+    with ThreadPoolExecutor(max_workers=current_app.config.get('IMPORT_WORKERS')) as pool:
+        futures = [pool.submit(_probe_file, source_path, internal_path) for source_path, internal_path in candidates]
+        for probed, future in enumerate(futures, 1):
+            probe = future.result()
+            if probe is None:
+                source_path = candidates[probed - 1][0]
+                current_app.logger.warning("Could not import {}, it can't be read".format(source_path))
+                failed_paths.append(source_path)
+            else:
+                file_path, file_size = probe
+                filename = os.path.basename(file_path)
+                rows.append(dict(user_id=user.id, size_in_bytes=file_size, name=filename, display_name=filename, path=file_path, parent=None,
+                                mime_type=None, file_format_full=None, file_format=detector.short_format(None, filename), format_state='PENDING', is_upload=True))
+            if progress is not None:
+                progress(probed, len(candidates), failed_paths)
+    if not rows:
+        return [], failed_paths
+
+    files_table = ExperimentFile.__table__
+    result = db.session.execute(files_table.insert().values(rows).returning(files_table.c.id))
+    file_ids = [row[0] for row in result]
+    db.session.commit()
+
+    return file_ids, failed_paths
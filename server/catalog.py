@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+    server.catalog
+    ~~~~~~~~~~~~~~
+    pipeline and plot definitions parsed once per process and kept up to date by modification times
+"""
+import os, json, threading, time, hashlib
+from string import Template
+from flask import current_app
+from .models.pipeline import PipelineSchema
+from .models.plot import PlotSchema
+
+
+def _content_etag(data):
+    """
+    Build a strong entity tag from the serialized contents of a response
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class DefinitionCatalog(object):
+    """
+    In-memory catalog of the JSON definition files found (recursively) in a folder.
+
+    Revalidation costs one stat per folder and per definition file: folders are only listed again when their
+    modification time changed, files are only parsed again when their size, modification time or inode changed.
+    Revalidation happens at most once per check_interval seconds. The dumped list, every dumped definition and their
+    entity tags are built once per change and shared by all requests.
+    Each entry keeps the SHA256 checksum of its file and the object prepared for submitting jobs with this version of
+    the definition, see get_prepared.
+    """
+
+    class Entry(object):
+        def __init__(self, stat_key, checksum, definition, result):
+            self.stat_key = stat_key
+            self.checksum = checksum
+            self.definition = definition
+            self.result = result
+            self.etag = _content_etag(result)
+            self.prepared = None
+
+    def __init__(self, folder, schema, check_interval=1.0):
+        self.folder = folder
+        self.schema = schema
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._prepare_lock = threading.Lock()
+        self._checked_at = 0
+        # folder path -> (modification time, subfolders, definition files)
+        self._folders = {}
+        # definition file path -> entry
+        self._entries = {}
+        self._list_result = []
+        self._list_etag = _content_etag([])
+
+    def _list_folder(self, folder_path, folders, definition_files):
+        try:
+            mtime = os.stat(folder_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        listing = self._folders.get(folder_path)
+        if listing is None or listing[0] != mtime:
+            subfolders, json_files = [], []
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        subfolders.append(entry.path)
+                    elif entry.name.endswith('.json') and entry.is_file():
+                        json_files.append(entry.path)
+            listing = (mtime, subfolders, json_files)
+        folders[folder_path] = listing
+        definition_files.extend(listing[2])
+        for subfolder in listing[1]:
+            self._list_folder(subfolder, folders, definition_files)
+
+    def _load(self, path, stat_key):
+        try:
+            with open(path, 'rb') as definition_file:
+                contents = definition_file.read()
+            definition = json.loads(contents.decode('utf-8'))
+        except (OSError, ValueError) as e:
+            current_app.logger.warning("Could not load definition file {}: {}".format(path, e))
+            return None
+        return self.Entry(stat_key, hashlib.sha256(contents).hexdigest(), definition, self.schema.dump(definition).data)
+
+    def _revalidate(self):
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            folders, definition_files = {}, []
+            self._list_folder(self.folder, folders, definition_files)
+
+            entries = {}
+            changed = set(definition_files) != set(self._entries)
+            for path in definition_files:
+                try:
+                    file_stats = os.stat(path)
+                except FileNotFoundError:
+                    changed = True
+                    continue
+                stat_key = (file_stats.st_size, file_stats.st_mtime_ns, file_stats.st_ino)
+                entry = self._entries.get(path)
+                if entry is None or entry.stat_key != stat_key:
+                    previous_entry, entry = entry, self._load(path, stat_key)
+                    changed = True
+                    # files touched without changing their contents keep their prepared object
+                    if entry is not None and previous_entry is not None and entry.checksum == previous_entry.checksum:
+                        entry.prepared = previous_entry.prepared
+                if entry is not None:
+                    entries[path] = entry
+
+            if changed:
+                list_result = [entries[path].result for path in sorted(entries)]
+                self._list_result, self._list_etag = list_result, _content_etag(list_result)
+            self._entries = entries
+            self._folders = folders
+            self._checked_at = now
+
+    def get_list(self):
+        """
+        Get all definitions
+
+        :return: tuple with the dumped definitions and their entity tag
+        """
+        self._revalidate()
+        return self._list_result, self._list_etag
+
+    def get(self, uid):
+        """
+        Get a definition by its uid, stored as <folder>/<uid>/<uid>.json
+
+        :return: tuple with the dumped definition and its entity tag, or None if there is no such definition
+        """
+        entry = self.get_entry(uid)
+        if entry is None:
+            return None
+        return entry.result, entry.etag
+
+    def get_entry(self, uid):
+        """
+        Get the catalog entry of a definition by its uid, holding its parsed contents and checksum
+        """
+        self._revalidate()
+        return self._entries.get(os.path.join(self.folder, uid, '{}.json'.format(uid)))
+
+    def get_prepared(self, uid, prepare):
+        """
+        Get the object prepared for submitting jobs with a definition, memoized per checksum of the definition file
+
+        :param str uid: uid of the definition
+        :param callable prepare: called with the catalog entry if there is no prepared object for its checksum yet
+        :return: the prepared object, or None if there is no such definition
+        """
+        entry = self.get_entry(uid)
+        if entry is None:
+            return None
+        if entry.prepared is None:
+            with self._prepare_lock:
+                if entry.prepared is None:
+                    entry.prepared = prepare(entry)
+        return entry.prepared
+
+
+class PreparedDefinition(object):
+    """
+    What is needed to submit a job with a pipeline or plot, taken from its stored database entry.
+    Shared by concurrent requests, it must not be modified.
+
+    :param int id: id of the database entry of this version of the definition
+    :param tuple input_files: names of the inputs of type file
+    :param dict outputs: values of the outputs by name
+    """
+
+    def __init__(self, id, uid, filename, executor, command, input_files, outputs=None):
+        self.id = id
+        self.uid = uid
+        self.filename = filename
+        self.executor = executor
+        # compiled command template
+        self.command = Template(command)
+        self.input_files = tuple(input_files)
+        self.outputs = outputs or {}
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def _get_catalog(folder, schema_class):
+    key = (folder, schema_class)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = DefinitionCatalog(folder, schema_class(), check_interval=current_app.config.get('CATALOG_CHECK_INTERVAL'))
+            _catalogs[key] = catalog
+    return catalog
+
+
+def get_pipeline_catalog():
+    """
+    Return the catalog of the pipeline definitions of the current app
+    """
+    return _get_catalog(current_app.config.get('PIPELINES_STORAGE'), PipelineSchema)
+
+
+def get_plot_catalog():
+    """
+    Return the catalog of the plot definitions of the current app
+    """
+    return _get_catalog(current_app.config.get('PLOTS_STORAGE'), PlotSchema)
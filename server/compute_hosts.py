@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+    server.compute_hosts
+    ~~~~~~~~~~~~~~
+    selection of the compute host running a pipeline or plot, with the commands in flight per host shared by all
+    worker processes through redis
+"""
+import os, socket, threading, time, uuid
+import paramiko
+import redis
+from flask import current_app
+from .ssh_pool import get_ssh_pool
+
+
+class NoComputeHostError(Exception):
+    """Exception raised when every compute host is out of rotation after failing."""
+
+
+# KEYS: sets of the commands in flight on the candidate hosts in order of preference
+# ARGV: current time, lease expiry, lease token, then the slots of each candidate host
+_ACQUIRE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    redis.call('zremrangebyscore', key, '-inf', ARGV[1])
+    if redis.call('zcard', key) < tonumber(ARGV[3 + i]) then
+        redis.call('zadd', key, ARGV[2], ARGV[3])
+        return i
+    end
+end
+return 0
+"""
+
+# KEYS: sets of the commands in flight the leases are on
+# ARGV: lease expiry, then the lease token for each key
+# leases released in the meantime are not added again
+_RENEW_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    if redis.call('zscore', key, ARGV[1 + i]) then
+        redis.call('zadd', key, ARGV[1], ARGV[1 + i])
+    end
+end
+return 0
+"""
+
+
+class ComputeHost(object):
+
+    def __init__(self, hostname, slots, username=None, password=None):
+        self.hostname = hostname
+        self.slots = slots
+        self.username = username
+        self.password = password
+
+    def connection_pool(self):
+        return get_ssh_pool(self.hostname, self.username, self.password)
+
+
+class ComputeHostPool(object):
+    """
+    Hands out slots on a set of compute hosts.
+
+    Each host runs at most its amount of slots of commands at the same time, counted over all worker processes.
+    Commands in flight are kept in a sorted set per host, scored by the expiry of their lease. Leases are renewed by
+    the process running the command, so the slots of crashed workers are freed once their leases expire.
+    Hosts with the most free slots (relative to their capacity) are preferred, ties are broken by the load average
+    sampled on the host every load_interval seconds (0 disables sampling). Hosts failing to connect are left out for
+    retry_interval seconds.
+    """
+
+    def __init__(self, hosts, redis_url, lease_time=300, load_interval=0, retry_interval=60, poll_interval=1.0):
+        self.hosts = hosts
+        self.lease_time = lease_time
+        self.load_interval = load_interval
+        self.retry_interval = retry_interval
+        self.poll_interval = poll_interval
+        # leases are renewed outside of the app context
+        self._logger = current_app.logger
+        self._redis = redis.StrictRedis.from_url(redis_url)
+        self._acquire = self._redis.register_script(_ACQUIRE_SCRIPT)
+        self._renew = self._redis.register_script(_RENEW_SCRIPT)
+        self._lock = threading.Lock()
+        self._leases = {}
+        self._loads = {}
+        self._renewer = None
+
+    def _running_key(self, host):
+        return 'braingine-compute:{}:running'.format(host.hostname)
+
+    def _down_key(self, host):
+        return 'braingine-compute:{}:down'.format(host.hostname)
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.lease_time / 3.0)
+            with self._lock:
+                leases = list(self._leases.items())
+            if not leases:
+                continue
+            try:
+                self._renew(keys=[self._running_key(host) for token, host in leases],
+                            args=[time.time() + self.lease_time] + [token for token, host in leases])
+            except redis.RedisError as e:
+                self._logger.warning("Could not renew compute host leases: {}".format(e))
+
+    def _sample_load(self, host):
+        """
+        Get the 1 minute load average of a host per slot, sampled over a pooled connection at most every load_interval seconds
+        """
+        sampled_at, load = self._loads.get(host.hostname, (0, 0.0))
+        if time.time() - sampled_at >= self.load_interval:
+            with host.connection_pool().connection() as ssh:
+                stdin, stdout, stderr = ssh.exec_command('cat /proc/loadavg', timeout=self.poll_interval * 10)
+                load = float(stdout.read().split()[0]) / host.slots
+            self._loads[host.hostname] = (time.time(), load)
+        return load
+
+    def mark_down(self, host, error):
+        """
+        Take a host out of rotation for retry_interval seconds, in every worker process
+        """
+        self._logger.warning("Compute host {} taken out of rotation for {} seconds: {}".format(host.hostname, self.retry_interval, error))
+        self._redis.setex(self._down_key(host), self.retry_interval, 1)
+
+    def in_flight(self):
+        """
+        Get the amount of commands in flight by host
+        """
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        for host in self.hosts:
+            pipe.zcount(self._running_key(host), now, '+inf')
+        return {host.hostname: running for host, running in zip(self.hosts, pipe.execute())}
+
+    def _candidates(self):
+        """
+        Get the hosts in rotation with free slots, in order of preference
+        """
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        for host in self.hosts:
+            pipe.exists(self._down_key(host))
+            pipe.zcount(self._running_key(host), now, '+inf')
+        results = pipe.execute()
+        healthy = [(host, running) for host, down, running in zip(self.hosts, results[::2], results[1::2]) if not down]
+        if not healthy:
+            raise NoComputeHostError("All compute hosts are out of rotation")
+        candidates = []
+        for host, running in healthy:
+            if running >= host.slots:
+                continue
+            load = 0.0
+            if self.load_interval:
+                try:
+                    load = self._sample_load(host)
+                except (paramiko.SSHException, socket.error, EOFError, ValueError, IndexError) as e:
+                    self.mark_down(host, e)
+                    continue
+            candidates.append((-(host.slots - running) / float(host.slots), load, host))
+        candidates.sort(key=lambda candidate: candidate[:2])
+        return [host for free, load, host in candidates]
+
+    def acquire(self):
+        """
+        Take a slot on the preferred host, waiting until a slot gets free
+
+        :return: tuple with the host and the token to release the slot with
+        """
+        token = '{}:{}'.format(os.getpid(), uuid.uuid4().hex)
+        while True:
+            candidates = self._candidates()
+            if candidates:
+                now = time.time()
+                keys = [self._running_key(host) for host in candidates]
+                chosen = self._acquire(keys=keys, args=[now, now + self.lease_time, token] + [host.slots for host in candidates])
+                if chosen:
+                    host = candidates[chosen - 1]
+                    with self._lock:
+                        self._leases[token] = host
+                        if self._renewer is None:
+                            self._renewer = threading.Thread(target=self._renew_leases, daemon=True)
+                            self._renewer.start()
+                    return host, token
+            time.sleep(self.poll_interval)
+
+    def release(self, host, token):
+        with self._lock:
+            self._leases.pop(token, None)
+        try:
+            self._redis.zrem(self._running_key(host), token)
+        except redis.RedisError as e:
+            # the slot gets freed when its lease expires
+            self._logger.warning("Could not release slot on compute host {}: {}".format(host.hostname, e))
+
+
+_host_pools = {}
+_host_pools_lock = threading.Lock()
+
+
+def get_compute_hosts():
+    """
+    Return the compute host pool of the current process configured by COMPUTING_HOSTS, or holding only
+    COMPUTING_SERVER_IP without it
+    """
+    config = current_app.config
+    key = (os.getpid(), repr(config.get('COMPUTING_HOSTS')), config.get('COMPUTING_SERVER_IP'))
+    with _host_pools_lock:
+        pool = _host_pools.get(key)
+        if pool is None:
+            hosts = [ComputeHost(host['hostname'], host.get('slots', config.get('COMPUTING_HOST_SLOTS')), host.get('username'), host.get('password')) \
+                        for host in config.get('COMPUTING_HOSTS') or [{'hostname': config.get('COMPUTING_SERVER_IP')}]]
+            pool = ComputeHostPool(hosts, config.get('COMPUTING_HOSTS_REDIS_URL'),
+                                   lease_time=config.get('COMPUTING_HOST_LEASE_TIME'),
+                                   load_interval=config.get('COMPUTING_HOST_LOAD_INTERVAL'),
+                                   retry_interval=config.get('COMPUTING_HOST_RETRY_INTERVAL'))
+            _host_pools[key] = pool
+    return pool
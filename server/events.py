@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+    server.events
+    ~~~~~~~~~~~~~~
+    per-user notifications about running analyses and visualizations, delivered through redis pub/sub
+"""
+import json, threading, time
+import redis
+from flask import current_app
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# KEYS: sequence key, history key, channel
+# ARGV: event without id as a JSON object, history size, history ttl
+# runs atomically, so events are published in the order of their ids
+_PUBLISH_SCRIPT = """
+local event_id = redis.call('incr', KEYS[1])
+local event = '{"id": ' .. event_id .. ', ' .. string.sub(ARGV[1], 2)
+redis.call('rpush', KEYS[2], event)
+redis.call('ltrim', KEYS[2], -tonumber(ARGV[2]), -1)
+redis.call('expire', KEYS[2], ARGV[3])
+redis.call('publish', KEYS[3], event)
+return event_id
+"""
+
+
+def get_redis():
+    """
+    Return the redis client for the events of the current app, its connection pool is shared by all threads
+    """
+    return _get_client()[0]
+
+
+def _get_client():
+    url = current_app.config.get('EVENTS_REDIS_URL')
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            redis_client = redis.StrictRedis.from_url(url)
+            client = (redis_client, redis_client.register_script(_PUBLISH_SCRIPT))
+            _clients[url] = client
+    return client
+
+
+def _history_key(user_id):
+    return 'braingine-events:{}'.format(user_id)
+
+
+def _sequence_key(user_id):
+    return 'braingine-events:{}:seq'.format(user_id)
+
+
+def _channel(user_id):
+    return 'braingine-events:{}:channel'.format(user_id)
+
+
+def publish_event(user_id, event_type, data):
+    """
+    Send an event to the event streams of a user.
+
+    Events get increasing ids per user. The last EVENTS_HISTORY_SIZE events are kept, so clients reconnecting with
+    the id of the last event they received don't miss any. Publishing never fails the caller, a lost notification
+    is only logged.
+
+    :param int user_id: id of the user to notify
+    :param str event_type: type of the event, e.g. 'analysis'
+    :param dict data: contents of the event
+    """
+    try:
+        publish = _get_client()[1]
+        publish(keys=[_sequence_key(user_id), _history_key(user_id), _channel(user_id)],
+                args=[json.dumps({'type': event_type, 'data': data}), current_app.config.get('EVENTS_HISTORY_SIZE'), current_app.config.get('EVENTS_HISTORY_TTL')])
+    except redis.RedisError as e:
+        current_app.logger.warning("Could not publish {} event for user {}: {}".format(event_type, user_id, e))
+
+
+def get_events(user_id, last_event_id=0):
+    """
+    Get the kept events of a user sent after the given event id
+    """
+    events = (json.loads(event.decode('utf-8')) for event in get_redis().lrange(_history_key(user_id), 0, -1))
+    return [event for event in events if event['id'] > last_event_id]
+
+
+def listen(user_id, last_event_id=0, timeout=60):
+    """
+    Wait for the events of a user sent after the given event id
+
+    Events missed since last_event_id are returned first. Yields None whenever no event arrived for a second, so
+    callers can send heartbeats or stop early. Ends after timeout seconds.
+    """
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    # subscribe before reading the kept events, so no event gets lost in between
+    pubsub.subscribe(_channel(user_id))
+    try:
+        for event in get_events(user_id, last_event_id):
+            last_event_id = event['id']
+            yield event
+        ends_at = time.time() + timeout
+        while time.time() < ends_at:
+            message = pubsub.get_message(timeout=1.0)
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message['data'].decode('utf-8'))
+            if event['id'] > last_event_id:
+                last_event_id = event['id']
+                yield event
+    finally:
+        pubsub.close()
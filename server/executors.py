@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+    server.executors
+    ~~~~~~~~~~~~~~
+    backends running pipeline and plot commands, either on the compute hosts through SSH or on the worker host
+"""
+import os, shlex, signal, socket, subprocess, threading, time
+import paramiko
+from flask import current_app
+from .compute_hosts import get_compute_hosts
+from .utils import create_folder, stream_channel_output
+
+
+class SSHExecutor(object):
+    """
+    Runs commands on the compute hosts over the pooled SSH connections of the worker process.
+
+    Each command takes a slot on the host picked by the compute host pool. Hosts failing before the command started
+    are taken out of rotation and the command is tried on another host.
+    With a timeout, commands run under coreutils' timeout on the host, which terminates their whole process group
+    (and kills it kill_grace_period seconds later), so the slot is only freed once the command really stopped.
+    """
+
+    # exit code of coreutils' timeout when the command timed out
+    TIMEOUT_EXIT_CODE = 124
+
+    def __init__(self, hosts, batch_size=64 * 1024, flush_interval=1.0, timeout=None, kill_grace_period=10):
+        self.hosts = hosts
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.kill_grace_period = kill_grace_period
+
+    def run(self, command, stdout_path, stderr_path):
+        stream_timeout = None
+        if self.timeout:
+            command = 'timeout --kill-after={} {} sh -c {}'.format(self.kill_grace_period, self.timeout, shlex.quote(command))
+            # only a lost connection should make the worker give up on the command before the host stopped it
+            stream_timeout = self.timeout + 2 * self.kill_grace_period
+        while True:
+            host, token = self.hosts.acquire()
+            started = False
+            try:
+                # reuse a connection of the worker's pool, opening one takes a key exchange and authentication
+                with host.connection_pool().connection() as ssh:
+                    channel = ssh.open_session()
+                    started_at = time.time()
+                    channel.exec_command(command)
+                    started = True
+                    exit_code = stream_channel_output(channel, stdout_path, stderr_path, batch_size=self.batch_size,
+                                                      flush_interval=self.flush_interval, timeout=stream_timeout)
+                if self.timeout and exit_code == self.TIMEOUT_EXIT_CODE and time.time() - started_at >= self.timeout:
+                    raise TimeoutError("Command did not finish within {} seconds".format(self.timeout))
+                return exit_code
+            except (paramiko.SSHException, socket.error, EOFError) as e:
+                if started:
+                    raise
+                self.hosts.mark_down(host, e)
+            finally:
+                self.hosts.release(host, token)
+
+
+class LocalExecutor(object):
+    """
+    Runs commands through a shell on the worker host, for workers having the storage and the tools at hand.
+
+    Output is written by the command straight into the log files, so it can be followed while the command runs.
+    Every task runs one command at a time, so the concurrency of the celery worker (-c) limits the amount of commands
+    running on the host. Commands running longer than timeout seconds get their process group terminated.
+    """
+
+    def __init__(self, timeout=None, kill_grace_period=10):
+        self.timeout = timeout
+        self.kill_grace_period = kill_grace_period
+
+    def run(self, command, stdout_path, stderr_path):
+        with open(stdout_path, 'ab') as stdout, open(stderr_path, 'ab') as stderr:
+            # own process group, so commands starting several processes get terminated as a whole
+            process = subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=stdout, stderr=stderr, start_new_session=True)
+            try:
+                return process.wait(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self._terminate(process)
+                raise TimeoutError("Command did not finish within {} seconds".format(self.timeout))
+            except BaseException:
+                # e.g. the celery task got revoked
+                self._terminate(process)
+                raise
+
+    def _terminate(self, process):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=self.kill_grace_period)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        except ProcessLookupError:
+            pass
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the executor configured by EXECUTOR ('ssh' or 'local') for the current process
+    """
+    key = (os.getpid(), current_app.config.get('EXECUTOR'))
+    with _executors_lock:
+        executor = _executors.get(key)
+        if executor is None:
+            if key[1] == 'local':
+                executor = LocalExecutor(timeout=current_app.config.get('EXECUTOR_TIMEOUT'))
+            elif key[1] == 'ssh':
+                executor = SSHExecutor(get_compute_hosts(), batch_size=current_app.config.get('LOG_BATCH_SIZE'),
+                                       flush_interval=current_app.config.get('LOG_FLUSH_INTERVAL'),
+                                       timeout=current_app.config.get('EXECUTOR_TIMEOUT'))
+            else:
+                raise ValueError("Unknown executor {}".format(key[1]))
+            _executors[key] = executor
+    return executor
+
+
+def run_command(command, output_folder=None):
+    """
+    Run a command with the configured executor, appending its stdout to log.out and its stderr to error.out in the
+    output folder while it runs. Output is discarded without output folder.
+
+    :return: exit code of the command
+    """
+    if output_folder is None:
+        stdout_path = stderr_path = os.devnull
+    else:
+        create_folder(output_folder)
+        stdout_path, stderr_path = os.path.join(output_folder, 'log.out'), os.path.join(output_folder, 'error.out')
+    return get_executor().run(command, stdout_path, stderr_path)
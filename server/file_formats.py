@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+    server.file_formats
+    ~~~~~~~~~~~~~~
+    file type detection with the magic databases and the format matching table loaded once per process
+"""
+import os, re, json, threading, queue, time
+from contextlib import contextmanager
+import magic
+from flask import current_app
+
+
+class FormatDetector(object):
+    """
+    Detects file types using a pool of compiled magic handles and a table of precompiled format regexes.
+
+    Compiling the bioinformatics magic file and the format regexes is done once per process instead of once per file.
+    Both get reloaded when the modification time of their resource file changes.
+    Magic handles are not thread-safe, each one is borrowed by a single thread at a time.
+    """
+
+    def __init__(self, magic_file, formats_file, pool_size=4, check_interval=1.0):
+        self.magic_file = magic_file
+        self.formats_file = formats_file
+        self.pool_size = pool_size
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._checked_at = 0
+        self._generation = 0
+        self._pools = {}
+        self._format_table = []
+
+    def _reload_if_changed(self):
+        now = time.time()
+        if now - self._checked_at < self.check_interval:
+            return
+        mtimes = (os.stat(self.magic_file).st_mtime_ns, os.stat(self.formats_file).st_mtime_ns)
+        with self._lock:
+            self._checked_at = now
+            if mtimes == self._mtimes:
+                return
+            with open(self.formats_file) as formats_file:
+                matching = json.load(formats_file)
+            self._format_table = [(re.compile(regex), file_format) for regex, file_format in matching.items()]
+            # handles compiled from the former magic file are dropped when given back
+            self._pools = {}
+            self._generation += 1
+            self._mtimes = mtimes
+
+    @contextmanager
+    def _magic_handles(self, uncompress):
+        """
+        Borrow a pair of magic handles, one for the bioinformatic file type and one for the mime type
+        """
+        self._reload_if_changed()
+        with self._lock:
+            pool = self._pools.setdefault(uncompress, queue.LifoQueue(maxsize=self.pool_size))
+            generation = self._generation
+        try:
+            handles = pool.get_nowait()
+        except queue.Empty:
+            handles = (magic.Magic(magic_file=self.magic_file, uncompress=uncompress), magic.Magic(mime=True, uncompress=False))
+        try:
+            yield handles
+        finally:
+            if generation == self._generation:
+                try:
+                    pool.put_nowait(handles)
+                except queue.Full:
+                    pass
+
+    def detect(self, path, uncompress=True):
+        """
+        Detect the type of a file
+
+        :param str path: path of the file
+        :param bool uncompress: look into compressed files to detect the type of their contents
+        :return: tuple with the full file format and the mime type
+        """
+        with self._magic_handles(uncompress) as (fh_magic, fh_mime):
+            return fh_magic.from_file(path), fh_mime.from_file(path)
+
+    def detect_header(self, path, max_bytes, uncompress=True):
+        """
+        Detect the type of a file from its first bytes only, reading at most max_bytes however large the file is
+
+        :return: tuple with the full file format and the mime type
+        """
+        with open(path, 'rb') as f:
+            header = f.read(max_bytes)
+        with self._magic_handles(uncompress) as (fh_magic, fh_mime):
+            return fh_magic.from_buffer(header), fh_mime.from_buffer(header)
+
+    def short_format(self, file_format_full, filename):
+        """
+        Get the short file format name using the full file format returned by magic, falling back to the file extension
+        """
+        self._reload_if_changed()
+        if file_format_full is not None:
+            for regex, file_format in self._format_table:
+                if regex.search(file_format_full):
+                    return file_format
+        file_extension = os.path.splitext(filename)[1][1:]
+        return file_extension
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_format_detector():
+    """
+    Return the format detector of the current process for the resource files configured in the current app
+    """
+    # processes forked from a parent (uWSGI and Celery workers) create their own handles
+    key = (os.getpid(), current_app.config.get('BIOINFO_MAGIC_FILE'), current_app.config.get('FILE_FORMATS'))
+    with _detectors_lock:
+        detector = _detectors.get(key)
+        if detector is None:
+            detector = FormatDetector(key[1], key[2], pool_size=current_app.config.get('MAGIC_POOL_SIZE'))
+            _detectors[key] = detector
+    return detector
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    server.illumina_index
+    ~~~~~~~~~~~~~~
+    index of the run folders and fastq files in the Illumina share
+"""
+import os, time
+from datetime import datetime
+from flask import current_app
+from . import db
+from .models.illumina_run import IlluminaRun, IlluminaRunFile
+
+
+def parse_run_date(folder_uid):
+    """
+    Get the date of a run out of its folder name, which starts with the date as YYMMDD (e.g. 171031_NB501...)
+    """
+    try:
+        return datetime.strptime(folder_uid[:6], '%y%m%d').date()
+    except ValueError:
+        return None
+
+
+def _scan_fastq_files(fastq_folder):
+    """
+    Return name, size and modification time of the fastq files in a run's fastq folder
+    """
+    fastq_files = []
+    try:
+        with os.scandir(fastq_folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.name.endswith('.fastq.gz') or not entry.is_file():
+                    continue
+                file_stats = entry.stat()
+                fastq_files.append((entry.name, file_stats.st_size, file_stats.st_mtime_ns))
+    except FileNotFoundError:
+        pass
+    return fastq_files
+
+
+def refresh_illumina_index():
+    """
+    Bring the index up to date with the Illumina share.
+
+    Only run folders whose own or fastq folder's modification time changed are read again. Runs with files modified
+    within the last ILLUMINA_SETTLE_TIME seconds are read again anyway, since files still being written don't change
+    their folder's modification time.
+
+    :return: amount of runs read again
+    """
+    root = current_app.config.get('ILLUMINA_ROOT')
+    settle_time_ns = current_app.config.get('ILLUMINA_SETTLE_TIME') * 10**9
+    now_ns = time.time() * 10**9
+
+    runs = {run.folder_uid: run for run in IlluminaRun.query}
+    latest_mtimes = dict(db.session.query(IlluminaRunFile.run_id, db.func.max(IlluminaRunFile.mtime)).group_by(IlluminaRunFile.run_id))
+    seen = set()
+    refreshed = 0
+
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            seen.add(entry.name)
+            folder_mtime = entry.stat().st_mtime_ns
+            fastq_folder = os.path.join(entry.path, current_app.config.get('ILLUMINA_FASTQ_FOLDER'))
+            try:
+                fastq_mtime = os.stat(fastq_folder).st_mtime_ns
+            except FileNotFoundError:
+                fastq_mtime = None
+
+            run = runs.get(entry.name)
+            if run is not None and run.folder_mtime == folder_mtime and run.fastq_mtime == fastq_mtime \
+                    and now_ns - latest_mtimes.get(run.id, 0) > settle_time_ns:
+                continue
+
+            if run is None:
+                run = IlluminaRun(folder_uid=entry.name, run_date=parse_run_date(entry.name))
+                db.session.add(run)
+            else:
+                run.files.delete()
+            run.folder_mtime = folder_mtime
+            run.fastq_mtime = fastq_mtime
+            # files may have changed without changing the folders
+            run.updated_at = db.func.current_timestamp()
+            for name, size_in_bytes, mtime in _scan_fastq_files(fastq_folder):
+                run.files.append(IlluminaRunFile(name=name, size_in_bytes=size_in_bytes, mtime=mtime))
+            refreshed += 1
+
+    # remove runs deleted from the share
+    for folder_uid, run in runs.items():
+        if folder_uid not in seen:
+            db.session.delete(run)
+
+    db.session.commit()
+    return refreshed
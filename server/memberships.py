@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+    server.memberships
+    ~~~~~~~~~~~~~~
+    set-based adding and removing of files to and from collections and databoxes
+"""
+from sqlalchemy import text
+from . import db
+
+# owner table and owner column of the association table, by association table
+_OWNERS = {
+    'collections_to_files': ('collections', 'collection_id'),
+    'databoxes_to_files': ('databoxes', 'databox_id'),
+}
+
+# rows are only added for an owner and files of the given user, duplicates are skipped by the unique constraint
+_INSERT_MEMBERS = """
+    INSERT INTO {association} ({owner_column}, file_id)
+    SELECT owner.id, files.id FROM {owners} AS owner JOIN files ON files.user_id = owner.user_id
+    WHERE owner.id = :owner_id AND owner.user_id = :user_id AND files.id = ANY(:file_ids)
+    ON CONFLICT DO NOTHING
+"""
+
+_DELETE_MEMBERS = """
+    DELETE FROM {association} AS member USING {owners} AS owner
+    WHERE member.{owner_column} = owner.id AND owner.id = :owner_id AND owner.user_id = :user_id
+    AND member.file_id = ANY(:file_ids)
+"""
+
+
+def _execute(statement, association, owner_id, user_id, file_ids):
+    file_ids = sorted(set(file_ids))
+    if not file_ids:
+        return 0
+    owners, owner_column = _OWNERS[association]
+    sql = text(statement.format(association=association, owners=owners, owner_column=owner_column))
+    result = db.session.execute(sql, {'owner_id': owner_id, 'user_id': user_id, 'file_ids': file_ids})
+    return result.rowcount
+
+
+def add_files(association, owner_id, user_id, file_ids):
+    """
+    Add files to a collection or databox with a single INSERT ... SELECT. Only files of the user are added, and only
+    if the collection or databox belongs to the user too. Files already added are skipped. The caller has to commit
+    the session.
+
+    :param str association: 'collections_to_files' or 'databoxes_to_files'
+    :param int owner_id: id of the collection or databox
+    :param int user_id: id of the user making the change
+    :param list file_ids: ids of the files to add
+    :return: amount of added files
+    """
+    return _execute(_INSERT_MEMBERS, association, owner_id, user_id, file_ids)
+
+
+def remove_files(association, owner_id, user_id, file_ids):
+    """
+    Remove files from a collection or databox of the user with a single DELETE. The caller has to commit the session.
+
+    :return: amount of removed files
+    """
+    return _execute(_DELETE_MEMBERS, association, owner_id, user_id, file_ids)
@@ -6,6 +6,7 @@ from .base import Base, BaseSchema
 from .user import User
 from .file import ExperimentFile
 from marshmallow import fields
+from sqlalchemy.orm import subqueryload
 
 
 class AnalysisParameter(Base):
@@ -80,18 +81,30 @@ class Analysis(Base):
     pipeline_id = db.Column(db.Integer(), db.ForeignKey("pipelines.id"))
     pipeline_uid = db.Column(db.String(), nullable=False, default='')
     state = db.Column(db.String(15), nullable=False, default='PENDING')
+    # id of the celery task running the pipeline
+    task_id = db.Column(db.String(155), nullable=True, index=True)
 
     # one-to-many relationship to experiment analysis parameters
     # An experiment analysis contains one or more parameters
-    parameters = db.relationship('AnalysisParameter', backref='analysis', lazy='dynamic', cascade="all, delete-orphan")
+    parameters = db.relationship('AnalysisParameter', backref='analysis', lazy='select', cascade="all, delete-orphan")
 
     # many-to-many relationship
     # one analysis can contain many input file, one file can be input of many analyses
-    input_files = db.relationship('AssociationAnalysesInputFiles', lazy='dynamic', cascade="all, delete-orphan")
+    input_files = db.relationship('AssociationAnalysesInputFiles', lazy='select', cascade="all, delete-orphan")
 
     # many-to-one relationship
     # one analysis can contain many output file, one file can only be output of one analysis
-    output_files = db.relationship('AssociationAnalysesOutputFiles', lazy='dynamic', cascade="all, delete-orphan")
+    output_files = db.relationship('AssociationAnalysesOutputFiles', lazy='select', cascade="all, delete-orphan")
+
+    # listings of a user filtered by state and sorted by creation, see api_utils.create_filter
+    __table_args__ = (
+        db.Index('ix_analyses_user_id_state', 'user_id', 'state'),
+        db.Index('ix_analyses_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    # columns list endpoints can filter and sort by, see api_utils.create_filter and api_utils.create_sorting
+    filter_columns = ('id', 'pipeline_id', 'pipeline_uid', 'state', 'created_at', 'updated_at')
+    sort_columns = ('pipeline_uid', 'state', 'created_at', 'updated_at')
 
     def __init__(self, user_id, pipeline_id, pipeline_uid):
         self.user_id = user_id
@@ -101,12 +114,21 @@ class Analysis(Base):
     def __repr__(self):
         return '<Analysis {}>'.format(self.id)
 
+    @classmethod
+    def query_with_relationships(cls):
+        """
+        Query analyses loading their parameters, input and output files with one additional query each, whatever the
+        amount of analyses
+        """
+        return cls.query.options(subqueryload(cls.parameters), subqueryload(cls.input_files), subqueryload(cls.output_files))
+
 
 class AnalysisSchema(BaseSchema):
     user_id = fields.Int(dump_only=True)
     pipeline_id = fields.Int(dump_only=True)
     pipeline_uid = fields.Str()
     state = fields.Str()
+    task_id = fields.Str(dump_only=True)
     parameters = fields.Nested('AnalysisParameterSchema', many=True)
     input_files = fields.Nested('AnalysisInputFileSchema', many=True)
     output_files = fields.Nested('AnalysisOutputFileSchema', many=True)
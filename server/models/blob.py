@@ -0,0 +1,57 @@
+from .. import db
+from ..utils import silent_remove
+from .base import Base, BaseSchema
+from marshmallow import fields
+
+
+class Blob(Base):
+    """
+    Contents of a file stored once under its checksum and shared by all files with the same contents.
+
+    Files reference a blob through a hard link (or a symbolic link if hard linking is not possible),
+    the blob itself gets removed when its last reference is gone.
+    """
+
+    __tablename__ = "blobs"
+
+    # Attributes
+    checksum = db.Column(db.String(64), nullable=False, unique=True)
+    path = db.Column(db.String(255), nullable=False)
+    size_in_bytes = db.Column(db.BigInteger)
+    # amount of files referencing this blob
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # constructor
+    def __init__(self, checksum, path, size_in_bytes, ref_count=0):
+        self.checksum = checksum
+        self.path = path
+        self.size_in_bytes = size_in_bytes
+        self.ref_count = ref_count
+
+    def __repr__(self):
+        return '<Blob {}>'.format(self.checksum)
+
+
+# Marshmallow schema for blob
+class BlobSchema(BaseSchema):
+    checksum = fields.Str(dump_only=True)
+    size_in_bytes = fields.Int(dump_only=True)
+
+    class Meta:
+        strict = True
+
+
+def release_blob(connection, blob_id):
+    """
+    Drop a reference to a blob and remove it once no file references it anymore.
+
+    Uses the given connection directly, so it can be called from within mapper events.
+    """
+    blobs = Blob.__table__
+    blob = connection.execute(blobs.update() \
+                                .where(blobs.c.id == blob_id) \
+                                .values(ref_count=blobs.c.ref_count - 1) \
+                                .returning(blobs.c.ref_count, blobs.c.path)).first()
+    if blob is not None and blob.ref_count <= 0:
+        connection.execute(blobs.delete().where(blobs.c.id == blob_id))
+        silent_remove(blob.path)
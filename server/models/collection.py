@@ -6,11 +6,15 @@ from .base import Base, BaseSchema
 from .user import User
 from .file import ExperimentFile, ExperimentFileSchema
 from marshmallow import fields
+from sqlalchemy import DDL
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 
 association_collection_to_file = db.Table('collections_to_files', Base.metadata,
     db.Column('collection_id', db.Integer, db.ForeignKey('collections.id', ondelete="CASCADE")),
-    db.Column('file_id', db.Integer, db.ForeignKey('files.id', ondelete="CASCADE"))
+    db.Column('file_id', db.Integer, db.ForeignKey('files.id', ondelete="CASCADE")),
+    # a file is in a collection once, see memberships.add_files
+    db.UniqueConstraint('collection_id', 'file_id', name='uq_collections_to_files_collection_id_file_id')
 )
 
 class Collection(Base):
@@ -21,12 +25,27 @@ class Collection(Base):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     name = db.Column(db.String(255))
     description = db.Column(db.Text)
+    # words of name and description for full-text search, kept up to date by a trigger (see below)
+    search_vector = db.Column(TSVECTOR, nullable=True)
     files = db.relationship(
         "ExperimentFile",
         secondary=association_collection_to_file,
         backref="collections",
         lazy='dynamic')
 
+    # keyset pagination by each sortable column, see api_utils.paginate_by_cursor
+    __table_args__ = (
+        db.Index('ix_collections_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_collections_created_at_id', 'created_at', 'id'),
+        # q search, see search.search_query
+        db.Index('ix_collections_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_collections_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+
+    # columns list endpoints can filter and sort by, see api_utils.create_filter and api_utils.create_sorting
+    filter_columns = ('id', 'user_id', 'name', 'created_at', 'updated_at')
+    sort_columns = ('name', 'created_at', 'updated_at')
+
     # constructor
     def __init__(self, user_id, name, description):
         self.user_id = user_id
@@ -48,3 +67,10 @@ class CollectionSchema(BaseSchema):
 
     class Meta:
         strict = True
+
+
+# trigram indexes need the pg_trgm extension, the search vector is computed by postgres' built-in trigger function
+db.event.listen(Collection.__table__, 'before_create', DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+db.event.listen(Collection.__table__, 'after_create', DDL(
+    "CREATE TRIGGER collections_search_vector_update BEFORE INSERT OR UPDATE OF name, description ON collections "
+    "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.simple', name, description)"))
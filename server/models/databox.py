@@ -6,7 +6,9 @@ from marshmallow import fields
 
 association_databox_to_file = db.Table('databoxes_to_files', Base.metadata,
     db.Column('databox_id', db.Integer, db.ForeignKey('databoxes.id', ondelete="CASCADE")),
-    db.Column('file_id', db.Integer, db.ForeignKey('files.id', ondelete="CASCADE"))
+    db.Column('file_id', db.Integer, db.ForeignKey('files.id', ondelete="CASCADE")),
+    # a file is in a databox once, see memberships.add_files
+    db.UniqueConstraint('databox_id', 'file_id', name='uq_databoxes_to_files_databox_id_file_id')
 )
 
 class DataBox(Base):
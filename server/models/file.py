@@ -2,10 +2,13 @@ from flask import current_app
 from .. import db
 import os
 from ..utils import silent_remove, sha1_string
+from ..file_formats import get_format_detector
 from .base import Base, BaseSchema, same_as
 from .user import User
+from .blob import release_blob
 from marshmallow import fields
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy import DDL
+from sqlalchemy.dialects.postgresql import JSON, TSVECTOR
 
 class ExperimentFile(Base):
 
@@ -28,13 +31,44 @@ class ExperimentFile(Base):
     mime_type = db.Column(db.String(255))
     file_format = db.Column(db.String(35))
     file_format_full = db.Column(db.String(255))
+    # state of the file type detection, which runs in the background for uploaded and imported files
+    format_state = db.Column(db.String(15), nullable=False, default='SUCCESS', server_default='SUCCESS')
     is_upload = db.Column(db.Boolean, nullable=False, default=False)
+    # checksum of the file contents, see utils.combine_block_digests
+    # it gets computed while uploading or in the background after importing a file
+    checksum = db.Column(db.String(64), nullable=True, index=True)
+    # stored contents shared with other files having the same checksum
+    blob_id = db.Column(db.Integer(), db.ForeignKey("blobs.id", ondelete="SET NULL"), nullable=True)
+    blob = db.relationship('Blob')
 
     # set of annotation information
     annotation = db.Column(JSON(none_as_null=True), nullable=True)
+    # words of name, display name and file format for full-text search, kept up to date by a trigger (see below)
+    search_vector = db.Column(TSVECTOR, nullable=True)
+
+    # keyset pagination of the files of a user by each cursor column, see api_utils.paginate_by_cursor
+    __table_args__ = (
+        db.Index('ix_files_user_id_updated_at_id', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_files_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_files_user_id_name_id', 'user_id', 'name', 'id'),
+        # common where filters, see api_utils.create_filter
+        db.Index('ix_files_user_id_is_upload_updated_at', 'user_id', 'is_upload', 'updated_at'),
+        db.Index('ix_files_user_id_file_format', 'user_id', 'file_format'),
+        # $prefix filters are LIKE 'value%', which only pattern ops indexes serve in non-C locales
+        db.Index('ix_files_user_id_name_pattern', 'user_id', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}),
+        # q search, see search.search_query
+        db.Index('ix_files_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_files_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_files_display_name_trgm', 'display_name', postgresql_using='gin', postgresql_ops={'display_name': 'gin_trgm_ops'}),
+    )
+
+    # columns list endpoints can filter and sort by, see api_utils.create_filter and api_utils.create_sorting
+    filter_columns = ('id', 'name', 'display_name', 'size_in_bytes', 'parent', 'mime_type', 'file_format', 'format_state',
+                      'is_upload', 'checksum', 'created_at', 'updated_at')
+    sort_columns = ('name', 'display_name', 'size_in_bytes', 'file_format', 'created_at', 'updated_at')
 
     # constructor
-    def __init__(self, user_id, size_in_bytes, name, path, mime_type, file_format_full, is_upload=False, parent=None, display_name=None):
+    def __init__(self, user_id, size_in_bytes, name, path, mime_type, file_format_full, is_upload=False, parent=None, display_name=None, checksum=None):
         self.user_id = user_id
         self.size_in_bytes = size_in_bytes
         self.name = name
@@ -44,7 +78,10 @@ class ExperimentFile(Base):
         self.mime_type = mime_type
         self.file_format_full = file_format_full
         self.file_format = self.get_file_format(self.file_format_full, self.name)
+        # file type not known yet, see tasks.detect_file_format
+        self.format_state = 'PENDING' if file_format_full is None else 'SUCCESS'
         self.is_upload = is_upload
+        self.checksum = checksum
 
     def __repr__(self):
         return '<Experiment file {}>'.format(self.id)
@@ -53,16 +90,7 @@ class ExperimentFile(Base):
         """
         Get the short file format name using the full file format returned by magic
         """
-        import json, re
-        with open(current_app.config.get('FILE_FORMATS')) as formats_file:
-            matching = json.load(formats_file)
-        # try using the full file format detected by magic
-        for regex, file_format in matching.items():
-            if (re.search(regex, file_format_full)):
-                return file_format
-        # fall back to file extension
-        file_extension = os.path.splitext(filename)[1][1:]
-        return file_extension
+        return get_format_detector().short_format(file_format_full, filename)
 
 
 # Marshmallow schema for experiment file
@@ -77,19 +105,31 @@ class ExperimentFileSchema(BaseSchema):
     mime_type = fields.Str(dump_only=True)
     file_format = fields.Str()
     file_format_full = fields.Str()
+    format_state = fields.Str(dump_only=True)
     is_upload = fields.Bool()
+    checksum = fields.Str(dump_only=True)
     annotation = fields.Dict(missing=None)
 
     class Meta:
         strict = True
 
 
+# trigram indexes need the pg_trgm extension, the search vector is computed by postgres' built-in trigger function
+db.event.listen(ExperimentFile.__table__, 'before_create', DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+db.event.listen(ExperimentFile.__table__, 'after_create', DDL(
+    "CREATE TRIGGER files_search_vector_update BEFORE INSERT OR UPDATE OF name, display_name, file_format ON files "
+    "FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger(search_vector, 'pg_catalog.simple', name, display_name, file_format)"))
+
+
 @db.event.listens_for(ExperimentFile, 'after_delete')
 def remove_file_after_delete(mapper, connection, target):
     """
     Remove file from filesystem after row gets deleted in database
     """
     silent_remove(target.path)
+    # the contents themselves are removed together with the last file referencing them
+    if target.blob_id is not None:
+        release_blob(connection, target.blob_id)
 
 
 # @db.event.listens_for(ExperimentFile, 'before_insert')
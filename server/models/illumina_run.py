@@ -0,0 +1,49 @@
+from .. import db
+from .base import Base
+
+
+class IlluminaRun(Base):
+    """
+    Index entry of a run folder in the Illumina share, refreshed periodically by tasks.scan_illumina_runs
+    """
+
+    __tablename__ = "illumina_runs"
+
+    # Attributes
+    folder_uid = db.Column(db.String(255), nullable=False, unique=True)
+    # date of the run, taken from the YYMMDD prefix of the folder name
+    run_date = db.Column(db.Date, nullable=True, index=True)
+    # modification times (ns) of the run folder and its fastq folder at the last scan
+    folder_mtime = db.Column(db.BigInteger)
+    fastq_mtime = db.Column(db.BigInteger, nullable=True)
+    files = db.relationship('IlluminaRunFile', backref='run', lazy='dynamic', cascade="all, delete-orphan")
+
+    # constructor
+    def __init__(self, folder_uid, run_date):
+        self.folder_uid = folder_uid
+        self.run_date = run_date
+
+    def __repr__(self):
+        return '<Illumina run {}>'.format(self.folder_uid)
+
+
+class IlluminaRunFile(Base):
+
+    __tablename__ = "illumina_run_files"
+
+    # Attributes
+    run_id = db.Column(db.Integer, db.ForeignKey('illumina_runs.id', ondelete="CASCADE"), index=True)
+    name = db.Column(db.String(255), nullable=False)
+    size_in_bytes = db.Column(db.BigInteger)
+    # modification time (ns) of the file at the last scan
+    mtime = db.Column(db.BigInteger)
+
+    # constructor
+    def __init__(self, name, size_in_bytes, mtime):
+        self.name = name
+        self.size_in_bytes = size_in_bytes
+        self.mtime = mtime
+
+    def __repr__(self):
+        return '<Illumina run file {}>'.format(self.name)
+
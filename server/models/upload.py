@@ -0,0 +1,75 @@
+from .. import db
+from .base import Base, BaseSchema
+from marshmallow import fields
+from sqlalchemy.dialects.postgresql import JSON
+
+
+class UploadSession(Base):
+    """
+    A chunked file upload in progress.
+
+    Chunks can arrive in any order and over several connections at the same time. Every chunk is written at its
+    own offset within a part file of the session and its byte range gets recorded here, so the upload can be resumed
+    after a dropped connection and finalized once the received ranges cover the whole file, moving the part file
+    into the uploads folder of the user.
+    """
+
+    __tablename__ = "upload_sessions"
+
+    # Attributes
+    user_id = db.Column(db.Integer(), db.ForeignKey("users.id", ondelete="CASCADE"))
+    filename = db.Column(db.String(255), nullable=False, default='')
+    path = db.Column(db.String(255), nullable=False, default='')
+    # total size of the file being uploaded
+    size_in_bytes = db.Column(db.BigInteger, nullable=False)
+    # sorted list of non-overlapping [start, end] byte ranges (both inclusive) already written to the file
+    received_ranges = db.Column(JSON, nullable=False, default=[])
+    state = db.Column(db.String(15), nullable=False, default='PENDING')
+    # file created after the upload completed
+    file_id = db.Column(db.Integer(), db.ForeignKey("files.id", ondelete="SET NULL"), nullable=True)
+    # digests of the blocks received so far, used to build the file checksum without reading the file again
+    blocks = db.relationship('UploadBlock', lazy='dynamic', cascade="all, delete-orphan")
+
+    # constructor
+    def __init__(self, user_id, filename, path, size_in_bytes):
+        self.user_id = user_id
+        self.filename = filename
+        self.path = path
+        self.size_in_bytes = size_in_bytes
+        self.received_ranges = []
+
+    def __repr__(self):
+        return '<Upload session {}>'.format(self.id)
+
+
+class UploadBlock(db.Model):
+    """
+    SHA256 digest of a completely received, fixed size block of an upload
+    """
+
+    __tablename__ = "upload_blocks"
+
+    upload_id = db.Column(db.Integer, db.ForeignKey('upload_sessions.id', ondelete="CASCADE"), primary_key=True)
+    block_index = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    digest = db.Column(db.String(64), nullable=False)
+
+    def __init__(self, upload_id, block_index, digest):
+        self.upload_id = upload_id
+        self.block_index = block_index
+        self.digest = digest
+
+    def __repr__(self):
+        return '<Upload block {} of upload {}>'.format(self.block_index, self.upload_id)
+
+
+# Marshmallow schema for upload session
+class UploadSessionSchema(BaseSchema):
+    user_id = fields.Int(dump_only=True)
+    filename = fields.Str(required=True)
+    size_in_bytes = fields.Int(required=True)
+    received_ranges = fields.List(fields.List(fields.Int()), dump_only=True)
+    state = fields.Str(dump_only=True)
+    file_id = fields.Int(dump_only=True)
+
+    class Meta:
+        strict = True
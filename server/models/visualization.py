@@ -6,6 +6,7 @@ from .base import Base, BaseSchema
 from .user import User
 from .file import ExperimentFile
 from marshmallow import fields
+from sqlalchemy.orm import subqueryload
 
 
 class VisualizationParameter(Base):
@@ -61,6 +62,8 @@ class Visualization(Base):
     plot_id = db.Column(db.Integer(), db.ForeignKey("plots.id"))
     plot_uid = db.Column(db.String(), nullable=False, default='')
     state = db.Column(db.String(15), nullable=False, default='PENDING')
+    # id of the celery task running the plot
+    task_id = db.Column(db.String(155), nullable=True, index=True)
 
     # one-to-many relationship to visualization parameters
     # A visualization contains one or more parameters
@@ -74,6 +77,16 @@ class Visualization(Base):
     # one visualization contains a single output file, one output file corresponds to a single visualization
     output_file_id = db.Column(db.Integer(), db.ForeignKey("files.id", ondelete="CASCADE"))
 
+    # listings of a user filtered by state and sorted by creation, see api_utils.create_filter
+    __table_args__ = (
+        db.Index('ix_visualizations_user_id_state', 'user_id', 'state'),
+        db.Index('ix_visualizations_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    # columns list endpoints can filter and sort by, see api_utils.create_filter and api_utils.create_sorting
+    filter_columns = ('id', 'plot_id', 'plot_uid', 'state', 'output_file_id', 'created_at', 'updated_at')
+    sort_columns = ('plot_uid', 'state', 'created_at', 'updated_at')
+
     def __init__(self, user_id, plot_id, plot_uid):
         self.user_id = user_id
         self.plot_id = plot_id
@@ -82,12 +95,21 @@ class Visualization(Base):
     def __repr__(self):
         return '<Visualization {}>'.format(self.id)
 
+    @classmethod
+    def query_with_relationships(cls):
+        """
+        Query visualizations loading their parameters and input files with one additional query each, whatever the
+        amount of visualizations
+        """
+        return cls.query.options(subqueryload(cls.parameters), subqueryload(cls.input_files))
+
 
 class VisualizationSchema(BaseSchema):
     user_id = fields.Int(dump_only=True)
     plot_id = fields.Int(dump_only=True)
     plot_uid = fields.Str()
     state = fields.Str()
+    task_id = fields.Str(dump_only=True)
     parameters = fields.Nested('VisualizationParameterSchema', many=True)
     input_files = fields.Nested('VisualizationInputFileSchema', many=True)
     output_file_id = fields.Int()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+    server.search
+    ~~~~~~~~~~~~~~
+    ranked search of files and collections with the full-text and trigram indexes of postgres
+"""
+import re
+from sqlalchemy import func, or_, false
+from .utils import escape_like
+
+
+def parse_search_terms(search_string):
+    """
+    Split a search string into lowercase words, dropping punctuation the tsquery syntax would choke on
+    """
+    return [term.lower() for term in re.findall(r'[^\W_]+', search_string, re.UNICODE)]
+
+
+def search_query(resource_query, search_vector, text_columns, id_column, search_string):
+    """
+    Filter a query to the rows matching a search string and order them by relevance.
+
+    Rows match if their search vector contains words starting with every term of the search string (full-text
+    index), or if one of the text columns contains the whole search string (trigram indexes). The rank adds the
+    full-text rank to the trigram similarity of the first text column, so exact names come first.
+
+    :param sqlalchemy.orm.query.Query resource_query: a SQLALchemy query object of a resource
+    :param search_vector: tsvector column of the searched model
+    :param list text_columns: columns searched for the whole string, each needs a gin_trgm_ops index
+    :param id_column: tie-breaker of equally ranked rows, so pages don't overlap
+    :param str search_string: the search string entered by the user
+    """
+    conditions = []
+    # strings shorter than a trigram can't use the trigram indexes
+    if len(search_string) >= 3:
+        conditions.extend(column.ilike('%' + escape_like(search_string) + '%', escape='\\') for column in text_columns)
+    rank = func.coalesce(func.similarity(text_columns[0], search_string), 0)
+    terms = parse_search_terms(search_string)
+    if terms:
+        # prefix match of every term, the last one is likely still being typed
+        tsquery = func.to_tsquery('pg_catalog.simple', ' & '.join(term + ':*' for term in terms))
+        conditions.append(search_vector.op('@@')(tsquery))
+        rank = rank + func.coalesce(func.ts_rank(search_vector, tsquery), 0)
+    if not conditions:
+        return resource_query.filter(false())
+    return resource_query.filter(or_(*conditions)).order_by(None).order_by(rank.desc(), id_column.desc())
+
+
+def autocomplete(resource_query, column, prefix, limit=10):
+    """
+    Get distinct values of a column starting with a prefix (case insensitive), served by its trigram index
+
+    :return: list of at most limit values in alphabetical order
+    """
+    values = resource_query.with_entities(column) \
+                .filter(column.ilike(escape_like(prefix) + '%', escape='\\')) \
+                .distinct() \
+                .order_by(column) \
+                .limit(limit)
+    return [value for (value,) in values]
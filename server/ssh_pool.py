@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+    server.ssh_pool
+    ~~~~~~~~~~~~~~
+    persistent SSH connections to the compute hosts, shared by the tasks of a worker process
+"""
+import os, socket, threading, time
+from contextlib import contextmanager
+import paramiko
+from flask import current_app
+
+
+class PooledConnection(object):
+    """
+    An SSH connection borrowed from the pool.
+
+    Commands run in their own channels over the same transport. The SFTP session is opened once and reused by
+    every borrower of the connection.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.time()
+        self._sftp = None
+
+    def exec_command(self, command, **kwargs):
+        return self.client.exec_command(command, **kwargs)
+
+    def open_session(self):
+        return self.client.get_transport().open_session()
+
+    def open_sftp(self):
+        if self._sftp is None or self._sftp.sock.closed:
+            self._sftp = self.client.open_sftp()
+        return self._sftp
+
+    def is_active(self):
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        if self._sftp is not None:
+            self._sftp.close()
+        self.client.close()
+
+
+class SSHConnectionPool(object):
+    """
+    Pool of SSH connections to a single server.
+
+    Idle connections are checked before being handed out and dropped if their transport died or they have been idle
+    for longer than max_idle seconds. Transports send keepalive packets so that firewalls don't drop idle connections.
+    At most max_size connections are open at the same time, further borrowers wait for one to be released.
+    """
+
+    def __init__(self, hostname, username, password, max_size=4, keepalive=30, max_idle=600, connect_timeout=10):
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.max_size = max_size
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = []
+        self._metrics = {'hits': 0, 'misses': 0, 'connects': 0, 'connect_time': 0.0, 'discarded': 0}
+
+    def _connect(self):
+        client = paramiko.SSHClient()
+        # The following line is required if you want the script to be able to access a server that's not yet in the known_hosts file
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        start = time.time()
+        client.connect(self.hostname, username=self.username, password=self.password, timeout=self.connect_timeout)
+        client.get_transport().set_keepalive(self.keepalive)
+        with self._lock:
+            self._metrics['connects'] += 1
+            self._metrics['connect_time'] += time.time() - start
+        return PooledConnection(client)
+
+    def _take_idle(self):
+        """
+        Take the most recently used healthy idle connection, closing the broken and expired ones found on the way
+        """
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                connection = self._idle.pop()
+                if connection.is_active() and now - connection.last_used < self.max_idle:
+                    self._metrics['hits'] += 1
+                    return connection
+                self._metrics['discarded'] += 1
+                connection.close()
+            self._metrics['misses'] += 1
+        return None
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for running commands or transferring files, opening a new one if none is idle
+        """
+        self._slots.acquire()
+        try:
+            connection = self._take_idle() or self._connect()
+            broken = False
+            try:
+                yield connection
+            except (paramiko.SSHException, socket.error, EOFError):
+                # the connection may be broken, don't hand it out again
+                broken = True
+                raise
+            finally:
+                if not broken and connection.is_active():
+                    connection.last_used = time.time()
+                    with self._lock:
+                        self._idle.append(connection)
+                else:
+                    connection.close()
+        finally:
+            self._slots.release()
+
+    def metrics(self):
+        """
+        Get pool hits, misses, amount of connections opened and total time spent connecting (seconds)
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['idle'] = len(self._idle)
+        return metrics
+
+    def close(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_ssh_pool(hostname=None, username=None, password=None):
+    """
+    Return the connection pool of the current process to a compute host, by default to the computing server
+    """
+    config = current_app.config
+    # SSH transports can't be shared with processes forked from a parent (Celery worker processes)
+    key = (os.getpid(), hostname or config.get('COMPUTING_SERVER_IP'), username or config.get('COMPUTING_SERVER_USER'))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SSHConnectionPool(key[1], key[2], password or config.get('COMPUTING_SERVER_PASSWORD'),
+                                     max_size=config.get('SSH_POOL_SIZE'),
+                                     keepalive=config.get('SSH_KEEPALIVE_INTERVAL'),
+                                     max_idle=config.get('SSH_MAX_IDLE_TIME'),
+                                     connect_timeout=config.get('SSH_CONNECT_TIMEOUT'))
+            _pools[key] = pool
+    return pool
+
+
+def close_ssh_pools():
+    """
+    Close the idle connections of all pools of the current process
+
+    :return: metrics of the closed pools by server
+    """
+    with _pools_lock:
+        pools = [(key, pool) for key, pool in _pools.items() if key[0] == os.getpid()]
+        for key, pool in pools:
+            del _pools[key]
+    metrics = {}
+    for key, pool in pools:
+        metrics[key[1]] = pool.metrics()
+        pool.close()
+    return metrics
@@ -7,42 +7,55 @@
 import os, magic
 from flask import current_app, g
 from . import celery
-from .utils import connect_ssh, read_dir, write_file_in_chunks
+from .utils import block_checksum
+from .blob_store import deduplicate_file
+from .file_formats import get_format_detector
+from .ssh_pool import close_ssh_pools
+from .executors import run_command
+from .events import publish_event
+from . import bulk_import
+from .analysis_outputs import register_analysis_outputs
+from .illumina_index import refresh_illumina_index
 # Import db instance
 from . import db
-from .models.analysis import Analysis, AssociationAnalysesOutputFiles
+from .models.analysis import Analysis
 from .models.visualization import Visualization
 from .models.file import ExperimentFile
 from .models.plot import Plot
+from .models.pipeline import PipelineOutput
 from .models.user import User
 # celery logger
 from celery.utils.log import get_task_logger
 from celery import states as celery_states
+from celery.signals import worker_process_shutdown
 
 logger = get_task_logger(__name__)
 
+
+@worker_process_shutdown.connect
+def close_ssh_connections(**kwargs):
+    """Close pooled SSH connections of a stopping worker process and log the pool metrics."""
+    for server, metrics in close_ssh_pools().items():
+        logger.info("SSH connection pool to {}: {}".format(server, metrics))
+
 class PipelineError(Exception):
-    """Exception raised when a remote running pipeline exits before finishing."""
+    """Exception raised when a remote running pipeline exits before finishing. Its output is found in log.out and error.out."""
 
-    def __init__(self, message, exit_code, stdout, stderr):
+    def __init__(self, message, exit_code=None):
         # call parent class with message
         super(PipelineError, self).__init__(message)
         # custom attributes
         self.exit_code = exit_code
-        self.stdout = stdout
-        self.stderr = stderr
 
 
 class PlotError(Exception):
-    """Exception raised when a remote running plot exits before finishing."""
+    """Exception raised when a remote running plot exits before finishing. Its output is found in log.out and error.out."""
 
-    def __init__(self, message, exit_code, stdout, stderr):
+    def __init__(self, message, exit_code=None):
         # call parent class with message
         super(PlotError, self).__init__(message)
         # custom attributes
         self.exit_code = exit_code
-        self.stdout = stdout
-        self.stderr = stderr
 
 
 class BaseTask(celery.Task):
@@ -68,17 +81,9 @@ class AnalysisTask(BaseTask):
         analysis.state = celery_states.FAILURE
         db.session.add(analysis)
         db.session.commit()
+        publish_event(analysis.user_id, 'analysis', {'analysis_id': analysis.id, 'task_id': task_id, 'state': analysis.state})
 
-        # retrieve folder to write output files to
-        user = User.query.get(analysis.user_id)
-        user_folder = os.path.join(current_app.config.get('DATA_STORAGE'), user.username)
-        analysis_folder = os.path.join(user_folder, current_app.config.get('ANALYSES_FOLDER'), str(analysis.id))
-
-        # write stdout to file
-        write_file_in_chunks(analysis_folder, "log.out", exc.stdout)
-
-        # write stderr to file
-        write_file_in_chunks(analysis_folder, "error.out", exc.stderr)
+        # stdout and stderr have been written to the analysis folder while the pipeline ran
 
         # call method on parent class
         super(AnalysisTask, self).on_failure(exc, task_id, args, kwargs, einfo)
@@ -94,71 +99,30 @@ class AnalysisTask(BaseTask):
         analysis_folder = os.path.join(user_folder, current_app.config.get('ANALYSES_FOLDER'), str(analysis.id))
         analysis_folder_internal = os.path.join(current_app.config.get('BRAINGINE_ROOT'), analysis_folder)
 
-        # create dict to associate analysis output files to corresponding fieldnames in pipeline definition
-        # this will just invert the key/value pairs within the original analysis_outputs dictionary
-        analysis_outputs = kwargs['analysis_outputs']
-        analysis_output_file_fieldname_assoc = {}
-        for fieldname, filename in analysis_outputs.items():
-            analysis_output_file_fieldname_assoc[filename] = fieldname
-
         # create DB entries for each analysis output file
-        for root, subdirs, files in os.walk(analysis_folder_internal):
-            # read analysis files in directory
-            for filename in files:
-                # get name of folder where the file is located
-                basename = os.path.basename(os.path.normpath(root))
-                filename_no_ext = os.path.splitext(filename)[0]
-                if filename in analysis_output_file_fieldname_assoc:
-                    # in case fieldname in pipeline definition equals the output filename
-                    pipeline_fieldname = analysis_output_file_fieldname_assoc[filename]
-                elif filename_no_ext in analysis_output_file_fieldname_assoc:
-                    # in case fieldname in pipeline definition equals the output filename without extension
-                    pipeline_fieldname = analysis_output_file_fieldname_assoc[filename_no_ext]
-                elif basename in analysis_output_file_fieldname_assoc:
-                    # in case fieldname in pipeline definition equals the output file's folder
-                    pipeline_fieldname = analysis_output_file_fieldname_assoc[basename]
-                else:
-                    continue
-
-                # path to the file in the storage server
-                file_path = os.path.join(root, filename)
-                # file_path_internal = os.path.join(root, filename)
-
-                # initialize file handle for magic file type detection
-                fh_magic = magic.Magic(magic_file=current_app.config.get('BIOINFO_MAGIC_FILE'), uncompress=True)
-
-                # get bioinformatic file type using magic
-                file_format_full = fh_magic.from_file(file_path)
-                mime_type = magic.from_file(file_path, mime=True)
-
-                file_size = os.path.getsize(file_path)
-
-                # create file object and add to DB
-                new_file = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path, mime_type=mime_type, file_format_full=file_format_full)
-                db.session.add(new_file)
-
-                # link file to analysis output
-                analysis_output_file_assoc = AssociationAnalysesOutputFiles(pipeline_fieldname=pipeline_fieldname)
-                analysis_output_file_assoc.output_file = new_file
-                analysis.output_files.append(analysis_output_file_assoc)
-
+        # formats declared in the pipeline definition spare sniffing the contents of the outputs
+        output_formats = {output.name.strip(os.sep): output.format for output in PipelineOutput.query.filter_by(pipeline_id=kwargs['pipeline_id'])}
+        output_count, timings = register_analysis_outputs(analysis, analysis_folder_internal, kwargs['analysis_outputs'], output_formats)
         db.session.commit()
+        logger.info("Registered {} output files of analysis {} ({})".format(output_count, analysis.id, ", ".join("{} {:.2f}s".format(phase, seconds) for phase, seconds in timings.items())))
+        publish_event(analysis.user_id, 'analysis', {'analysis_id': analysis.id, 'task_id': task_id, 'state': analysis.state, 'output_files': output_count})
 
 
 @celery.task(base=AnalysisTask)
 def run_analysis(command, **kwargs):
-    ssh = connect_ssh(current_app.config.get('COMPUTING_SERVER_IP'), current_app.config.get('COMPUTING_SERVER_USER'), current_app.config.get('COMPUTING_SERVER_PASSWORD'))
-    stdin, stdout, stderr = ssh.exec_command(command)
-    print(command)
-    # print stdout
-    for line in stdout:
-        print(line.strip("\n"))
+    analysis = Analysis.query.get(kwargs['analysis_id'])
+    user = User.query.get(analysis.user_id)
+    analysis_folder = os.path.join(current_app.config.get('DATA_STORAGE'), user.username, current_app.config.get('ANALYSES_FOLDER'), str(analysis.id))
+    # don't keep a DB transaction open while the pipeline runs
+    db.session.commit()
+    publish_event(user.id, 'analysis', {'analysis_id': analysis.id, 'task_id': run_analysis.request.id, 'state': celery_states.STARTED})
+    logger.info(command)
     # exit code of pipeline script
-    exit_code = stdout.channel.recv_exit_status()
+    exit_code = run_command(command, analysis_folder)
     # if pipeline exits with error code (different than 0)
     if exit_code != 0:
         message = "The pipeline with id '{}' raised an error".format(kwargs['pipeline_id'])
-        raise PipelineError(message, exit_code, stdout, stderr)
+        raise PipelineError(message, exit_code)
     return kwargs['analysis_id']
 
 
@@ -170,17 +134,9 @@ class VisualizationTask(BaseTask):
         visualization.state = celery_states.FAILURE
         db.session.add(visualization)
         db.session.commit()
+        publish_event(visualization.user_id, 'visualization', {'visualization_id': visualization.id, 'task_id': task_id, 'state': visualization.state})
 
-        # retrieve experiment info and folder to write output files to
-        user = User.query.get(visualization.user_id)
-        user_folder = os.path.join(current_app.config.get('DATA_STORAGE'), user.username)
-        visualization_folder = os.path.join(user_folder, current_app.config.get('VISUALIZATIONS_FOLDER'), str(visualization.id))
-
-        # write stdout to file
-        write_file_in_chunks(visualization_folder, "log.out", exc.stdout)
-
-        # write stderr to file
-        write_file_in_chunks(visualization_folder, "error.out", exc.stderr)
+        # stdout and stderr have been written to the visualization folder while the plot ran
 
         # call method on parent class
         super(VisualizationTask, self).on_failure(exc, task_id, args, kwargs, einfo)
@@ -207,12 +163,8 @@ class VisualizationTask(BaseTask):
 
                 file_path = os.path.join(root, filename)
                 file_size = os.path.getsize(file_path)
-                # initialize file handle for magic file type detection
-                fh_magic = magic.Magic(magic_file=current_app.config.get('BIOINFO_MAGIC_FILE'))
-
-                # get bioinformatic file type using magic
-                file_format_full = fh_magic.from_file(file_path)
-                mime_type = magic.from_file(file_path, mime=True)
+                # get bioinformatic file type and mimetype using magic
+                file_format_full, mime_type = get_format_detector().detect(file_path, uncompress=False)
 
                 # create file object and add to DB
                 new_file = ExperimentFile(user_id=user.id, size_in_bytes=file_size, name=filename, path=file_path, mime_type=mime_type, file_format_full=file_format_full)
@@ -223,6 +175,7 @@ class VisualizationTask(BaseTask):
                 visualization.output_file_id = new_file.id
 
         db.session.commit()
+        publish_event(visualization.user_id, 'visualization', {'visualization_id': visualization.id, 'task_id': task_id, 'state': visualization.state, 'output_file_id': visualization.output_file_id})
 
 
 class IlluminaImportTask(BaseTask):
@@ -234,17 +187,6 @@ class IlluminaImportTask(BaseTask):
         db.session.add(visualization)
         db.session.commit()
 
-        # retrieve folder to write output files to
-        user = g.user
-        user_folder = os.path.join(current_app.config.get('DATA_STORAGE'), user.username)
-        visualization_folder = os.path.join(user_folder, current_app.config.get('VISUALIZATIONS_FOLDER'), str(visualization.id))
-
-        # write stdout to file
-        write_file_in_chunks(visualization_folder, "log.out", exc.stdout)
-
-        # write stderr to file
-        write_file_in_chunks(visualization_folder, "error.out", exc.stderr)
-
         # call method on parent class
         super(VisualizationTask, self).on_failure(exc, task_id, args, kwargs, einfo)
 
@@ -284,33 +226,94 @@ class IlluminaImportTask(BaseTask):
 
 @celery.task(base=VisualizationTask)
 def create_visualization(command, **kwargs):
-    ssh = connect_ssh(current_app.config.get('COMPUTING_SERVER_IP'), current_app.config.get('COMPUTING_SERVER_USER'), current_app.config.get('COMPUTING_SERVER_PASSWORD'))
-    stdin, stdout, stderr = ssh.exec_command(command)
-    print(command)
-    # print stdout
-    for line in stdout:
-        print(line.strip("\n"))
-    # exit code of pipeline script
-    exit_code = stdout.channel.recv_exit_status()
-    # if pipeline exits with error code (different than 0)
+    visualization = Visualization.query.get(kwargs['visualization_id'])
+    user = User.query.get(visualization.user_id)
+    visualization_folder = os.path.join(current_app.config.get('DATA_STORAGE'), user.username, current_app.config.get('VISUALIZATIONS_FOLDER'), str(visualization.id))
+    # don't keep a DB transaction open while the plot runs
+    db.session.commit()
+    publish_event(user.id, 'visualization', {'visualization_id': visualization.id, 'task_id': create_visualization.request.id, 'state': celery_states.STARTED})
+    logger.info(command)
+    # exit code of plot script
+    exit_code = run_command(command, visualization_folder)
+    # if plot exits with error code (different than 0)
     if exit_code != 0:
         message = "The plot with id '{}' raised an error".format(kwargs['plot_id'])
-        raise PlotError(message, exit_code, stdout, stderr)
+        raise PlotError(message, exit_code)
     return kwargs['visualization_id']
 
 # TODO: finish this
 @celery.task(base=IlluminaImportTask)
 def import_illumina(command, **kwargs):
-    ssh = connect_ssh(current_app.config.get('COMPUTING_SERVER_IP'), current_app.config.get('COMPUTING_SERVER_USER'), current_app.config.get('COMPUTING_SERVER_PASSWORD'))
-    stdin, stdout, stderr = ssh.exec_command(command)
-    print(command)
-    # print stdout
-    for line in stdout:
-        print(line.strip("\n"))
+    logger.info(command)
     # exit code of pipeline script
-    exit_code = stdout.channel.recv_exit_status()
+    exit_code = run_command(command)
     # if pipeline exits with error code (different than 0)
     if exit_code != 0:
         message = "The plot with id '{}' raised an error".format(kwargs['plot_id'])
-        raise PlotError(message, exit_code, stdout, stderr)
+        raise PlotError(message, exit_code)
     return kwargs['visualization_id']
+
+
+@celery.task(base=BaseTask)
+def compute_file_checksum(file_id):
+    """
+    Compute the checksum of a file which has not been hashed while uploading, e.g. an imported file,
+    and link it to the stored contents of identical files
+    """
+    experiment_file = ExperimentFile.query.get(file_id)
+    if experiment_file is None:
+        return None
+    experiment_file.checksum = block_checksum(experiment_file.path, current_app.config.get('CHECKSUM_BLOCK_SIZE'))
+    deduplicate_file(experiment_file)
+    db.session.commit()
+    return experiment_file.checksum
+
+
+@celery.task(base=BaseTask)
+def detect_file_format(file_id):
+    """
+    Detect the type of a file with magic, which can take seconds for compressed files on a network share
+    """
+    experiment_file = ExperimentFile.query.get(file_id)
+    if experiment_file is None:
+        return None
+    try:
+        file_format_full, mime_type = get_format_detector().detect(experiment_file.path)
+    except (OSError, magic.MagicException):
+        experiment_file.format_state = celery_states.FAILURE
+        db.session.commit()
+        raise
+    experiment_file.file_format_full = file_format_full
+    experiment_file.mime_type = mime_type
+    experiment_file.file_format = experiment_file.get_file_format(file_format_full, experiment_file.name)
+    experiment_file.format_state = celery_states.SUCCESS
+    db.session.commit()
+    return experiment_file.file_format
+
+
+@celery.task(base=BaseTask, bind=True)
+def import_files(self, user_id, file_paths):
+    """
+    Import many files at once (e.g. a storage folder or an Illumina run), reporting progress and the files which
+    couldn't be read through the task state
+    """
+    user = User.query.get(user_id)
+
+    def report_progress(current, total, failed_paths):
+        self.update_state(state='PROGRESS', meta={'current': current, 'total': total, 'failed': failed_paths})
+
+    file_ids, failed_paths = bulk_import.import_files(user, file_paths, progress=report_progress)
+    # detect types and hash the files in the background, they can be huge and located on a slow share
+    for file_id in file_ids:
+        detect_file_format.delay(file_id)
+        compute_file_checksum.delay(file_id)
+    return {'file_ids': file_ids, 'failed': failed_paths}
+
+
+@celery.task(base=BaseTask, ignore_result=True)
+def scan_illumina_runs():
+    """
+    Update the index of Illumina runs with the folders added, changed or removed since the last scan
+    """
+    refreshed = refresh_illumina_index()
+    logger.info("Illumina run index updated, {} runs read".format(refreshed))
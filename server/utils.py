@@ -1,4 +1,5 @@
-import os, errno, hashlib, shutil
+import os, errno, hashlib, shutil, threading, time, select
+from collections import OrderedDict
 # ssh package
 import paramiko
 
@@ -26,6 +27,78 @@ def sha256checksum(filename):
     return hash_sha256.hexdigest()
 
 
+def file_blocks(start, end, block_size):
+    """
+    Return the indexes of the fixed size blocks overlapping the inclusive byte range [start, end]
+    """
+    return range(start // block_size, end // block_size + 1)
+
+
+def block_byte_range(index, block_size, size):
+    """
+    Return the inclusive byte range [start, end] of a block within a file of the given size
+    """
+    return index * block_size, min((index + 1) * block_size, size) - 1
+
+
+def hash_file_blocks(path, block_indexes, block_size, size):
+    """
+    Return the hexadecimal SHA256 digest of each of the given blocks of a file
+
+    :param str path: path of the file
+    :param iterable block_indexes: indexes of the blocks to hash
+    :param int block_size: size of a single block
+    :param int size: size of the whole file
+    :return: dictionary with block index as key and digest as value
+    """
+    digests = {}
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for index in block_indexes:
+            start, end = block_byte_range(index, block_size, size)
+            digests[index] = hashlib.sha256(os.pread(fd, end - start + 1, start)).hexdigest()
+    finally:
+        os.close(fd)
+    return digests
+
+
+def combine_block_digests(digests):
+    """
+    Build the checksum of a file out of the ordered hexadecimal SHA256 digests of its blocks.
+
+    The checksum is the SHA256 of the concatenated binary digests of all blocks. Unlike a plain SHA256 of the contents,
+    it can be built from blocks hashed in any order, e.g. while the chunks of an upload arrive.
+    """
+    hash_sha256 = hashlib.sha256()
+    for digest in digests:
+        hash_sha256.update(bytes.fromhex(digest))
+    return hash_sha256.hexdigest()
+
+
+def block_checksum(filename, block_size):
+    """
+    Return the checksum of a file as built by ``combine_block_digests``, reading the file once with large buffers
+    """
+    hash_sha256 = hashlib.sha256()
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(filename, "rb", buffering=0) as f:
+        while True:
+            # fill up a whole block, a single read can return less than requested
+            nbytes = 0
+            while nbytes < block_size:
+                n = f.readinto(view[nbytes:])
+                if not n:
+                    break
+                nbytes += n
+            if nbytes == 0:
+                break
+            hash_sha256.update(hashlib.sha256(view[:nbytes]).digest())
+            if nbytes < block_size:
+                break
+    return hash_sha256.hexdigest()
+
+
 def silent_remove(path):
     """
     Remove file/folder from filesystem without raising an error if it does not exist or opeartion not permitted
@@ -78,6 +151,13 @@ def sha1_string(string):
     return hex_dig
 
 
+def escape_like(string, escape='\\'):
+    """
+    Escape the wildcards of a string for matching it literally in LIKE patterns using the given escape character
+    """
+    return string.replace(escape, escape * 2).replace('%', escape + '%').replace('_', escape + '_')
+
+
 def connect_ssh(server, user, password):
     """
     Establish a connection to a server through SSH
@@ -142,6 +222,344 @@ def write_file_in_chunks(dest_folder, filename, file_object, nbytes=0):
             f.write(chunk)
 
 
+def stream_channel_output(channel, stdout_path, stderr_path, batch_size=64 * 1024, flush_interval=1.0, timeout=None):
+    """
+    Append the stdout and stderr of a running remote command to files while it runs
+
+    Both streams are read concurrently without blocking on either of them. Output is appended in batches, whenever
+    a stream buffered batch_size bytes or flush_interval seconds passed since the last write, so the files can be
+    followed while the command runs without one write per line.
+
+    :param paramiko.Channel channel: channel of the running command
+    :param str stdout_path: file to append stdout to
+    :param str stderr_path: file to append stderr to
+    :param float timeout: seconds after which the channel gets closed and TimeoutError raised, None to wait forever.
+        Closing the channel doesn't stop the remote command, see SSHExecutor
+    :return: exit code of the command
+    """
+    deadline = time.time() + timeout if timeout else None
+    streams = [(channel.recv_ready, channel.recv, open(stdout_path, 'ab'), bytearray()),
+               (channel.recv_stderr_ready, channel.recv_stderr, open(stderr_path, 'ab'), bytearray())]
+    try:
+        flushed_at = time.time()
+        while True:
+            received = False
+            for ready, recv, f, buffer in streams:
+                if ready():
+                    buffer.extend(recv(batch_size))
+                    received = True
+                    if len(buffer) >= batch_size:
+                        f.write(buffer)
+                        f.flush()
+                        del buffer[:]
+            # checked on every iteration, commands writing output all the time would never time out otherwise
+            if deadline is not None and time.time() > deadline:
+                channel.close()
+                raise TimeoutError("Command did not finish within {} seconds".format(timeout))
+            if not received:
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+                # the channel only signals stdout data, stderr gets polled
+                select.select([channel], [], [], 0.1)
+            if time.time() - flushed_at >= flush_interval:
+                for ready, recv, f, buffer in streams:
+                    if buffer:
+                        f.write(buffer)
+                        f.flush()
+                        del buffer[:]
+                flushed_at = time.time()
+    finally:
+        for ready, recv, f, buffer in streams:
+            f.write(buffer)
+            f.close()
+    return channel.recv_exit_status()
+
+
+def read_file_tail(path, offset, max_bytes):
+    """
+    Read the part of a growing (log) file after the given byte offset
+
+    If there is more data than max_bytes, the data is cut after its last complete line so lines are not split
+    between reads.
+
+    :return: tuple with the data read and the offset to continue reading from
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(max_bytes)
+    except FileNotFoundError:
+        return b'', offset
+    if len(data) == max_bytes and not data.endswith(b'\n'):
+        last_line_end = data.rfind(b'\n')
+        if last_line_end != -1:
+            data = data[:last_line_end + 1]
+    return data, offset + len(data)
+
+
+def copy_file_region(src_fd, dest_fd, dest_offset, count, buffer_size=8 * 1024 * 1024):
+    """
+    Copy bytes from the beginning of a file into another file at the given offset
+
+    The copy is done by the kernel with copy_file_range or sendfile where available, so the contents never pass through
+    user space. Otherwise it falls back to copying through a buffer of bounded size.
+
+    :param int src_fd: file descriptor to read from
+    :param int dest_fd: file descriptor to write to
+    :param int dest_offset: position in the destination file where the contents will be written to
+    :param int count: amount of bytes to copy
+    :param int buffer_size: size of the buffer used when the kernel can't copy by itself
+    :return: the amount of bytes copied
+    """
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < count:
+                n = os.copy_file_range(src_fd, dest_fd, count - copied, copied, dest_offset + copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            # e.g. both files in different file systems, try the next method
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    if hasattr(os, 'sendfile'):
+        try:
+            # sendfile writes at the current position of the destination file
+            os.lseek(dest_fd, dest_offset + copied, os.SEEK_SET)
+            while copied < count:
+                n = os.sendfile(dest_fd, src_fd, copied, count - copied)
+                if n == 0:
+                    break
+                copied += n
+            return copied
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+    while copied < count:
+        chunk = os.pread(src_fd, min(buffer_size, count - copied), copied)
+        if len(chunk) == 0:
+            break
+        written = 0
+        while written < len(chunk):
+            written += os.pwrite(dest_fd, chunk[written:], dest_offset + copied + written)
+        copied += written
+    return copied
+
+
+def write_file_at_offset(dest_file, src_file, offset):
+    """
+    Write the contents of a file into another file at the given byte offset, creating it if needed
+
+    Uses positional writes, so several chunks of the same file can be written at the same time without sharing a file pointer.
+    The contents are copied kernel-side if possible, so memory usage doesn't depend on the size of the source file.
+
+    :param str dest_file: path of the file to write to
+    :param str src_file: path of the file to transfer contents from
+    :param int offset: position in the destination file where the contents will be written to
+    :return: the amount of bytes written
+    """
+    with open(src_file, "rb") as f:
+        count = os.fstat(f.fileno()).st_size
+        fd = os.open(dest_file, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            written = copy_file_region(f.fileno(), fd, offset, count)
+        finally:
+            os.close(fd)
+    return written
+
+
+def parse_content_range(content_range):
+    """
+    Parse a Content-Range header value like "bytes 0-1023/4096"
+
+    :return: tuple with start byte, end byte (inclusive) and total bytes
+    :raises ValueError: if the header is malformed or the range does not fit into the total size
+    """
+    unit, range_str = content_range.strip().split(' ', 1)
+    if unit != 'bytes':
+        raise ValueError("Unsupported range unit '{}'".format(unit))
+    byte_range, total_bytes = range_str.split('/')
+    start_bytes, end_bytes = byte_range.split('-')
+    start_bytes, end_bytes, total_bytes = int(start_bytes), int(end_bytes), int(total_bytes)
+    if start_bytes < 0 or start_bytes > end_bytes or end_bytes >= total_bytes:
+        raise ValueError("Invalid byte range '{}'".format(range_str))
+    return start_bytes, end_bytes, total_bytes
+
+
+def merge_byte_range(ranges, start, end):
+    """
+    Add an inclusive byte range to a list of ranges, merging it with overlapping or adjacent ones
+
+    :param list ranges: sorted list of non-overlapping [start, end] byte ranges
+    :return: a new sorted list of non-overlapping [start, end] byte ranges
+    """
+    merged = []
+    for range_start, range_end in sorted(list(ranges) + [[start, end]]):
+        if merged and range_start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def byte_range_received(ranges, start, end):
+    """
+    Check if the inclusive byte range [start, end] lies completely within a list of merged byte ranges
+    """
+    return any(range_start <= start and end <= range_end for range_start, range_end in ranges)
+
+
+def byte_ranges_cover(ranges, total_bytes):
+    """
+    Check if a list of merged byte ranges covers a whole file of the given size
+    """
+    if total_bytes == 0:
+        return True
+    return len(ranges) == 1 and ranges[0][0] == 0 and ranges[0][1] >= total_bytes - 1
+
+
+def parse_range_header(range_header, size, max_ranges=100):
+    """
+    Parse a Range header value like "bytes=0-99,200-,-50" for a file of the given size (RFC 7233)
+
+    :return: list of satisfiable (start, end) byte ranges with inclusive ends, empty if none of them is satisfiable
+    :raises ValueError: if the header is malformed, in which case it should be ignored
+    """
+    unit, _, range_set = range_header.strip().partition('=')
+    if unit.strip() != 'bytes' or not range_set:
+        raise ValueError("Unsupported range '{}'".format(range_header))
+    byte_ranges = []
+    range_specs = [spec.strip() for spec in range_set.split(',') if spec.strip()]
+    if not range_specs or len(range_specs) > max_ranges:
+        raise ValueError("Invalid amount of ranges in '{}'".format(range_header))
+    for range_spec in range_specs:
+        first, _, last = range_spec.partition('-')
+        if not _:
+            raise ValueError("Invalid range '{}'".format(range_spec))
+        if first == '':
+            # suffix range, the last n bytes of the file
+            suffix_length = int(last)
+            if suffix_length <= 0:
+                continue
+            start, end = max(size - suffix_length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if start > end:
+                raise ValueError("Invalid range '{}'".format(range_spec))
+            end = min(end, size - 1)
+        if start < 0:
+            raise ValueError("Invalid range '{}'".format(range_spec))
+        if start < size:
+            byte_ranges.append((start, end))
+    return byte_ranges
+
+
+def iter_file_range(fd, start, end, buffer_size=64 * 1024):
+    """
+    Yield the inclusive byte range [start, end] of an open file in pieces of bounded size
+
+    Uses positional reads, so the same file descriptor can be read by several threads at the same time.
+    """
+    position = start
+    while position <= end:
+        chunk = os.pread(fd, min(buffer_size, end - position + 1), position)
+        if len(chunk) == 0:
+            return
+        position += len(chunk)
+        yield chunk
+
+
+class OpenFileCache(object):
+    """
+    LRU cache of read-only file descriptors for files read over and over again,
+    e.g. BAM files from which genome browsers request thousands of small ranges.
+
+    Descriptors are shared between threads and must only be read with positional reads (see ``iter_file_range``).
+    Every acquired entry has to be released. A cached file gets checked for changes at most every ``ttl`` seconds.
+    """
+
+    class Entry(object):
+        def __init__(self, path, fd, stat_result):
+            self.path = path
+            self.fd = fd
+            self.size = stat_result.st_size
+            self.signature = (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size)
+            self.checked_at = time.time()
+            self.users = 0
+            self.evicted = False
+
+    def __init__(self, max_size=64, ttl=5):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, path):
+        """
+        Get an open file descriptor for a file
+
+        :return: cache entry with the descriptor as ``fd`` and the file size as ``size``
+        :raises OSError: if the file can't be opened
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            expired = entry is not None and time.time() - entry.checked_at > self.ttl
+        if expired:
+            # check outside of the lock, stat can be slow on network shares
+            try:
+                stat_result = os.stat(path)
+                changed = (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size) != entry.signature
+            except OSError:
+                changed = True
+            with self._lock:
+                if changed:
+                    self._evict(entry)
+                else:
+                    entry.checked_at = time.time()
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+                entry.users += 1
+                return entry
+
+        fd = os.open(path, os.O_RDONLY)
+        new_entry = self.Entry(path, fd, os.fstat(fd))
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                # opened by another thread in the meantime
+                os.close(fd)
+            else:
+                entry = new_entry
+                self._entries[path] = entry
+                while len(self._entries) > self.max_size:
+                    self._evict(next(iter(self._entries.values())))
+            entry.users += 1
+            return entry
+
+    def release(self, entry):
+        with self._lock:
+            entry.users -= 1
+            if entry.evicted and entry.users == 0:
+                os.close(entry.fd)
+
+    def _evict(self, entry):
+        """
+        Remove an entry from the cache, its descriptor gets closed once no thread uses it anymore. Caller must hold the lock.
+        """
+        if self._entries.get(entry.path) is entry:
+            del self._entries[entry.path]
+        if not entry.evicted:
+            entry.evicted = True
+            if entry.users == 0:
+                os.close(entry.fd)
+
+
 def write_file_remote(ssh, remote_folder, filename, data):
     """
     Transfer a file chunk to a server through sftp
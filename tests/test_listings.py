@@ -0,0 +1,288 @@
+import unittest, tempfile, shutil, json, base64
+from werkzeug.exceptions import BadRequest
+from sqlalchemy import event
+from server import create_app, db
+from server.models.user import User
+from server.models.file import ExperimentFile
+from server.models.analysis import Analysis, AnalysisParameter, AssociationAnalysesInputFiles, AssociationAnalysesOutputFiles
+from server.models.visualization import Visualization, VisualizationParameter, AssociationVisualizationsInputFiles
+from server.api_1_0.api_utils import encode_cursor, paginate_by_cursor, create_filter, create_sorting
+from server.search import search_query, autocomplete
+from server.memberships import add_files, remove_files
+from server.models.collection import Collection
+from server.models.databox import DataBox
+
+
+class QueryCounter(object):
+    """Count the statements sent to the database within a with block"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+class ListingQueriesTestCase(unittest.TestCase):
+    """Test the queries built by list and membership endpoints"""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.storage = tempfile.mkdtemp()
+        self.app.config['DATA_STORAGE'] = self.storage
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.drop_all()
+        db.create_all()
+        self.user = User('listing-user', 'Listing User', 'listing@example.com')
+        db.session.add(self.user)
+        db.session.commit()
+        # the user object gets detached when the session is cleared before counting queries
+        self.user_id = self.user.id
+        # users get authenticated by their name only in debug mode, without LDAP
+        self.app.config['DEBUG'] = True
+        self.client = self.app.test_client()
+        self.headers = {'Authorization': 'Basic ' + base64.b64encode(b'listing-user:').decode('ascii')}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.storage)
+
+    def _add_analyses(self, amount):
+        for i in range(amount):
+            input_file = ExperimentFile(self.user_id, 10, 'in{}.fastq'.format(i), '/in{}.fastq'.format(i), 'text/plain', 'FASTQ')
+            output_file = ExperimentFile(self.user_id, 10, 'out{}.bam'.format(i), '/out{}.bam'.format(i), 'application/octet-stream', 'BAM')
+            db.session.add_all([input_file, output_file])
+            db.session.flush()
+            analysis = Analysis(self.user_id, None, 'pipeline')
+            db.session.add(analysis)
+            db.session.flush()
+            analysis.parameters.append(AnalysisParameter(analysis.id, 'threads', '4'))
+            analysis.input_files.append(AssociationAnalysesInputFiles(file_id=input_file.id, pipeline_fieldname='reads'))
+            analysis.output_files.append(AssociationAnalysesOutputFiles(file_id=output_file.id, pipeline_fieldname='alignment'))
+        db.session.commit()
+
+    def _add_visualizations(self, amount):
+        for i in range(amount):
+            input_file = ExperimentFile(self.user_id, 10, 'in{}.bed'.format(i), '/in{}.bed'.format(i), 'text/plain', 'BED')
+            db.session.add(input_file)
+            db.session.flush()
+            visualization = Visualization(self.user_id, None, 'plot')
+            db.session.add(visualization)
+            db.session.flush()
+            visualization.parameters.append(VisualizationParameter(visualization.id, 'title', 'x'))
+            visualization.input_files.append(AssociationVisualizationsInputFiles(file_id=input_file.id, plot_fieldname='regions'))
+        db.session.commit()
+
+    def _count_queries(self, path):
+        db.session.expunge_all()
+        with QueryCounter(db.engine) as counter:
+            response = self.client.get(path, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return counter.count, json.loads(response.data.decode('utf-8'))
+
+    def test_analysis_listing_queries(self):
+        """Test that the nested collections of listed analyses are loaded in a constant amount of queries"""
+        self._add_analyses(2)
+        few_queries, result = self._count_queries('/api/analyses/')
+        self.assertEqual(len(result), 2)
+        self.assertEqual(len(result[0]['output_files']), 1)
+        self._add_analyses(20)
+        many_queries, result = self._count_queries('/api/analyses/')
+        self.assertEqual(len(result), 22)
+        self.assertEqual(few_queries, many_queries)
+        # user, page, count and one query per nested collection
+        self.assertLessEqual(many_queries, 6)
+
+    def test_visualization_listing_queries(self):
+        """Test that the nested collections of listed visualizations are loaded in a constant amount of queries"""
+        self._add_visualizations(2)
+        few_queries, result = self._count_queries('/api/visualizations/')
+        self.assertEqual(len(result[0]['input_files']), 1)
+        self._add_visualizations(20)
+        many_queries, result = self._count_queries('/api/visualizations/')
+        self.assertEqual(len(result), 22)
+        self.assertEqual(few_queries, many_queries)
+        self.assertLessEqual(many_queries, 5)
+
+    def test_file_cursor_pagination(self):
+        """Test that following the cursors of a file listing returns every file once, in order"""
+        for i in range(7):
+            db.session.add(ExperimentFile(self.user_id, 10, 'file{}.txt'.format(i % 3), '/file{}.txt'.format(i), 'text/plain', 'ASCII text'))
+        db.session.commit()
+        files_query = ExperimentFile.query.filter_by(user_id=self.user_id)
+        expected = [f.id for f in files_query.order_by(ExperimentFile.name.asc(), ExperimentFile.id.asc())]
+
+        listed = []
+        cursor = ''
+        while cursor is not None:
+            files, cursor = paginate_by_cursor(files_query, ExperimentFile.name, ExperimentFile.id, cursor, 3, descending=False)
+            self.assertLessEqual(len(files), 3)
+            listed.extend(f.id for f in files)
+        self.assertEqual(listed, expected)
+
+    def test_file_cursor_pagination_without_sort_values(self):
+        """Test that rows without sort value are listed once, last in ascending and first in descending order"""
+        for i in range(7):
+            experiment_file = ExperimentFile(self.user_id, 10, 'file{}.txt'.format(i), '/file{}.txt'.format(i), 'text/plain', 'ASCII text')
+            db.session.add(experiment_file)
+            db.session.flush()
+            if i % 2:
+                experiment_file.updated_at = None
+        db.session.commit()
+        files_query = ExperimentFile.query.filter_by(user_id=self.user_id)
+        all_ids = set(f.id for f in files_query)
+
+        for descending in (False, True):
+            listed = []
+            cursor = ''
+            while cursor is not None:
+                files, cursor = paginate_by_cursor(files_query, ExperimentFile.updated_at, ExperimentFile.id, cursor, 2, descending=descending)
+                listed.extend(files)
+            self.assertEqual(sorted(f.id for f in listed), sorted(all_ids))
+            without_value = [f.updated_at is None for f in listed]
+            self.assertEqual(without_value, sorted(without_value, reverse=descending))
+
+    def test_invalid_cursors(self):
+        """Test that forged cursors are rejected instead of reaching the database"""
+        files_query = ExperimentFile.query.filter_by(user_id=self.user_id)
+        for cursor in ('not-base64!', encode_cursor(['yesterday', 1]), encode_cursor(['2016-07-01T00:00:00', 'abc']),
+                       encode_cursor([1, 1]), encode_cursor(['2016-07-01T00:00:00'])):
+            with self.assertRaises(BadRequest):
+                paginate_by_cursor(files_query, ExperimentFile.updated_at, ExperimentFile.id, cursor, 2)
+
+    def test_file_filters(self):
+        """Test the operators of the where argument and the rejection of columns not meant for filtering"""
+        # file formats are taken from the magic descriptions, or the extension of unknown ones
+        for name, file_format_full, size in (('sample_1.bam', 'SAMtools BAM (BGZF-compressed)', 100), ('sample_2.sam', 'SAMtools SAM', 200),
+                                             ('sampleX.bed', 'BED file', 300)):
+            db.session.add(ExperimentFile(self.user_id, size, name, '/' + name, 'text/plain', file_format_full))
+        db.session.commit()
+        files_query = ExperimentFile.query.filter_by(user_id=self.user_id)
+
+        def names(where):
+            filtered_query = create_filter(files_query, ExperimentFile, json.dumps(where))
+            return [f.name for f in create_sorting(filtered_query, ExperimentFile, 'size_in_bytes', 'asc')]
+
+        self.assertEqual(names({'file_format': {'$in': ['bam', 'bed']}}), ['sample_1.bam', 'sampleX.bed'])
+        self.assertEqual(names({'size_in_bytes': {'$gt': 100, '$lt': 300}}), ['sample_2.sam'])
+        # the underscore is matched literally, not as a wildcard
+        self.assertEqual(names({'name': {'$prefix': 'sample_'}}), ['sample_1.bam', 'sample_2.sam'])
+        self.assertEqual(names({'name': {'$contains': 'X.B'}}), ['sampleX.bed'])
+        self.assertEqual(names({'file_format': 'sam'}), ['sample_2.sam'])
+        self.assertEqual(names({'created_at': {'$gt': '2000-01-01T00:00:00'}}), ['sample_1.bam', 'sample_2.sam', 'sampleX.bed'])
+        with self.assertRaises(BadRequest):
+            names({'user_id': 1})
+        with self.assertRaises(BadRequest):
+            names({'name': {'$regex': '.*'}})
+        # values not matching the column type are rejected before reaching the database
+        for where in ({'size_in_bytes': {'$gt': 'x'}}, {'id': 'abc'}, {'created_at': {'$lt': 'garbage'}}, {'is_upload': 1}):
+            with self.assertRaises(BadRequest):
+                names(where)
+        with self.assertRaises(BadRequest):
+            create_sorting(files_query, ExperimentFile, 'path', 'asc')
+
+    def test_file_search(self):
+        """Test that searched files match by words or substrings, best matches first"""
+        for name in ('hippocampus_rep1.bam', 'cortex_rep1.bam', 'hippocampus.bed', 'notes.txt'):
+            db.session.add(ExperimentFile(self.user_id, 10, name, '/' + name, 'text/plain', None))
+        db.session.commit()
+        files_query = ExperimentFile.query.filter_by(user_id=self.user_id)
+
+        def names(search_string):
+            return [f.name for f in search_query(files_query, ExperimentFile.search_vector,
+                                                 [ExperimentFile.name, ExperimentFile.display_name], ExperimentFile.id, search_string)]
+
+        self.assertEqual(names('hippocampus.bed')[0], 'hippocampus.bed')
+        self.assertEqual(set(names('hippo')), {'hippocampus_rep1.bam', 'hippocampus.bed'})
+        self.assertEqual(set(names('rep1')), {'hippocampus_rep1.bam', 'cortex_rep1.bam'})
+        self.assertEqual(names('..'), [])
+        self.assertEqual(autocomplete(files_query, ExperimentFile.name, 'HIPPO'), ['hippocampus.bed', 'hippocampus_rep1.bam'])
+
+    def test_search_endpoints(self):
+        """Test the q argument of the file listing and the autocompletion of the user's file and collection names"""
+        other_user = User('other-user', 'Other User', 'other@example.com')
+        db.session.add(other_user)
+        db.session.commit()
+        for user_id, name in ((self.user_id, 'hippocampus_rep1.bam'), (self.user_id, 'cortex_rep1.bam'), (other_user.id, 'hippocampus_other.bam')):
+            db.session.add(ExperimentFile(user_id, 10, name, '/' + name, 'text/plain', None))
+        db.session.add(Collection(self.user_id, 'hippocampus samples', None))
+        db.session.commit()
+
+        response = self.client.get('/api/files/?q=hippo', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f['name'] for f in json.loads(response.data.decode('utf-8'))], ['hippocampus_rep1.bam'])
+        response = self.client.get('/api/autocomplete/?q=HIP', headers=self.headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8')), ['hippocampus_rep1.bam'])
+        response = self.client.get('/api/autocomplete/?q=hip&kind=collections', headers=self.headers)
+        self.assertEqual(json.loads(response.data.decode('utf-8')), ['hippocampus samples'])
+        response = self.client.get('/api/files/?q=hippo&cursor=', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_collection_membership(self):
+        """Test that files are added to a collection once, and only files and collections of the user"""
+        other_user = User('other-user', 'Other User', 'other@example.com')
+        db.session.add(other_user)
+        db.session.commit()
+        own_files = [ExperimentFile(self.user_id, 10, 'own{}.txt'.format(i), '/own{}.txt'.format(i), 'text/plain', None) for i in range(3)]
+        other_file = ExperimentFile(other_user.id, 10, 'other.txt', '/other.txt', 'text/plain', None)
+        collection = Collection(self.user_id, 'collection', None)
+        db.session.add_all(own_files + [other_file, collection])
+        db.session.commit()
+        own_ids = [f.id for f in own_files]
+
+        self.assertEqual(add_files('collections_to_files', collection.id, self.user_id, own_ids[:2] + [other_file.id]), 2)
+        # already added files are skipped
+        self.assertEqual(add_files('collections_to_files', collection.id, self.user_id, own_ids), 1)
+        # the collection isn't the other user's
+        self.assertEqual(add_files('collections_to_files', collection.id, other_user.id, [other_file.id]), 0)
+        self.assertEqual(sorted(f.id for f in collection.files), own_ids)
+
+        self.assertEqual(remove_files('collections_to_files', collection.id, other_user.id, own_ids), 0)
+        self.assertEqual(remove_files('collections_to_files', collection.id, self.user_id, own_ids[1:]), 2)
+        db.session.commit()
+        self.assertEqual([f.id for f in collection.files], own_ids[:1])
+
+    def test_membership_endpoints(self):
+        """Test adding and removing files of collections and the databox in bulk"""
+        other_user = User('other-user', 'Other User', 'other@example.com')
+        db.session.add(other_user)
+        db.session.commit()
+        own_files = [ExperimentFile(self.user_id, 10, 'own{}.txt'.format(i), '/own{}.txt'.format(i), 'text/plain', None) for i in range(3)]
+        other_file = ExperimentFile(other_user.id, 10, 'other.txt', '/other.txt', 'text/plain', None)
+        collection = Collection(self.user_id, 'collection', None)
+        other_collection = Collection(other_user.id, 'other collection', None)
+        db.session.add_all(own_files + [other_file, collection, other_collection, DataBox(self.user_id)])
+        db.session.commit()
+        own_ids = [f.id for f in own_files]
+        collection_files = '/api/collections/{}/files/'.format(collection.id)
+
+        def request(method, path, **kwargs):
+            response = method(path, headers=self.headers, **kwargs)
+            return response.status_code, json.loads(response.data.decode('utf-8'))
+
+        file_ids = json.dumps({'fileIds': own_ids + [other_file.id]})
+        self.assertEqual(request(self.client.post, collection_files, data=file_ids, content_type='application/json'), (200, {'added': 3}))
+        self.assertEqual(request(self.client.post, collection_files, data=file_ids, content_type='application/json'), (200, {'added': 0}))
+        self.assertEqual(request(self.client.post, '/api/collections/{}/files/'.format(other_collection.id), data=file_ids,
+                                 content_type='application/json')[0], 403)
+        self.assertEqual(request(self.client.delete, collection_files, data=json.dumps({'fileIds': own_ids[1:]}),
+                                 content_type='application/json'), (200, {'removed': 2}))
+        status, listed = request(self.client.get, collection_files)
+        self.assertEqual([f['id'] for f in listed], own_ids[:1])
+
+        self.assertEqual(request(self.client.post, '/api/databox/files/', data={'fileIds[]': own_ids + [other_file.id]}), (200, {'added': 3}))
+        self.assertEqual(request(self.client.delete, '/api/databox/files/', data={'fileIds[]': own_ids[:2]}), (200, {'removed': 2}))
+
+        self.app.config['MEMBERSHIP_MAX_IDS'] = 2
+        self.assertEqual(request(self.client.post, collection_files, data=file_ids, content_type='application/json')[0], 400)
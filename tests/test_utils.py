@@ -0,0 +1,133 @@
+import os, tempfile, unittest
+from server.utils import parse_content_range, merge_byte_range, byte_ranges_cover, write_file_at_offset, \
+    hash_file_blocks, combine_block_digests, block_checksum, parse_range_header, iter_file_range, OpenFileCache, \
+    read_file_tail, escape_like
+
+
+class ByteRangesTestCase(unittest.TestCase):
+
+    def test_parse_content_range(self):
+        """Test parsing of Content-Range header values"""
+        self.assertEqual(parse_content_range('bytes 0-1023/4096'), (0, 1023, 4096))
+        self.assertEqual(parse_content_range('bytes 4095-4095/4096'), (4095, 4095, 4096))
+        with self.assertRaises(ValueError):
+            parse_content_range('bytes 0-4096/4096')
+        with self.assertRaises(ValueError):
+            parse_content_range('bytes 10-5/4096')
+        with self.assertRaises(ValueError):
+            parse_content_range('items 0-1/2')
+
+    def test_merge_byte_range(self):
+        """Test merging of received byte ranges arriving out of order"""
+        ranges = merge_byte_range([], 100, 199)
+        self.assertEqual(ranges, [[100, 199]])
+        ranges = merge_byte_range(ranges, 300, 399)
+        self.assertEqual(ranges, [[100, 199], [300, 399]])
+        # adjacent range joins both neighbours
+        ranges = merge_byte_range(ranges, 200, 299)
+        self.assertEqual(ranges, [[100, 399]])
+        # retried chunk does not change anything
+        ranges = merge_byte_range(ranges, 100, 199)
+        self.assertEqual(ranges, [[100, 399]])
+
+    def test_byte_ranges_cover(self):
+        """Test detection of completely received files"""
+        self.assertFalse(byte_ranges_cover([[100, 399]], 400))
+        self.assertFalse(byte_ranges_cover([[0, 99], [200, 399]], 400))
+        self.assertTrue(byte_ranges_cover([[0, 399]], 400))
+        self.assertTrue(byte_ranges_cover([], 0))
+
+    def test_write_file_at_offset(self):
+        """Test writing chunks out of order into the same file"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dest_file = os.path.join(tmp_dir, 'dest')
+            chunks = [(4, b'5678'), (0, b'1234'), (8, b'90')]
+            for offset, data in chunks:
+                chunk_file = os.path.join(tmp_dir, 'chunk{}'.format(offset))
+                with open(chunk_file, 'wb') as f:
+                    f.write(data)
+                write_file_at_offset(dest_file, chunk_file, offset)
+            with open(dest_file, 'rb') as f:
+                self.assertEqual(f.read(), b'1234567890')
+
+
+class RangeRequestsTestCase(unittest.TestCase):
+
+    def test_parse_range_header(self):
+        """Test parsing of Range header values"""
+        self.assertEqual(parse_range_header('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse_range_header('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse_range_header('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_range_header('bytes=990-2000', 1000), [(990, 999)])
+        self.assertEqual(parse_range_header('bytes=0-0, 10-19', 1000), [(0, 0), (10, 19)])
+        # not satisfiable
+        self.assertEqual(parse_range_header('bytes=1000-1100', 1000), [])
+        # malformed
+        for range_header in ('bytes=10-5', 'items=0-1', 'bytes=', 'bytes=a-b', 'bytes=5'):
+            with self.assertRaises(ValueError):
+                parse_range_header(range_header, 1000)
+
+    def test_read_ranges_from_cached_file(self):
+        """Test reading ranges through cached file descriptors"""
+        cache = OpenFileCache(max_size=1)
+        with tempfile.NamedTemporaryFile() as f1, tempfile.NamedTemporaryFile() as f2:
+            f1.write(b'0123456789')
+            f1.flush()
+            f2.write(b'abcdefghij')
+            f2.flush()
+            entry = cache.acquire(f1.name)
+            self.assertEqual(entry.size, 10)
+            self.assertEqual(b''.join(iter_file_range(entry.fd, 2, 8, buffer_size=3)), b'2345678')
+            # evicting an entry in use keeps its descriptor open until released
+            other_entry = cache.acquire(f2.name)
+            self.assertEqual(b''.join(iter_file_range(entry.fd, 0, 1)), b'01')
+            cache.release(entry)
+            with self.assertRaises(OSError):
+                os.fstat(entry.fd)
+            self.assertEqual(b''.join(iter_file_range(other_entry.fd, 9, 9)), b'j')
+            cache.release(other_entry)
+
+
+class BlockChecksumTestCase(unittest.TestCase):
+
+    def test_block_checksum_matches_block_digests(self):
+        """Test that hashing blocks in any order gives the same checksum as hashing the whole file"""
+        block_size = 1024
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(os.urandom(block_size * 3 + 100))
+            f.flush()
+            size = os.path.getsize(f.name)
+            digests = hash_file_blocks(f.name, [3, 1], block_size, size)
+            digests.update(hash_file_blocks(f.name, [0, 2], block_size, size))
+            checksum = combine_block_digests([digests[i] for i in sorted(digests)])
+            self.assertEqual(checksum, block_checksum(f.name, block_size))
+
+    def test_block_checksum_empty_file(self):
+        """Test checksum of an empty file"""
+        with tempfile.NamedTemporaryFile() as f:
+            self.assertEqual(block_checksum(f.name, 1024), combine_block_digests([]))
+
+
+class LogTailTestCase(unittest.TestCase):
+
+    def test_read_file_tail(self):
+        """Test reading a growing log file by byte offset without splitting lines"""
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'first line\nsecond line\nthird')
+            f.flush()
+            self.assertEqual(read_file_tail(f.name, 0, 1024), (b'first line\nsecond line\nthird', 28))
+            # data cut at max_bytes ends after the last complete line
+            self.assertEqual(read_file_tail(f.name, 0, 15), (b'first line\n', 11))
+            self.assertEqual(read_file_tail(f.name, 11, 1024), (b'second line\nthird', 28))
+            self.assertEqual(read_file_tail(f.name, 28, 1024), (b'', 28))
+        self.assertEqual(read_file_tail(f.name, 5, 1024), (b'', 5))
+
+
+class EscapeLikeTestCase(unittest.TestCase):
+
+    def test_escape_like(self):
+        """Test that LIKE wildcards and the escape character are matched literally"""
+        self.assertEqual(escape_like('sample_1'), 'sample\\_1')
+        self.assertEqual(escape_like('100%'), '100\\%')
+        self.assertEqual(escape_like('a\\b'), 'a\\\\b')
+        self.assertEqual(escape_like('a!_b', escape='!'), 'a!!!_b')